@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+多本书批量转换
+扫描data目录下的PDF，多本书同时转换：豆包转换器共用同一份API并发与限速额度，
+OCR进程和排版进程在CPU进程额度内分配；按优先级、剩余页数从少到多调度，
+小书不必排在上千页的大书之后，每本书都从已有的JSON继续。
+每本书在独立的（spawn方式启动的）进程中转换，PyMuPDF不会被多个线程同时调用；
+API额度由一个管理进程托管，各书的限流器通过代理共用
+"""
+
+import heapq
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import BaseManager, DictProxy
+
+import pymupdf as fitz
+
+from book_pages import PAGE_DONE, BookPages, page_status
+from doubao_ocr_converter import DoubaoOCRConverter
+from lazy_book_pages import LazyBookPages
+from page_journal import PageJournal
+from page_store import PageStore
+from pdf_ocr_converter import PDFOCRConverter
+from rate_limit import AIMDController, RateLimiter, RetryPolicy, TokenBucket
+
+ENGINE_DOUBAO = "doubao"
+ENGINE_TESSERACT = "tesseract"
+
+# 书籍目录下由转换过程生成的子目录，扫描PDF时跳过；以.开头的目录（缓存、索引、基准测试）也一律跳过
+_GENERATED_DIRS = {"json", "pdf_imgs", "pdf_shards"}
+
+
+class _BudgetManager(BaseManager):
+    """托管所有书共用的令牌桶和并发控制器，各书进程通过代理取用额度；dict记录每本书所在的进程号"""
+
+
+_BudgetManager.register("TokenBucket", TokenBucket)
+_BudgetManager.register("AIMDController", AIMDController)
+_BudgetManager.register("dict", dict, DictProxy)
+
+
+def discover_pdfs(root="data", recursive=True):
+    """返回root下所有待转换的PDF路径，跳过转换过程生成的目录"""
+    pdf_paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames if d not in _GENERATED_DIRS and not d.startswith(".")
+        ) if recursive else []
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".pdf"):
+                pdf_paths.append(os.path.join(dirpath, filename))
+    return pdf_paths
+
+
+def remaining_pages(pdf_path, engine=ENGINE_DOUBAO):
+    """
+    估计一本书还需识别的页数，用于调度
+
+    豆包转换器按 data/{pdf_name}/json/ 下已有的页存储（没有时按JSON）和日志计算，不创建转换器；
+    Tesseract转换器没有续跑数据（结果在OCR缓存中），按总页数计算
+    Returns:
+        (总页数, 待识别页数)
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+    if engine != ENGINE_DOUBAO:
+        return page_count, page_count
+
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    json_dir = f"data/{pdf_name}/json"
+    book_data_path = os.path.join(json_dir, f"{pdf_name}_book_data.json")
+    store_path = os.path.join(json_dir, f"{pdf_name}_pages.db")
+    if os.path.exists(store_path):
+        # 页存储是主存储，只读取各页状态，不读取页文字
+        store = PageStore(store_path)
+        try:
+            statuses = store.statuses()
+        finally:
+            store.close()
+    else:
+        try:
+            # 只读取旁路索引中的页状态，不解析整本书的JSON
+            book_pages = LazyBookPages(book_data_path)
+        except ValueError:
+            book_pages = BookPages()
+        statuses = {page_index: book_pages.status(page_index) for page_index in book_pages.page_indexes()}
+    # 日志中的页（未启用页存储时写入，或尚未并入页存储）优先
+    journal = PageJournal(os.path.join(json_dir, f"{pdf_name}_book_data.journal.jsonl"))
+    for page_data in journal.read():
+        statuses[int(page_data["page_index"])] = page_status(page_data)
+    pending = sum(1 for page_index in range(1, page_count + 1) if statuses.get(page_index) != PAGE_DONE)
+    return page_count, pending
+
+
+class BookJob:
+    """批量转换中的一本书"""
+
+    def __init__(self, pdf_path, engine=ENGINE_DOUBAO, priority=0, options=None):
+        """
+        Args:
+            pdf_path: PDF路径
+            engine: doubao / tesseract
+            priority: 优先级，数值大的先转换
+            options: 传给转换器构造函数的额外参数
+        """
+        if engine not in (ENGINE_DOUBAO, ENGINE_TESSERACT):
+            raise ValueError(f"不支持的转换引擎：{engine}")
+        self.pdf_path = pdf_path
+        self.engine = engine
+        self.priority = priority
+        self.options = options or {}
+        self.page_count = None
+        self.pending = None
+        self.status = "queued"
+        self.error = None
+        self.seconds = 0.0
+
+    def sort_key(self):
+        """优先级高的先做，同优先级剩余页数少的先做"""
+        return -self.priority, self.pending, self.pdf_path
+
+
+def _convert_book(engine, pdf_path, api_key, options, book_pids=None):
+    """在书籍进程中创建转换器并执行转换，返回(状态, 错误信息, 耗时秒数)；开始时把进程号记入book_pids"""
+    start = time.time()
+    if book_pids is not None:
+        book_pids[pdf_path] = os.getpid()
+    try:
+        if engine == ENGINE_TESSERACT:
+            PDFOCRConverter(pdf_path, **options).convert()
+        else:
+            DoubaoOCRConverter(api_key, pdf_path, **options).convert()
+        return "done", None, time.time() - start
+    except Exception as e:
+        print(f"《{pdf_path}》转换失败：{e}")
+        traceback.print_exc()
+        return "failed", str(e), time.time() - start
+
+
+class BatchRunner:
+    """在共享的API并发和CPU额度下同时转换多本书"""
+
+    def __init__(self, api_key=None, endpoint=None, max_books=4, api_concurrency=8, requests_per_second=None,
+                 cpu_budget=None, converter_options=None):
+        """
+        Args:
+            api_key: 豆包API密钥，只有tesseract任务时可为None
+            endpoint: 豆包API端点
+            max_books: 同时转换的书数
+            api_concurrency: 所有豆包任务合计同时进行的API请求数上限
+            requests_per_second: 所有豆包任务合计每秒请求数上限，None表示不限速
+            cpu_budget: 所有任务合计的OCR/排版进程数，默认CPU核数
+            converter_options: 传给每个DoubaoOCRConverter的公共参数
+        """
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.max_books = max(1, int(max_books))
+        self.api_concurrency = max(1, int(api_concurrency))
+        self.requests_per_second = requests_per_second
+        self.cpu_budget = max(1, int(cpu_budget or os.cpu_count() or 1))
+        self.converter_options = converter_options or {}
+        self.jobs = []
+
+    def add(self, pdf_path, engine=ENGINE_DOUBAO, priority=0, **options):
+        """加入一本书"""
+        job = BookJob(pdf_path, engine, priority, options)
+        self.jobs.append(job)
+        return job
+
+    def add_directory(self, root="data", engine=ENGINE_DOUBAO, priority=0, recursive=True, **options):
+        """加入root下的所有PDF，返回加入的任务数"""
+        pdf_paths = discover_pdfs(root, recursive)
+        for pdf_path in pdf_paths:
+            self.add(pdf_path, engine, priority, **options)
+        print(f"在{root}下找到{len(pdf_paths)}个PDF")
+        return len(pdf_paths)
+
+    def _processes_per_book(self):
+        """每本书的OCR/排版进程数：CPU额度在同时进行的书之间平分"""
+        return max(1, self.cpu_budget // self.max_books)
+
+    def _converter_options(self, job, bucket, controller):
+        if job.engine == ENGINE_TESSERACT:
+            return {"processes": self._processes_per_book(), **job.options}
+
+        options = {**self.converter_options, **job.options}
+        retry_policy = RetryPolicy(max_retries=options["max_retries"]) if "max_retries" in options else None
+        return {
+            "endpoint": self.endpoint,
+            # 工作线程数按整份API额度设置，实际并发由共用的限流器控制：
+            # 同时进行的书越少，每本书能用到的额度越多，只剩一本大书时它可以用满全部额度
+            "max_workers": self.api_concurrency,
+            # 每本书各自的重试策略，额度共用
+            "rate_limiter": RateLimiter(self.api_concurrency, retry_policy=retry_policy,
+                                        bucket=bucket, controller=controller),
+            "compose_processes": self._processes_per_book(),
+            **options,
+        }
+
+    def _finish_job(self, job, future, controller, book_pids):
+        """
+        记录一本书的结果；返回False表示该书因进程池损坏而未能开始，需要重新排队
+
+        书籍进程异常退出（例如被系统杀掉）时，收回它占用而来不及归还的API并发名额
+        """
+        try:
+            job.status, job.error, job.seconds = future.result()
+            return True
+        except BrokenProcessPool as e:
+            pid = book_pids.get(job.pdf_path)
+            if pid is None:
+                return False
+            released = controller.release_owner(pid)
+            if released:
+                print(f"收回《{job.pdf_path}》占用的{released}个API并发名额")
+            error = f"转换进程异常退出：{e}"
+        except Exception as e:
+            error = f"转换进程异常退出：{e}"
+        job.status = "failed"
+        job.error = error
+        print(f"《{job.pdf_path}》{job.error}")
+        return True
+
+    def run(self):
+        """转换所有书，直到全部完成，返回任务列表"""
+        heap = []
+        for seq, job in enumerate(self.jobs):
+            if job.status != "queued":
+                continue
+            try:
+                job.page_count, job.pending = remaining_pages(job.pdf_path, job.engine)
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"无法打开PDF：{e}"
+                print(f"跳过《{job.pdf_path}》：{job.error}")
+                continue
+            heapq.heappush(heap, (job.sort_key(), seq, job))
+
+        print(f"批量转换{len(heap)}本书，同时转换{self.max_books}本，"
+              f"API并发额度{self.api_concurrency}，CPU进程额度{self.cpu_budget}")
+        if not heap:
+            self.report()
+            return self.jobs
+
+        queued = [heapq.heappop(heap)[-1] for _ in range(len(heap))]
+        # spawn启动的进程不继承父进程的线程和锁，书籍进程内再创建进程池也是安全的
+        context = multiprocessing.get_context("spawn")
+        with _BudgetManager(ctx=context) as manager:
+            # 所有豆包任务共用的额度，AIMD对整个批次的过载信号统一做出反应
+            bucket = manager.TokenBucket(self.requests_per_second, self.api_concurrency)
+            controller = manager.AIMDController(self.api_concurrency)
+            book_pids = manager.dict()
+            while queued:
+                queued = self._run_pool(queued, context, bucket, controller, book_pids)
+
+        self.report()
+        return self.jobs
+
+    def _run_pool(self, jobs, context, bucket, controller, book_pids):
+        """
+        在一个进程池中按顺序转换jobs，返回需要重新排队的任务
+
+        某个书籍进程异常退出会使整个进程池损坏，尚未开始的书换一个新的进程池继续；
+        这一轮没有任何一本书开始时不再重试，以免无休止地重建进程池
+        """
+        requeue = []
+        with ProcessPoolExecutor(max_workers=min(self.max_books, len(jobs)), mp_context=context,
+                                 max_tasks_per_child=1) as executor:
+            futures = []
+            # 按调度顺序提交，进程池按提交顺序开始任务
+            for job in jobs:
+                print(f"排队转换《{job.pdf_path}》：共{job.page_count}页，待识别{job.pending}页")
+                futures.append((job, executor.submit(
+                    _convert_book, job.engine, job.pdf_path, self.api_key,
+                    self._converter_options(job, bucket, controller), book_pids,
+                )))
+            for job, future in futures:
+                if not self._finish_job(job, future, controller, book_pids):
+                    requeue.append(job)
+
+        if requeue and len(requeue) == len(jobs):
+            for job in requeue:
+                job.status = "failed"
+                job.error = "进程池无法启动书籍进程"
+            return []
+        return requeue
+
+    def report(self):
+        """打印每本书的转换结果"""
+        done = sum(1 for job in self.jobs if job.status == "done")
+        print(f"批量转换结束：成功{done}本，失败{len(self.jobs) - done}本")
+        for job in self.jobs:
+            line = f"  [{job.status}] {job.pdf_path}：{job.page_count}页，用时{job.seconds:.1f}秒"
+            if job.error:
+                line += f"，错误：{job.error}"
+            print(line)
+
+
+def main():
+    """主函数 - 转换data目录下的所有PDF"""
+    print("豆包OCR批量转换")
+    print("=" * 50)
+
+    # 用户需要在这里配置API信息
+    API_KEY = os.environ.get("ARK_API_KEY", "your_doubao_api_key_here")
+
+    if API_KEY == "your_doubao_api_key_here":
+        print("请先设置环境变量ARK_API_KEY")
+        return
+
+    runner = BatchRunner(API_KEY, max_books=4, api_concurrency=8)
+    runner.add_directory("data")
+    runner.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+离线基准测试
+在本地生成合成扫描PDF，DoubaoOCRConverter对接本地模拟OCR服务，PDFOCRConverter使用本机Tesseract，
+每个场景在独立的子进程和工作目录中运行，记录每秒页数、峰值内存和各阶段耗时，结果保存为JSON便于前后对比
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import pymupdf as fitz
+
+from mock_ocr_server import MockOCRServer
+from synthetic_pdf import TEXT_MIXED, generate_scanned_pdf
+
+ENGINE_DOUBAO = "doubao"
+ENGINE_TESSERACT = "tesseract"
+DEFAULT_RESULTS_DIR = "data/.benchmarks"
+
+# 默认场景：converter为传给转换器的参数，server为覆盖的模拟服务参数
+SCENARIOS = [
+    {"name": "doubao_serial", "engine": ENGINE_DOUBAO, "converter": {"max_workers": 1}},
+    {"name": "doubao_concurrent", "engine": ENGINE_DOUBAO, "converter": {"max_workers": 8}},
+    {"name": "doubao_batched", "engine": ENGINE_DOUBAO, "converter": {"max_workers": 4, "batch_size": 3}},
+    {"name": "doubao_sdk", "engine": ENGINE_DOUBAO, "converter": {"max_workers": 4, "use_sdk": True}},
+    {"name": "doubao_throttled", "engine": ENGINE_DOUBAO, "converter": {"max_workers": 8},
+     "server": {"max_concurrency": 3, "error_rate": 0.05, "retry_after": 0.2}},
+    {"name": "tesseract_serial", "engine": ENGINE_TESSERACT, "converter": {"processes": 1}},
+    {"name": "tesseract_parallel", "engine": ENGINE_TESSERACT, "converter": {"processes": None}},
+]
+
+
+def _peak_rss_mb():
+    """
+    当前进程与其已退出子进程（tesseract、OCR和排版进程池）的峰值常驻内存之和（MB），不支持的平台返回None
+
+    子进程部分取的是各子进程中的最大值，两者之和是同时驻留内存的上界
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux以KB为单位，macOS以字节为单位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def tesseract_available():
+    """本机是否安装了Tesseract，返回(是否可用, 版本或原因)"""
+    try:
+        import pytesseract
+        return True, str(pytesseract.get_tesseract_version())
+    except Exception as e:
+        return False, f"Tesseract不可用：{e}"
+
+
+def _run_scenario(conn, scenario, pdf_path, work_dir, server_info, verbose):
+    """子进程入口：在独立工作目录中转换一次，把统计结果发回主进程"""
+    result = {"name": scenario["name"], "engine": scenario["engine"]}
+    try:
+        os.chdir(work_dir)
+        if not verbose:
+            sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+        from run_metrics import RunMetrics
+
+        metrics = RunMetrics(name=scenario["name"])
+        options = dict(scenario.get("converter") or {})
+        if scenario["engine"] == ENGINE_DOUBAO:
+            from doubao_ocr_converter import DoubaoOCRConverter
+
+            options.setdefault("use_sdk", False)
+            converter = DoubaoOCRConverter(
+                "benchmark-key", pdf_path,
+                endpoint=server_info["endpoint"], sdk_base_url=server_info["base_url"],
+                use_cache=False, metrics=metrics, **options,
+            )
+        else:
+            from pdf_ocr_converter import PDFOCRConverter
+
+            converter = PDFOCRConverter(pdf_path, use_cache=False, metrics=metrics, **options)
+        converter.convert()
+
+        summary = metrics.summary()
+        result.update({
+            "pages": summary["pages"],
+            "wall_seconds": summary["wall_seconds"],
+            "pages_per_second": summary["pages_per_second"],
+            "peak_rss_mb": _peak_rss_mb(),
+            "stages": summary["stages"],
+            "counters": summary["counters"],
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    conn.send(result)
+    conn.close()
+
+
+def run_scenario(scenario, pdf_path, work_dir, server_options=None, verbose=False):
+    """
+    运行一个场景：需要时启动模拟服务，在spawn出的子进程中转换，峰值内存只计该场景自身
+
+    Returns:
+        场景结果字典，出错时含error字段
+    """
+    if scenario["engine"] == ENGINE_TESSERACT:
+        available, info = tesseract_available()
+        if not available:
+            return {"name": scenario["name"], "engine": scenario["engine"], "skipped": info}
+
+    result = {"name": scenario["name"], "engine": scenario["engine"]}
+    scenario_dir = os.path.join(work_dir, scenario["name"])
+    shutil.rmtree(scenario_dir, ignore_errors=True)
+    os.makedirs(scenario_dir)
+
+    server = None
+    server_info = {"endpoint": None, "base_url": None}
+    if scenario["engine"] == ENGINE_DOUBAO:
+        server = MockOCRServer(**{**(server_options or {}), **(scenario.get("server") or {})}).start()
+        server_info = {"endpoint": server.endpoint, "base_url": server.base_url}
+
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_run_scenario,
+                              args=(child_conn, scenario, os.path.abspath(pdf_path), scenario_dir, server_info,
+                                    verbose))
+        process.start()
+        child_conn.close()
+        try:
+            result = parent_conn.recv()
+        except EOFError:
+            result["error"] = "子进程异常退出"
+        process.join()
+    finally:
+        if server is not None:
+            result["server"] = server.stats()
+            server.stop()
+    return result
+
+
+def _environment():
+    """记录运行环境，便于判断两次结果是否可比"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pymupdf": fitz.VersionBind,
+        "git_commit": commit,
+    }
+
+
+def run_benchmark(scenarios=None, pages=20, page_size="A4", text_kind=TEXT_MIXED, chars_per_page=600, dpi=200,
+                  seed=0, server_options=None, results_dir=DEFAULT_RESULTS_DIR, work_dir=None, verbose=False):
+    """
+    生成合成PDF并依次运行各场景，结果写入results_dir下的JSON文件
+
+    Args:
+        scenarios: 场景列表，默认SCENARIOS
+        pages / page_size / text_kind / chars_per_page / dpi / seed: 合成PDF的参数
+        server_options: 模拟OCR服务的公共参数
+        results_dir: 结果JSON的目录
+        work_dir: 合成PDF和各场景输出的目录，默认临时目录，结束后删除
+        verbose: 是否显示转换器的输出
+    Returns:
+        (结果字典, 结果文件路径)
+    """
+    scenarios = scenarios or SCENARIOS
+    own_work_dir = work_dir is None
+    work_dir = os.path.abspath(work_dir or tempfile.mkdtemp(prefix="book_pavilion_bench_"))
+    os.makedirs(work_dir, exist_ok=True)
+    params = {
+        "pages": pages, "page_size": page_size, "text_kind": text_kind,
+        "chars_per_page": chars_per_page, "dpi": dpi, "seed": seed,
+        "server": server_options or {},
+    }
+    try:
+        pdf_path = os.path.join(work_dir, f"bench_{text_kind}_{pages}p_{seed}.pdf")
+        generate_scanned_pdf(pdf_path, pages=pages, page_size=page_size, text_kind=text_kind,
+                             chars_per_page=chars_per_page, dpi=dpi, seed=seed)
+        params["pdf_bytes"] = os.path.getsize(pdf_path)
+
+        results = []
+        for scenario in scenarios:
+            print(f"运行场景 {scenario['name']} ...")
+            result = run_scenario(scenario, pdf_path, work_dir, server_options, verbose)
+            results.append(result)
+            _print_result(result)
+    finally:
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": _environment(),
+        "params": params,
+        "scenarios": results,
+    }
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"benchmark_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"基准测试结果已保存到: {path}")
+    return report, path
+
+
+def _print_result(result):
+    if "skipped" in result:
+        print(f"  跳过：{result['skipped']}")
+        return
+    if "error" in result:
+        print(f"  出错：{result['error']}")
+        return
+    rss = result["peak_rss_mb"]
+    rss_text = f"，峰值内存{rss:.0f}MB" if rss is not None else ""
+    print(f"  {result['pages']}页，{result['wall_seconds']:.2f}秒，每秒{result['pages_per_second']:.2f}页{rss_text}")
+    slowest = sorted(result["stages"].items(), key=lambda kv: -kv[1]["total_seconds"])[:4]
+    for stage, stats in slowest:
+        print(f"    {stage}: 合计{stats['total_seconds']:.2f}秒，p50 {stats['p50'] * 1000:.1f}ms，"
+              f"p95 {stats['p95'] * 1000:.1f}ms")
+
+
+def compare_results(baseline_path, current_path):
+    """对比两次结果中同名场景的每秒页数和峰值内存，返回[(场景, 基准页/秒, 当前页/秒, 变化比例)]"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {r["name"]: r for r in json.load(f)["scenarios"]}
+    with open(current_path, 'r', encoding='utf-8') as f:
+        current = {r["name"]: r for r in json.load(f)["scenarios"]}
+
+    rows = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if not before or "pages_per_second" not in before or "pages_per_second" not in result:
+            continue
+        old, new = before["pages_per_second"], result["pages_per_second"]
+        change = (new - old) / old if old else 0.0
+        rows.append((name, old, new, change))
+        rss = ""
+        if before.get("peak_rss_mb") and result.get("peak_rss_mb"):
+            rss = f"，峰值内存 {before['peak_rss_mb']:.0f}MB -> {result['peak_rss_mb']:.0f}MB"
+        print(f"{name}: {old:.2f} -> {new:.2f} 页/秒（{change:+.1%}）{rss}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试：合成扫描PDF + 本地模拟OCR服务 / 本机Tesseract")
+    parser.add_argument("--pages", type=int, default=20, help="合成PDF的页数")
+    parser.add_argument("--page-size", default="A4", help="页面尺寸：A4 / A5 / B5 / letter")
+    parser.add_argument("--text", default=TEXT_MIXED, choices=["cjk", "latin", "mixed"], help="文字类型")
+    parser.add_argument("--chars", type=int, default=600, help="每页字数")
+    parser.add_argument("--dpi", type=int, default=200, help="合成页面的分辨率")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--latency", type=float, default=0.3, help="模拟服务的基础延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务返回5xx的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="模拟服务随机返回429的概率")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="模拟服务的并发上限，超出返回429")
+    parser.add_argument("--scenario", action="append", help="只运行指定名称的场景，可重复")
+    parser.add_argument("--results-dir", default=DEFAULT_RESULTS_DIR, help="结果JSON的目录")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="与之前的结果对比")
+    parser.add_argument("--verbose", action="store_true", help="显示转换器的输出")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.scenario:
+        scenarios = [s for s in SCENARIOS if s["name"] in args.scenario]
+        if not scenarios:
+            parser.error(f"没有名为{args.scenario}的场景，可选：{[s['name'] for s in SCENARIOS]}")
+    server_options = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "max_concurrency": args.max_concurrency,
+    }
+    _, path = run_benchmark(scenarios, pages=args.pages, page_size=args.page_size, text_kind=args.text,
+                            chars_per_page=args.chars, dpi=args.dpi, seed=args.seed,
+                            server_options=server_options, results_dir=args.results_dir, verbose=args.verbose)
+    if args.compare:
+        compare_results(args.compare, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+以页码为键的书籍数据
+续跑时判断某页是否已识别只需一次字典查找，不再线性扫描整本书
+"""
+
+# 页状态
+PAGE_DONE = "done"
+PAGE_FAILED = "failed"
+PAGE_MISSING = "missing"
+
+
+def page_status(page_data):
+    """根据已存储的页数据判断该页状态"""
+    if page_data is None:
+        return PAGE_MISSING
+    # 识别前已判定为空白的页，空文本即是结果
+    if page_data.get("blank"):
+        return PAGE_DONE
+    text = page_data.get("text")
+    if text is None or text == "" or text == "<UNK>":
+        return PAGE_FAILED
+    return PAGE_DONE
+
+
+class BookPages:
+    """按页码索引的页数据集合，迭代时按页码顺序返回page_data"""
+
+    def __init__(self, page_data_list=()):
+        self._pages = {}
+        for page_data in page_data_list:
+            self.upsert(page_data)
+
+    def upsert(self, page_data):
+        """新增或替换一页数据"""
+        self._pages[int(page_data["page_index"])] = page_data
+
+    def get(self, page_index):
+        """返回该页的数据，不存在时返回None"""
+        return self._pages.get(int(page_index))
+
+    def status(self, page_index):
+        """返回该页状态：done / failed / missing"""
+        return page_status(self.get(page_index))
+
+    def done_page(self, page_index):
+        """该页已成功识别时返回其数据，否则返回None"""
+        page_data = self.get(page_index)
+        if page_status(page_data) == PAGE_DONE:
+            return page_data
+        return None
+
+    def pending_pages(self, page_count):
+        """返回1..page_count中仍需处理（失败或缺失）的页码"""
+        return [
+            page_index for page_index in range(1, page_count + 1)
+            if self.status(page_index) != PAGE_DONE
+        ]
+
+    def status_counts(self, page_count):
+        """统计1..page_count中各状态的页数"""
+        counts = {PAGE_DONE: 0, PAGE_FAILED: 0, PAGE_MISSING: 0}
+        for page_index in range(1, page_count + 1):
+            counts[self.status(page_index)] += 1
+        return counts
+
+    def page_indexes(self):
+        """按顺序返回已有数据的页码"""
+        return sorted(self._pages)
+
+    def to_list(self):
+        """按页码顺序返回页数据列表"""
+        return [self.get(k) for k in self.page_indexes()]
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __contains__(self, page_index):
+        return int(page_index) in self._pages
@@ -44,6 +44,13 @@ def check_dependencies():
             results[dep] = False
             print(f"❌ {dep}")
     
+    try:
+        __import__('tesserocr')
+        print("✅ tesserocr")
+    except ImportError:
+        # 可选依赖，不影响检查结果
+        print("⚠️  tesserocr（可选）未安装，本地OCR将使用pytesseract，每页写临时图片并启动tesseract进程")
+    
     return all(results.values())
 
 
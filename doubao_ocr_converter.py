@@ -8,27 +8,91 @@
 """
 
 import os
+import re
 import sys
 import pymupdf as fitz
-import requests
-import json
+import httpx
 import base64
 from PIL import Image
 import tempfile
 import shutil
+import threading
 
 from numpy.f2py.auxfuncs import throw_error
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import time
+
+from book_pages import PAGE_FAILED, BookPages, page_status
+from image_encoding import char_accuracy, encode_image, pixmap_to_raw
+from incremental_pdf import IncrementalPDFWriter
+from lazy_book_pages import LazyBookPages
+from ocr_cache import OCRCache
+from ocr_pipeline import PipelineStage, StreamingPipeline
+from page_classifier import classify_pages
+from page_journal import PageJournal
+from page_screening import SCREEN_BLANK, SCREEN_DUPLICATE, PageScreener
+from page_store import PageStore, StoredBookPages
+from pdf_compose import compose_text_pdf
+from rate_limit import OCRCallError, RateLimiter, RetryPolicy, RetryQueue, error_from_status
+from render_policy import RenderPolicy
+from run_metrics import DISABLED
+from searchable_pdf import OUTPUT_MODES, OUTPUT_SEARCHABLE, OUTPUT_TEXT, write_searchable_pdf
+
+# OCR提示词与模型参数，同时参与OCR缓存键的计算
+OCR_PROMPT = "请识别这张图片中的所有文字，保持原始格式和段落结构。"
+OCR_MAX_TOKENS = 4000
+# 多页合并请求的输出token上限，不超过模型的输出上限（32k上下文中还要留给图片和提示词）
+BATCH_MAX_TOKENS = 12000
+SDK_MODEL_ID = "doubao-1-5-vision-pro-32k-250115"  # 请替换为实际的模型ID
+ENDPOINT_MODEL_ID = "doubao-ocr"
+
+# 多页合并为一次请求时使用的提示词，要求按分隔标记逐页输出
+BATCH_OCR_PROMPT = (
+    "下面依次给出{count}张书页图片。请分别识别每张图片中的所有文字，保持原始格式和段落结构。"
+    "每张图片的识别结果之前单独输出一行分隔标记 <<<PAGE n>>>，n为图片的序号（从1开始），不要输出其他说明。"
+)
+# 文字版PDF的排版参数，整本排版和边识别边输出共用；增大字体和行高以提高可读性
+TEXT_PDF_LAYOUT = {"font_size": 14, "line_height": 24}
+
+_PAGE_DELIMITER = re.compile(r"^\s*<<<PAGE\s+(\d+)>>>\s*$", re.MULTILINE)
+
+
+def _content_size(content):
+    """对话内容中文本和图片data URL的字节数，近似为请求体大小"""
+    size = 0
+    for part in content:
+        if part["type"] == "text":
+            size += len(part["text"].encode('utf-8'))
+        else:
+            size += len(part["image_url"]["url"])
+    return size
+
+
+def _split_batch_result(result, count):
+    """按分隔标记拆分批量识别结果，返回{图片序号: 文字}，缺失或重复的序号不在结果中"""
+    if not result:
+        return {}
+    matches = list(_PAGE_DELIMITER.finditer(result))
+    texts = {}
+    for i, match in enumerate(matches):
+        n = int(match.group(1))
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(result)
+        text = result[match.end():end].strip()
+        if 1 <= n <= count and text and n not in texts:
+            texts[n] = text
+    return texts
 
 
 class DoubaoOCRConverter:
     """豆包OCR转换器类"""
 
-    def __init__(self, api_key, input_pdf_path, endpoint=None, output_pdf_path=None):
+    def __init__(self, api_key, input_pdf_path, endpoint=None, output_pdf_path=None,
+                 max_workers=1, requests_per_second=None, queue_size=4, encode_workers=None, use_sdk=True,
+                 use_cache=True,
+                 pool_size=None, connect_timeout=10.0, read_timeout=60.0, sdk_timeout=20.0,
+                 image_format="jpeg", image_quality=80, max_long_edge=2400, grayscale=True,
+                 save_debug_images=False, render_policy=None, use_text_layer=True, screen_pages=True,
+                 batch_size=1, batch_max_tokens=BATCH_MAX_TOKENS, max_retries=4, rate_limiter=None, compose_processes=None,
+                 output_mode=OUTPUT_TEXT, incremental_output=False, output_window=16, search_index=None,
+                 vector_index=None, use_page_store=True, metrics=None, sdk_base_url=None):
         """
         初始化豆包OCR转换器
         
@@ -37,14 +101,102 @@ class DoubaoOCRConverter:
             endpoint: API端点URL
             input_pdf_path: 输入PDF文件路径
             output_pdf_path: 输出PDF文件路径
+            max_workers: 同时进行中的OCR请求数，1表示逐页串行识别
+            requests_per_second: 所有工作线程合计每秒最多发起的请求数，None表示不限速
+            queue_size: 流式管线各阶段之间队列的长度上限，决定同时驻留内存的页数
+            encode_workers: 图像编码阶段的工作线程数，None表示min(4, CPU核数)；渲染始终在单独的渲染线程中进行
+            use_sdk: True使用Ark SDK调用，False直接请求endpoint
+            use_cache: 是否启用跨书籍共享的OCR结果缓存
+            pool_size: HTTP连接池大小，默认不小于max_workers
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 直接请求endpoint时读取响应的超时时间（秒）
+            sdk_timeout: 通过Ark SDK调用时单次请求的超时时间（秒）
+            image_format: 发送给API的图像格式，png / jpeg / webp
+            image_quality: JPEG/WebP质量
+            max_long_edge: 发送图像的长边像素上限，None表示不缩放
+            grayscale: 是否以灰度渲染页面，"auto"表示仅在原图为黑白/灰度时灰度渲染
+            save_debug_images: 是否把渲染结果另存为PNG到pdf_imgs目录
+            render_policy: 自定义的RenderPolicy，为None时按216 DPI和像素预算逐页决定缩放倍数
+            use_text_layer: 有可用文字层的页直接提取文字，不调用OCR
+            screen_pages: OCR前筛查空白页和书内重复页，空白页记为空文本，重复页复用已识别的结果
+            batch_size: 每次请求携带的页数，大于1时多页合并为一次请求并按分隔标记拆分结果
+            batch_max_tokens: 合并请求的输出token上限，每页按单页的max_tokens计，batch_size超出时按上限缩小
+            max_retries: 遇到429/5xx/超时等可重试错误时的最大重试次数
+            rate_limiter: 共享的RateLimiter，多个转换器同时运行时共用同一份限流额度
+            compose_processes: 生成文字版PDF时的排版进程数，None表示CPU核数
+            output_mode: "text"重新排版为文字版PDF，"searchable"在原扫描页上叠加不可见文字层
+            incremental_output: 边识别边按页码顺序写出PDF，中途失败时磁盘上保留已完成的部分
+            output_window: 边识别边输出时已开始处理但尚未写出的最大页数
+            search_index: SearchIndex，识别完成的页同时加入全文索引
+            vector_index: VectorIndex，识别完成的页同时切块计算向量，供语义检索
+            use_page_store: 以 data/{pdf_name}/json/ 下的SQLite页存储为主存储，保存每页文字和发送给API的页图像，
+                续跑从页存储读取，_book_data.json 在压缩时由页存储导出；False时使用页日志和JSON
+            metrics: RunMetrics，记录各阶段耗时、发送字节数、token用量和重试次数，
+                转换结束后在 data/{pdf_name}/json/ 下写出JSON报告和Prometheus文本文件
+            sdk_base_url: Ark SDK的服务地址，None表示使用SDK默认地址（基准测试时指向本地模拟服务）
         """
         self.api_key = api_key
         self.endpoint = endpoint
         self.input_pdf_path = input_pdf_path
         self.output_pdf_path = self._generate_output_path()
         self.book_json_data_path = ""
-        self.book_json_data = []
+        self.book_json_data = BookPages()
+        # 本次运行中已确认存储过的页{页码: page_data}，与管线收集的是同一批对象，不另占内存
+        self._stored_pages = {}
+        self.page_journal = None
         self.base_name = self._generate_base_name()
+        self.max_workers = max(1, int(max_workers))
+        self.queue_size = queue_size
+        # JPEG/WebP编码在Pillow中会释放GIL，多个线程可以同时编码
+        self.encode_workers = max(1, int(encode_workers or min(4, os.cpu_count() or 1)))
+        self.use_sdk = use_sdk
+        self.prompt = OCR_PROMPT
+        self.max_tokens = OCR_MAX_TOKENS
+        self.ocr_cache = OCRCache() if use_cache else None
+
+        # 页图像直接在内存中编码，默认灰度JPEG
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.max_long_edge = max_long_edge
+        self.save_debug_images = save_debug_images
+        self.render_policy = render_policy or RenderPolicy(target_dpi=216, grayscale=grayscale)
+        self.use_text_layer = use_text_layer
+        self.screen_pages = screen_pages
+        self.page_screener = None
+        self.batch_max_tokens = batch_max_tokens
+        # 每页的输出额度与单页请求相同，一批的总额度不能超过上限，否则整批被拒后退回逐页请求
+        pages_per_request = max(1, batch_max_tokens // self.max_tokens)
+        if batch_size > pages_per_request:
+            print(f"每次请求{batch_size}页超出输出token上限{batch_max_tokens}，改为每次{pages_per_request}页")
+        self.batch_size = max(1, min(int(batch_size), pages_per_request))
+
+        # 令牌桶限速 + AIMD并发控制，429/5xx/超时时自动退避重试，仍失败的页进入重试队列
+        self.rate_limiter = rate_limiter or RateLimiter(
+            self.max_workers, requests_per_second, RetryPolicy(max_retries=max_retries)
+        )
+        self.retry_queue = None
+        self.compose_processes = compose_processes
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"不支持的输出方式：{output_mode}")
+        self.output_mode = output_mode
+        self.incremental_output = incremental_output
+        self.output_window = output_window
+        self._output_writer = None
+        self.search_index = search_index
+        self.vector_index = vector_index
+        self.use_page_store = use_page_store
+        self.page_store = None
+        self.metrics = metrics or DISABLED
+
+        # 长期持有的API客户端，所有页共享连接池，避免每页重新握手
+        self.pool_size = pool_size or max(self.max_workers, 4)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.sdk_timeout = sdk_timeout
+        self.sdk_base_url = sdk_base_url
+        self._http_client = None
+        self._ark_client = None
+        self._client_lock = threading.Lock()
 
         # 创建临时目录
         self.temp_dir = tempfile.mkdtemp()
@@ -68,118 +220,184 @@ class DoubaoOCRConverter:
         os.makedirs(base_name_dir, exist_ok=True)
         return base_name
 
-    def _encode_image_to_base64(self, image_path):
-        """将图像编码为base64"""
-        with open(image_path, 'rb') as img_file:
-            return base64.b64encode(img_file.read()).decode('utf-8')
-
     def _is_loaded_this_page(self, page_index):
-        if self.book_json_data.__sizeof__() == 0:
-            return None
+        """该页已成功识别时返回其page_data，否则返回None"""
+        return self.book_json_data.done_page(page_index)
 
-        for page_data in self.book_json_data:
-            if page_data['page_index'] == page_index:
-                page_data_text = page_data["text"]
-                if page_data_text != "" and page_data_text != "<UNK>" and page_data_text is not None:
-                    return page_data
-                else:
-                    return None
-        return None
+    def pending_pages(self):
+        """返回仍需识别（失败或缺失）的页码列表"""
+        doc = fitz.open(self.input_pdf_path)
+        page_count = len(doc)
+        doc.close()
+        return self.book_json_data.pending_pages(page_count)
 
+    def _new_http_client(self, headers=None):
+        """创建带keep-alive连接池的httpx客户端，安装了h2时启用HTTP/2"""
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            print("警告: 未安装h2，HTTP/2不可用，使用HTTP/1.1连接池")
+            http2 = False
+
+        return httpx.Client(
+            http2=http2,
+            headers=headers,
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+            ),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+        )
+
+    def _get_http_client(self):
+        """直接请求endpoint时使用的共享客户端"""
+        with self._client_lock:
+            if self._http_client is None:
+                self._http_client = self._new_http_client(headers=self.headers)
+            return self._http_client
+
+    def _get_ark_client(self):
+        """整个转换过程复用同一个Ark客户端及其连接池"""
+        with self._client_lock:
+            if self._ark_client is None:
+                # 导入Ark SDK
+                from volcenginesdkarkruntime import Ark
+
+                # 初始化Ark客户端
+                options = {"base_url": self.sdk_base_url} if self.sdk_base_url else {}
+                self._ark_client = Ark(
+                    api_key=self.api_key,
+                    timeout=httpx.Timeout(self.sdk_timeout, connect=self.connect_timeout),
+                    # 重试由rate_limiter统一负责，SDK自身不再重试
+                    max_retries=0,
+                    http_client=self._new_http_client(),
+                    **options,
+                )
+            return self._ark_client
+
+    def close(self):
+        """关闭API客户端的连接池和页存储"""
+        with self._client_lock:
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            if self._ark_client is not None:
+                self._ark_client.close()
+                self._ark_client = None
+        if self.page_store is not None:
+            self.page_store.close()
+            self.page_store = None
+
+    def _build_content(self, prompt, images):
+        """构造对话内容：一段提示词加若干张(base64, MIME)图片"""
+        content = [
+            {
+                "type": "text",
+                "text": prompt
+            }
+        ]
+        for image_base64, image_mime in images:
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{image_mime};base64,{image_base64}"
+                }
+            })
+        return content
 
-    def _call_doubao_ocr(self, image_base64):
+    def _call_doubao_ocr(self, image_base64, image_mime="image/png"):
         """调用豆包OCR API"""
+        content = self._build_content(self.prompt, [(image_base64, image_mime)])
+        return self._chat_completion_endpoint(content, self.max_tokens)
+
+    def _chat_completion_endpoint(self, content, max_tokens):
+        """直接请求endpoint发起一次对话，失败时按限流策略重试，最终失败返回None"""
+        self.metrics.add("api_calls")
+        try:
+            return self.rate_limiter.call(self._post_endpoint, content, max_tokens, on_retry=self._count_retry)
+        except OCRCallError as e:
+            self.metrics.add("api_failures")
+            print(f"API调用失败：{e}")
+            return None
+
+    def _count_retry(self, error):
+        self.metrics.add("api_retries")
+        if error.status is not None:
+            self.metrics.add(f"api_status_{error.status}")
+
+    def _post_endpoint(self, content, max_tokens):
+        """向endpoint发送一次请求，非200响应抛出OCRCallError"""
         payload = {
-            "model": "doubao-ocr",
+            "model": ENDPOINT_MODEL_ID,
             "messages": [
                 {
                     "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "请识别这张图片中的所有文字，保持原始格式和段落结构。"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}"
-                            }
-                        }
-                    ]
+                    "content": content
                 }
             ],
-            "max_tokens": 4000
+            "max_tokens": max_tokens
         }
 
-        try:
-            response = requests.post(
-                self.endpoint,
-                headers=self.headers,
-                json=payload,
-                timeout=60
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
-            else:
-                print(f"API调用失败：{response.status_code} - {response.text}")
-                return None
-
-        except Exception as e:
-            print(f"API调用异常：{str(e)}")
-            return None
-
-    def _call_doubao_ocr_use_sdk(self, image_base64):
+        self.metrics.add("api_requests")
+        with self.metrics.stage("api_request"):
+            response = self._get_http_client().post(self.endpoint, json=payload)
+        self.metrics.add("bytes_sent", len(response.request.content))
+        if response.status_code != 200:
+            raise error_from_status(response.status_code, response.text, response)
+        result = response.json()
+        usage = result.get('usage') or {}
+        self.metrics.add("prompt_tokens", usage.get('prompt_tokens', 0))
+        self.metrics.add("completion_tokens", usage.get('completion_tokens', 0))
+        return result['choices'][0]['message']['content']
+
+    def _call_doubao_ocr_use_sdk(self, image_base64, image_mime="image/png"):
         """使用Ark SDK调用豆包OCR API"""
+        content = self._build_content(self.prompt, [(image_base64, image_mime)])
+        return self._chat_completion_sdk(content, self.max_tokens)
+
+    def _chat_completion_sdk(self, content, max_tokens):
+        """通过Ark SDK发起一次对话，失败时按限流策略重试，最终失败返回None"""
+        self.metrics.add("api_calls")
         try:
-            # 导入Ark SDK
-            from volcenginesdkarkruntime import Ark
+            result = self.rate_limiter.call(self._create_sdk_completion, content, max_tokens,
+                                            on_retry=self._count_retry)
+        except OCRCallError as e:
+            self.metrics.add("api_failures")
+            print(f"SDK调用异常：{e}")
+            return None
+        print("OCR结果是：\n", result)
+        return result
 
-            # 使用模型ID（替换为实际的豆包OCR模型ID）
-            model = "doubao-1-5-vision-pro-32k-250115"  # 请替换为实际的模型ID
+    def _create_sdk_completion(self, content, max_tokens):
+        """通过Ark SDK发送一次请求，异常原样抛出由rate_limiter归类"""
+        # 使用模型ID（替换为实际的豆包OCR模型ID）
+        model = SDK_MODEL_ID
 
-            # 初始化Ark客户端
-            client = Ark(
-                api_key=self.api_key,
-            )
+        client = self._get_ark_client()
 
-            # 创建对话请求
+        # 创建对话请求
+        self.metrics.add("api_requests")
+        self.metrics.add("bytes_sent", _content_size(content))
+        with self.metrics.stage("api_request"):
             response = client.chat.completions.create(
                 model=model,
                 messages=[
                     {
                         "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "请识别这张图片中的所有文字，保持原始格式和段落结构。"
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{image_base64}"
-                                }
-                            }
-                        ]
+                        "content": content
                     }
                 ],
-                max_tokens=4000,
-                timeout=20.0  # 20秒的超时事件
+                max_tokens=max_tokens
             )
-            result = response.choices[0].message.content
-            print("OCR结果是：\n", result)
-            return result
-
-        except Exception as e:
-            print(f"SDK调用异常：{str(e)}")
-            return None
-
-    def _extract_images_from_pdf(self):
-        """从PDF中提取图像"""
-        doc = fitz.open(self.input_pdf_path)
-        image_paths = []
-
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.metrics.add("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+            self.metrics.add("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+        return response.choices[0].message.content
+
+    def _init_pdf_img_dir(self):
+        """创建并返回 data/{pdf_name}/pdf_imgs/{pdf_name}/ 图像目录"""
         # 创建pdf_imgs目录
         pdf_imgs_dir = f"data/{self.base_name}/pdf_imgs"
         os.makedirs(pdf_imgs_dir, exist_ok=True)
@@ -188,148 +406,112 @@ class DoubaoOCRConverter:
         pdf_basename = os.path.splitext(os.path.basename(self.input_pdf_path))[0]
         pdf_img_subdir = os.path.join(pdf_imgs_dir, pdf_basename)
         os.makedirs(pdf_img_subdir, exist_ok=True)
+        return pdf_img_subdir
 
-        print(f"正在处理PDF，共{len(doc)}页...")
-
-        for page_num in range(len(doc)):
-            page_index = page_num + 1
-
-            temp_page_data = self._is_loaded_this_page(page_index)
-            if temp_page_data is not None:
-                print(f"第{page_index}页的PDF 已经处理过了")
-                image_paths.append(temp_page_data["image_path"])
-                continue
-
-            page = doc[page_num]
-
-            # 设置高DPI以获得更好的OCR效果
-            mat = fitz.Matrix(3.0, 3.0)
-            pix = page.get_pixmap(matrix=mat)
+    def _render_page(self, page, page_index, pdf_img_subdir, save_image=True):
+        """渲染单页，返回(图像路径, 像素数据)；不保存PNG时图像路径为None"""
+        # 按页面尺寸决定分辨率，大幅面扫描页不会产生过大的pixmap
+        with self.metrics.stage("render", page_index):
+            pix = self.render_policy.render(page)
 
+        img_path = None
+        if save_image:
             # 保存图像到 data/pdf_imgs/{pdf_name}/ 目录
-            img_path = os.path.join(pdf_img_subdir, f"page_{page_num + 1}.png")
-            pix.save(img_path)
-            image_paths.append(img_path)
+            img_path = os.path.join(pdf_img_subdir, f"page_{page_index}.png")
+            with self.metrics.stage("png_save", page_index):
+                pix.save(img_path)
+            print(f"已提取第{page_index}页图像到: {img_path}")
+        else:
+            print(f"已渲染第{page_index}页图像")
+
+        return img_path, pixmap_to_raw(pix)
+
+    def _ocr_model(self):
+        """当前调用方式实际使用的模型ID"""
+        return SDK_MODEL_ID if self.use_sdk else ENDPOINT_MODEL_ID
+
+    def _chat_completion(self, content, max_tokens):
+        """按配置选择SDK或直接请求endpoint发起一次对话"""
+        if self.use_sdk:
+            return self._chat_completion_sdk(content, max_tokens)
+        return self._chat_completion_endpoint(content, max_tokens)
+
+    def _call_ocr(self, image_base64, image_mime="image/png"):
+        """按配置选择SDK或直接请求endpoint"""
+        if self.use_sdk:
+            return self._call_doubao_ocr_use_sdk(image_base64, image_mime)
+        return self._call_doubao_ocr(image_base64, image_mime)
+
+    def _cache_key(self, image_bytes):
+        """页图像对应的OCR缓存键"""
+        return OCRCache.make_key(image_bytes, self._ocr_model(), self.prompt, self.max_tokens)
+
+    def _iter_rendered_pages(self, should_stop=None):
+        """
+        管线的渲染阶段：逐页渲染并立即交给下游，已识别过的页直接带上page_data
 
-            print(f"已提取第{page_num + 1}页图像到: {img_path}")
+        Args:
+            should_stop: 边识别边输出时，等待输出窗口期间用于判断管线是否已出错
+        """
+        doc = fitz.open(self.input_pdf_path)
+        try:
+            pdf_img_subdir = self._init_pdf_img_dir()
+            print(f"正在处理PDF，共{len(doc)}页...")
+            counts = self.book_json_data.status_counts(len(doc))
+            print(f"已完成{counts['done']}页，失败{counts['failed']}页，未处理{counts['missing']}页")
+
+            # 先对待处理的页分类，有文字层的页直接提取，不必渲染和OCR
+            text_pages = {}
+            if self.use_text_layer:
+                text_pages = classify_pages(doc, self.book_json_data.pending_pages(len(doc)))
+
+            for page_num in range(len(doc)):
+                page_index = page_num + 1
+                # 边识别边输出时，在途页数受输出窗口限制；已就绪的页在这里由本线程写入输出PDF
+                if self._output_writer is not None and not self._output_writer.acquire_slot(should_stop):
+                    return
+
+                temp_page_data = self._is_loaded_this_page(page_index)
+                if temp_page_data is not None:
+                    print(f"第{page_index}页的PDF 已经处理过了")
+                    self._stored_pages[page_index] = temp_page_data
+                    yield {"page_index": page_index, "page_data": temp_page_data}
+                    continue
 
-        doc.close()
+                if page_index in text_pages:
+                    page_data = self._make_page_data(page_index, None, text_pages[page_index], self.base_name)
+                    if text_pages[page_index]:
+                        print(f"第{page_index}页使用PDF自带文字层")
+                    else:
+                        print(f"第{page_index}页为空白页，跳过OCR")
+                        page_data["blank"] = True
+                    yield {"page_index": page_index, "page_data": page_data, "is_new": True}
+                    continue
 
-        return image_paths
+                img_path, raw = self._render_page(doc[page_num], page_index, pdf_img_subdir,
+                                                  save_image=self.save_debug_images)
+                yield {"page_index": page_index, "image_path": img_path, "raw": raw}
+        finally:
+            doc.close()
 
     def _create_text_pdf(self, texts):
         """创建包含识别文字的新PDF"""
-        c = canvas.Canvas(self.output_pdf_path, pagesize=A4)
-        width, height = A4
-
-        # 设置中文字体 - 尝试多种中文字体
-        font_name = None
-        font_paths = [
-            '/System/Library/Fonts/PingFang.ttc',  # macOS
-            '/System/Library/Fonts/STHeiti Medium.ttc',  # macOS
-            'C:/Windows/Fonts/simhei.ttf',  # Windows
-            'C:/Windows/Fonts/simsun.ttc',  # Windows
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',  # Linux
-            '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',  # Linux
-        ]
-        
-        for font_path in font_paths:
-            if os.path.exists(font_path):
-                try:
-                    font_name = 'CustomChinese'
-                    pdfmetrics.registerFont(TTFont('CustomChinese', font_path))
-                    break
-                except Exception as e:
-                    print(f"字体加载失败 {font_path}: {e}")
-                    continue
-        
-        if not font_name:
-            font_name = 'Helvetica'
-            print("警告：使用默认字体，中文字符可能显示为乱码")
-
-        # 设置PDF元数据
-        c.setTitle(f"{self.base_name} - OCR结果")
-        c.setAuthor("豆包OCR")
-        c.setSubject("OCR处理后的文字版PDF")
-
-        for i, text in enumerate(texts):
-            if i > 0:
-                c.showPage()
-
-            # 设置字体和大小
-            c.setFont(font_name, 14)  # 增大字体以提高可读性
-
-            # 计算文本位置
-            x = 50
-            y = height - 50
-            line_height = 24  # 增加行高
-            max_width = width - 100
-
-            # 处理文本编码问题
-            try:
-                # 确保文本是UTF-8编码
-                if isinstance(text, str):
-                    processed_text = text
-                else:
-                    processed_text = str(text)
-                
-                # 替换可能的乱码字符
-                processed_text = processed_text.replace('�', '?')
-                processed_text = processed_text.encode('utf-8', 'ignore').decode('utf-8')
-                
-            except Exception as e:
-                print(f"文本处理错误: {e}")
-                processed_text = str(text)
-
-            # 处理文本
-            lines = processed_text.split('\n')
-
-            for line in lines:
-                if not line.strip():
-                    y -= line_height
-                    continue
-
-                # 处理长行换行 - 按字符分割
-                current_line = ""
-                
-                # 先将整行按空格分割，再处理每个词
-                words = line.split(' ')
-                
-                for word in words:
-                    if not word:
-                        continue
-                    
-                    test_line = current_line + word + " "
-                    if c.stringWidth(test_line, font_name, 14) < max_width:
-                        current_line = test_line
-                    else:
-                        if current_line.strip():
-                            c.drawString(x, y, current_line.strip())
-                            y -= line_height
-                        current_line = word + " "
-                        
-                        # 如果单个词太长，按字符分割
-                        if c.stringWidth(word, font_name, 14) > max_width:
-                            current_line = ""
-                            for char in word:
-                                test_char = current_line + char
-                                if c.stringWidth(test_char, font_name, 14) < max_width:
-                                    current_line = test_char
-                                else:
-                                    if current_line:
-                                        c.drawString(x, y, current_line)
-                                        y -= line_height
-                                    current_line = char
-
-                if current_line.strip():
-                    c.drawString(x, y, current_line.strip())
-                    y -= line_height
-
-                if y < 50:
-                    c.showPage()
-                    y = height - 50
-
-        c.save()
+        # 按页码范围分片并行排版，未变化的分片直接复用缓存
+        compose_text_pdf(
+            self.output_pdf_path, texts,
+            shard_dir=f"data/{self.base_name}/pdf_shards",
+            layout_options=TEXT_PDF_LAYOUT,
+            processes=self.compose_processes,
+            metadata=self._pdf_metadata(),
+        )
+
+    def _pdf_metadata(self):
+        """输出PDF的标题、作者等元数据"""
+        return {
+            "title": f"{self.base_name} - OCR结果",
+            "author": "豆包OCR",
+            "subject": "OCR处理后的文字版PDF",
+        }
 
     def _init_book_data_json_path(self):
         """初始化书籍数据JSON文件路径，使用新的目录结构"""
@@ -338,123 +520,474 @@ class DoubaoOCRConverter:
         os.makedirs(json_dir, exist_ok=True)
         book_data_path = os.path.join(json_dir, f"{pdf_name}_book_data.json")
         self.book_json_data_path = book_data_path
-        return book_data_path
-
-    def _save_book_data(self, page_data_list):
-        """收集书籍数据用于embedding，使用新的目录结构"""
-        book_data = []
-        # 保存到新的目录结构下的book_data.json
-        book_data_path = self._init_book_data_json_path()
-        
-        with open(book_data_path, 'w', encoding='utf-8') as f:
-            json.dump(page_data_list, f, ensure_ascii=False, indent=2)
-
-        print(f"书籍数据已保存到: {book_data_path}")
-        return book_data_path
-
-    def _save_book_data_not_with_img(self, page_data_list):
-        """收集书籍数据用于embedding，使用新的目录结构"""
-        pdf_name = os.path.splitext(os.path.basename(self.input_pdf_path))[0]
-
-        page_data_no_img_list = []
-
-        for page_num in range(len(page_data_list)):
-            origin_page_data = page_data_list[page_num]
-            # 创建不包含图片数据的版本
-            new_page_data = {
-                "page_index": origin_page_data["page_index"],
-                "text": origin_page_data["text"],
-                "pdf_name": origin_page_data["pdf_name"],
-                "page_id": origin_page_data["page_id"]
-            }
-            page_data_no_img_list.append(new_page_data)
-
-        # 保存到新的目录结构下的book_data.json
-        json_dir = f"data/{pdf_name}/json"
-        book_data_path = os.path.join(json_dir, f"{pdf_name}_book_data_no_img.json")
-        os.makedirs(json_dir, exist_ok=True)
-
-        with open(book_data_path, 'w', encoding='utf-8') as f:
-            json.dump(page_data_no_img_list, f, ensure_ascii=False, indent=2)
-
-        print(f"书籍数据(无图片)已保存到: {book_data_path}")
-        return book_data_path
-
-    def _collect_book_data(self, image_paths, texts, image_base64_list):
-        """收集书籍数据用于embedding，使用新的目录结构"""
-        book_data = []
-        pdf_name = os.path.splitext(os.path.basename(self.input_pdf_path))[0]
-
-        for i, (img_path, text, image_b64) in enumerate(zip(image_paths, texts, image_base64_list)):
-            page_data = {
-                "page_index": i + 1,
-                "image_path": img_path,
-                "image_base64": image_b64,
-                "text": text,
-                "pdf_name": pdf_name,
-                "page_id": f"{pdf_name}_page_{i + 1}"
-            }
-            book_data.append(page_data)
-
-        # 保存到新的目录结构下的book_data.json
-        book_data_path = self._init_book_data_json_path()
-        with open(book_data_path, 'w', encoding='utf-8') as f:
-            json.dump(book_data, f, ensure_ascii=False, indent=2)
-
-        print(f"书籍数据已保存到: {book_data_path}")
+        if self.page_journal is None:
+            self.page_journal = PageJournal(os.path.join(json_dir, f"{pdf_name}_book_data.journal.jsonl"))
+        if self.retry_queue is None:
+            self.retry_queue = RetryQueue(os.path.join(json_dir, f"{pdf_name}_retry_queue.jsonl"))
+        if self.use_page_store and self.page_store is None:
+            self.page_store = PageStore(os.path.join(json_dir, f"{pdf_name}_pages.db"))
+            # 页存储是主存储，book_json_data即页存储上的视图
+            self.book_json_data = StoredBookPages(self.page_store)
         return book_data_path
 
     def load_book_json_data(self):
-        """加载book_json_data_path的json文件到self.book_json_data"""
+        """
+        加载已有的书籍数据到self.book_json_data，不读入整本书
+        启用页存储时从页存储读取；否则按需读取book_json_data_path的json文件，只建立页位置索引，访问某页时才读取
+        """
+        self._stored_pages = {}
         try:
             # 检查路径是否已设置
-            if not self.book_json_data_path:
+            if not self.book_json_data_path or self.page_journal is None:
                 print("警告: book_json_data_path未设置，正在初始化...")
                 self.book_json_data_path = self._init_book_data_json_path()
 
-            # 检查文件是否存在
+            if self.use_page_store:
+                return self._load_page_store()
+
             if not os.path.exists(self.book_json_data_path):
                 print(f"警告: JSON文件不存在: {self.book_json_data_path}")
-                self.book_json_data = []
-                return None
+            self.book_json_data = LazyBookPages(self.book_json_data_path)
 
-            # 加载JSON文件
-            with open(self.book_json_data_path, 'r', encoding='utf-8') as f:
-                self.book_json_data = json.load(f)
+            # 合并上次中断时日志里尚未压缩的页
+            for page_data in self.page_journal.read():
+                self.book_json_data.upsert(page_data)
+            if not self.book_json_data:
+                return None
 
             print(f"成功加载书籍数据，共{len(self.book_json_data)}页数据")
             return self.book_json_data
 
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             print(f"错误: JSON格式无效 - {e}")
-            self.book_json_data = []
+            self.book_json_data = StoredBookPages(self.page_store) if self.page_store is not None else BookPages()
             return None
         except Exception as e:
             print(f"错误: 加载JSON文件时发生异常 - {e}")
-            self.book_json_data = []
+            self.book_json_data = StoredBookPages(self.page_store) if self.page_store is not None else BookPages()
             return None
 
+    def _load_page_store(self):
+        """从页存储加载；页存储为空时一次性导入已有的JSON，未启用页存储时留下的日志也并入页存储"""
+        if self.page_store is None:
+            self._init_book_data_json_path()
+        if not len(self.page_store) and os.path.exists(self.book_json_data_path):
+            print(f"首次启用页存储，导入已有的书籍数据: {self.book_json_data_path}")
+            # 逐页读取旧JSON写入，整本书不必同时在内存中
+            self.page_store.put_many((page_data, None, None) for page_data in LazyBookPages(self.book_json_data_path))
+        journal_pages = self.page_journal.read()
+        if journal_pages:
+            self.page_store.put_many([(page_data, None, None) for page_data in journal_pages])
+            self.page_journal.clear()
+        self.book_json_data = StoredBookPages(self.page_store)
+        if not self.book_json_data:
+            return None
+
+        print(f"成功从页存储加载书籍数据，共{len(self.book_json_data)}页数据")
+        return self.book_json_data
+
+    def _find_page_data(self, page_index):
+        """按页码查找已存储的页数据，不判断识别是否成功"""
+        return self.book_json_data.get(page_index)
+
+    def _append_page_data(self, page_data, image_bytes=None, image_mime=None):
+        """启用页存储时把一页数据连同页图像写入页存储，否则追加到日志并更新内存中的book_json_data"""
+        if self.page_journal is None:
+            self._init_book_data_json_path()
+        with self.metrics.stage("persist", page_data["page_index"]):
+            if self.page_store is not None:
+                # 页存储每页提交返回前已落盘，不再另写日志
+                self.book_json_data.upsert(page_data, image_bytes, image_mime)
+            else:
+                self.page_journal.append(page_data)
+        if self.page_store is None:
+            self.book_json_data.upsert(page_data)
+        self._stored_pages[int(page_data["page_index"])] = page_data
+        if self.search_index is not None:
+            self.search_index.add_page(page_data)
+        if self.vector_index is not None:
+            self.vector_index.add_page(page_data)
+
     def save_book_json_data_with_judge(self,page_data_list):
-        # 在判断之前先进行重新load
-        self.load_book_json_data()
+        """只把有变化的页追加到日志，不再整本重写JSON；与本次运行已存储的页比较，不从磁盘重新读取"""
         # 收集书籍数据用于embedding
         for page_data in page_data_list:
             page_index = int(page_data["page_index"])
-            if self._is_loaded_this_page(page_index) is None:
+            if self._stored_pages.get(page_index) != page_data:
                 print(f"存在有新增的内容，我进行存储 page_index:{page_index}")
-                self._save_book_data(page_data_list)
-                break
+                self._append_page_data(page_data)
+
+    def compact_book_data(self):
+        """生成 _book_data.json 与 _book_data_no_img.json：启用页存储时由页存储导出，否则压缩页日志"""
+        book_data_path = self._init_book_data_json_path()
+        no_img_path = book_data_path.replace("_book_data.json", "_book_data_no_img.json")
+        if self.page_store is not None:
+            # 页存储是主存储，JSON只是按原格式导出的副本
+            self.export_book_data()
+        else:
+            with self.metrics.stage("compact"):
+                entries = self.page_journal.compact(self.book_json_data, book_data_path, no_img_path)
+            self.book_json_data = LazyBookPages(book_data_path, entries)
+            print(f"书籍数据已保存到: {book_data_path}")
+            print(f"书籍数据(无图片)已保存到: {no_img_path}")
+        if self.search_index is not None:
+            self.search_index.commit()
+        if self.vector_index is not None:
+            self.vector_index.commit()
+        return book_data_path
+
+    def export_book_data(self, include_images=False):
+        """
+        由页存储导出原格式的 _book_data.json 与 _book_data_no_img.json
+
+        Args:
+            include_images: 是否把页图像以image_base64写入 _book_data.json
+        Returns:
+            导出的页数
+        """
+        book_data_path = self._init_book_data_json_path()
+        if self.page_store is None:
+            raise RuntimeError("未启用页存储，书籍数据由页日志压缩生成")
+        no_img_path = book_data_path.replace("_book_data.json", "_book_data_no_img.json")
+        with self.metrics.stage("compact"):
+            count = self.page_store.export_json(book_data_path, no_img_path, include_images)
+        print(f"已从页存储导出{count}页书籍数据到: {book_data_path}")
+        print(f"书籍数据(无图片)已导出到: {no_img_path}")
+        return count
 
     def _use_json_convert_to_pdf(self):
         self.load_book_json_data()
+        self._write_output(self.book_json_data)
+
+    def _new_output_writer(self):
+        """边识别边输出使用的增量写入器，窗口至少容纳一个完整的批"""
+        return IncrementalPDFWriter(
+            self.output_pdf_path, self.output_mode, self.input_pdf_path,
+            layout_options=TEXT_PDF_LAYOUT,
+            window=max(self.output_window, self.batch_size),
+            metadata=self._pdf_metadata(),
+        )
+
+    def _write_output(self, page_data_list):
+        """按output_mode生成文字版PDF或在原扫描页上叠加文字层的可搜索PDF"""
+        if self.output_mode == OUTPUT_SEARCHABLE:
+            print("正在生成可搜索PDF...")
+            with self.metrics.stage("output"):
+                write_searchable_pdf(self.input_pdf_path, self.output_pdf_path,
+                                     {page_data["page_index"]: page_data["text"] for page_data in page_data_list})
+            return
+
+        print("正在生成文字版PDF...")
         texts = []
-        for page_data in self.book_json_data:
+        for page_data in page_data_list:
             texts.append(page_data["text"])
-        self._create_text_pdf(texts)
+        with self.metrics.stage("output"):
+            self._create_text_pdf(texts)
+
 
+    def _make_page_data(self, page_index, img_path, text, pdf_name):
+        return {
+            "page_index": page_index,
+            "image_path": img_path,
+            "text": text,
+            "pdf_name": pdf_name,
+            "page_id": f"{pdf_name}_page_{page_index}"
+        }
+
+    def _ocr_page(self, page_index, img_path, image_base64, pdf_name, cache_key=None, image_mime="image/png"):
+        """识别单页图像并返回page_data，可在工作线程中并发调用"""
+        print(f"正在识别第{page_index}页文字...")
+
+        # 调用API
+        with self.metrics.stage("ocr", page_index):
+            text = self._call_ocr(image_base64, image_mime)
+        if text:
+            print(f"第{page_index}页识别完成")
+            if self.ocr_cache is not None and cache_key:
+                self.ocr_cache.put(cache_key, text)
+        else:
+            print(f"第{page_index}页识别失败，已加入重试队列")
+            if self.retry_queue is not None:
+                self.retry_queue.add(page_index, "ocr_failed")
+
+        return self._make_page_data(page_index, img_path, text, pdf_name)
+
+    def _encode_stage(self, item, pdf_name):
+        """管线的编码阶段（多线程）：先筛查空白页和重复页，再把像素在内存中编码为图像，查OCR缓存，未命中时转base64"""
+        if "page_data" in item:
+            return item
+
+        page_index = item["page_index"]
+        if self.page_screener is not None:
+            with self.metrics.stage("screen", page_index):
+                kind, ref_page_index = self.page_screener.screen(page_index, item["raw"])
+            if kind == SCREEN_BLANK:
+                print(f"第{page_index}页为空白页，跳过OCR")
+                item.pop("raw")
+                item["page_data"] = self._make_page_data(page_index, item["image_path"], "", pdf_name)
+                item["page_data"]["blank"] = True
+                item["is_new"] = True
+                return item
+            if kind == SCREEN_DUPLICATE:
+                print(f"第{page_index}页与第{ref_page_index}页相同，复用其识别结果")
+                item.pop("raw")
+                item["duplicate_of"] = ref_page_index
+                return item
+
+        with self.metrics.stage("encode", page_index):
+            image_bytes, item["image_mime"] = encode_image(
+                item.pop("raw"), self.image_format, self.image_quality, self.max_long_edge
+            )
+        if self.use_page_store:
+            item["image_bytes"] = image_bytes
+        if self.ocr_cache is not None:
+            item["cache_key"] = self._cache_key(image_bytes)
+            text = self.ocr_cache.get(item["cache_key"])
+            if text is not None:
+                print(f"第{item['page_index']}页命中OCR缓存")
+                item["page_data"] = self._make_page_data(item["page_index"], item["image_path"], text, pdf_name)
+                item["is_new"] = True
+                return item
+
+        with self.metrics.stage("base64", page_index):
+            item["image_base64"] = base64.b64encode(image_bytes).decode('utf-8')
+        return item
+
+    def _batch_stage(self, item, batch):
+        """管线的攒批阶段：待OCR的页攒够batch_size页后一起交给OCR阶段，其余项直接放行"""
+        # 边识别边输出时，输出窗口已满说明最早的页正等在未满的批里，立即交出
+        window_full = self._output_writer is not None and self._output_writer.is_window_full()
+        if "page_data" in item or "duplicate_of" in item:
+            if not (window_full and batch):
+                return item
+        batch.append(item)
+        if len(batch) < self.batch_size and not window_full:
+            return None
+        items = batch[:]
+        batch.clear()
+        return {"batch": items}
+
+    def _ocr_batch(self, items, pdf_name):
+        """一次请求识别多页，按分隔标记拆回各页；缺少分隔标记的页单独重试，已有结果的项原样放行"""
+        done = [item for item in items if "page_data" in item or "duplicate_of" in item]
+        items = [item for item in items if "page_data" not in item and "duplicate_of" not in item]
+        if len(items) <= 1:
+            texts = {}
+        else:
+            page_indexes = [item["page_index"] for item in items]
+            print(f"正在批量识别第{page_indexes}页文字...")
+            content = self._build_content(
+                BATCH_OCR_PROMPT.format(count=len(items)),
+                [(item["image_base64"], item["image_mime"]) for item in items]
+            )
+            try:
+                with self.metrics.stage("ocr_batch"):
+                    result = self._chat_completion(content, min(self.max_tokens * len(items),
+                                                                self.batch_max_tokens))
+                texts = _split_batch_result(result, len(items))
+            except Exception as e:
+                print(f"第{page_indexes}页批量识别异常：{e}")
+                texts = {}
+
+        for n, item in enumerate(items, 1):
+            page_index = item["page_index"]
+            image_base64 = item.pop("image_base64")
+            text = texts.get(n)
+            if text is not None:
+                # 批量结果来自批量提示词和合并请求的输出额度，与单页缓存键的识别参数不同，不写入OCR缓存
+                print(f"第{page_index}页识别完成")
+                item["page_data"] = self._make_page_data(page_index, item["image_path"], text, pdf_name)
+            else:
+                if len(items) > 1:
+                    print(f"第{page_index}页在批量结果中缺少分隔标记，单独重试")
+                try:
+                    item["page_data"] = self._ocr_page(page_index, item["image_path"], image_base64,
+                                                       pdf_name, item.get("cache_key"), item["image_mime"])
+                except Exception as e:
+                    item["page_data"] = self._failed_page_data(page_index, item["image_path"], pdf_name, e)
+            item["is_new"] = True
+            done.append(item)
+        return done
+
+    def _ocr_stage(self, item, pdf_name):
+        """管线的OCR阶段：多个工作线程同时发起请求"""
+        if "batch" in item:
+            return {"batch": self._ocr_batch(item["batch"], pdf_name)}
+        if "page_data" in item or "duplicate_of" in item:
+            return item
+        page_index = item["page_index"]
+        try:
+            item["page_data"] = self._ocr_page(page_index, item["image_path"], item.pop("image_base64"),
+                                               pdf_name, item.get("cache_key"), item["image_mime"])
+        except Exception as e:
+            item["page_data"] = self._failed_page_data(page_index, item["image_path"], pdf_name, e)
+        item["is_new"] = True
+        return item
+
+    def _failed_page_data(self, page_index, img_path, pdf_name, error):
+        """识别过程抛出异常的页记为失败并加入重试队列，仍交给存储阶段，保证后续页能按顺序输出"""
+        print(f"第{page_index}页识别异常：{error}")
+        if self.retry_queue is not None:
+            self.retry_queue.add(page_index, f"exception: {error}")
+        return self._make_page_data(page_index, img_path, None, pdf_name)
+
+    def _persist_stage(self, item, page_data_by_index, waiting_duplicates):
+        """管线的存储阶段：单线程按页码收集结果，每识别完一页向日志追加一行"""
+        if "batch" in item:
+            for batch_item in item["batch"]:
+                self._persist_stage(batch_item, page_data_by_index, waiting_duplicates)
+            return None
+
+        ref_page_index = item.get("duplicate_of")
+        if ref_page_index is not None:
+            # 原页可能还在识别中，等它的结果到达后再一起存储
+            if ref_page_index not in page_data_by_index:
+                waiting_duplicates.setdefault(ref_page_index, []).append(item)
+                return None
+            item["page_data"] = self._copy_duplicate_page_data(item, page_data_by_index[ref_page_index])
+            item["is_new"] = True
+            if page_status(item["page_data"]) == PAGE_FAILED and self.retry_queue is not None:
+                # 原页识别失败，重复页随原页一起重试
+                print(f"第{item['page_index']}页的原页第{ref_page_index}页识别失败，已加入重试队列")
+                self.retry_queue.add(item["page_index"], f"duplicate_of_failed: {ref_page_index}")
+
+        page_index = item["page_index"]
+        page_data_by_index[page_index] = item["page_data"]
+        self.metrics.add("pages")
+        if item.get("is_new"):
+            print(f"进行初步存储 page_index:{page_index}")
+            self._append_page_data(item["page_data"], item.get("image_bytes"), item.get("image_mime"))
+        if self._output_writer is not None:
+            # 只交给写入器的缓冲区，PDF由持有fitz文档的渲染线程写出
+            self._output_writer.add(page_index, item["page_data"]["text"])
+
+        for duplicate in waiting_duplicates.pop(page_index, []):
+            self._persist_stage(duplicate, page_data_by_index, waiting_duplicates)
+        return None
+
+    def _copy_duplicate_page_data(self, item, ref_page_data):
+        """以原页的识别结果生成重复页的page_data"""
+        page_data = self._make_page_data(item["page_index"], item["image_path"],
+                                         ref_page_data["text"], ref_page_data["pdf_name"])
+        page_data["duplicate_of"] = ref_page_data["page_index"]
+        return page_data
+
+    def retry_failed_pages(self, pdf_name=None):
+        """
+        重新识别重试队列中的页，成功的页写入日志并移出队列
+        队列保存在 data/{pdf_name}/json/ 下，上次运行遗留的失败页也会在这里重试
+
+        Returns:
+            本次重试成功的页数
+        """
+        if self.retry_queue is None:
+            self._init_book_data_json_path()
+        pdf_name = pdf_name or self.base_name
+
+        page_indexes = []
+        for page_index in self.retry_queue.pending():
+            if self._is_loaded_this_page(page_index) is not None:
+                self.retry_queue.remove(page_index)
+            else:
+                page_indexes.append(page_index)
+        if not page_indexes:
+            self.retry_queue.compact()
+            return 0
+
+        # 重复页放在最后，其原页（编码阶段多线程筛查时可能页码更大）先重试
+        page_indexes.sort(key=lambda page_index: bool((self._find_page_data(page_index) or {}).get("duplicate_of")))
+        print(f"重试队列中有{len(page_indexes)}页，开始重试：{page_indexes}")
+        recovered = 0
+        doc = fitz.open(self.input_pdf_path)
+        try:
+            pdf_img_subdir = self._init_pdf_img_dir()
+            for page_index in page_indexes:
+                if page_index > len(doc):
+                    self.retry_queue.remove(page_index)
+                    continue
+                # 重复页的原页已在前面重试成功，直接复用其结果
+                page_data = self._find_page_data(page_index)
+                ref_page_data = None
+                if page_data is not None and page_data.get("duplicate_of"):
+                    ref_page_data = self._is_loaded_this_page(page_data["duplicate_of"])
+                if ref_page_data is not None:
+                    self._append_page_data(self._copy_duplicate_page_data(page_data, ref_page_data))
+                    self.retry_queue.remove(page_index)
+                    recovered += 1
+                    continue
+                img_path, raw = self._render_page(doc[page_index - 1], page_index, pdf_img_subdir,
+                                                  save_image=self.save_debug_images)
+                image_bytes, image_mime = encode_image(raw, self.image_format, self.image_quality,
+                                                       self.max_long_edge)
+                cache_key = self._cache_key(image_bytes) if self.ocr_cache is not None else None
+                page_data = self._ocr_page(page_index, img_path, base64.b64encode(image_bytes).decode('utf-8'),
+                                           pdf_name, cache_key, image_mime)
+                if page_data["text"]:
+                    self._append_page_data(page_data, image_bytes, image_mime)
+                    self.retry_queue.remove(page_index)
+                    recovered += 1
+        finally:
+            doc.close()
+            self.retry_queue.compact()
+
+        print(f"重试完成：成功{recovered}页，仍失败{len(page_indexes) - recovered}页")
+        return recovered
+
+    def evaluate_image_encoding(self, page_indexes, variants):
+        """
+        评估不同图像编码参数对请求体大小和OCR准确率的影响
+        以3倍分辨率全彩PNG的识别结果为参考，不读写OCR缓存
+
+        Args:
+            page_indexes: 参与评估的页码列表
+            variants: 编码参数列表，例如
+                [{"image_format": "jpeg", "quality": 70, "max_long_edge": 2000, "grayscale": True}]
+        Returns:
+            每组参数一条结果：{"variant", "avg_bytes", "avg_accuracy"}
+        """
+        doc = fitz.open(self.input_pdf_path)
+        sums = [{"bytes": 0, "accuracy": 0.0} for _ in variants]
+        baseline_bytes = 0
+        try:
+            for page_index in page_indexes:
+                page = doc[page_index - 1]
+                rgb_pix = page.get_pixmap(matrix=fitz.Matrix(3.0, 3.0), colorspace=fitz.csRGB, alpha=False)
+                gray_pix = fitz.Pixmap(fitz.csGRAY, rgb_pix)
+
+                baseline, mime = encode_image(pixmap_to_raw(rgb_pix), "png")
+                baseline_bytes += len(baseline)
+                reference = self._call_ocr(base64.b64encode(baseline).decode('utf-8'), mime) or ""
+
+                for i, variant in enumerate(variants):
+                    raw = pixmap_to_raw(gray_pix if variant.get("grayscale", True) else rgb_pix)
+                    image_bytes, mime = encode_image(
+                        raw, variant.get("image_format", "jpeg"),
+                        variant.get("quality", 80), variant.get("max_long_edge")
+                    )
+                    text = self._call_ocr(base64.b64encode(image_bytes).decode('utf-8'), mime)
+                    accuracy = char_accuracy(reference, text)
+                    sums[i]["bytes"] += len(image_bytes)
+                    sums[i]["accuracy"] += accuracy
+                    print(f"第{page_index}页 {variant}: {len(image_bytes) / 1024:.0f}KB，准确率{accuracy:.2%}")
+        finally:
+            doc.close()
+
+        page_count = max(len(page_indexes), 1)
+        print(f"参考PNG平均大小：{baseline_bytes / page_count / 1024:.0f}KB")
+        results = []
+        for variant, total in zip(variants, sums):
+            results.append({
+                "variant": variant,
+                "avg_bytes": total["bytes"] / page_count,
+                "avg_accuracy": total["accuracy"] / page_count,
+            })
+            print(f"{variant}: 平均{total['bytes'] / page_count / 1024:.0f}KB，"
+                  f"平均准确率{total['accuracy'] / page_count:.2%}")
+        return results
 
     def convert(self):
         page_data_list = []
+        self.metrics.start()
         self.load_book_json_data()
         """执行完整的转换流程"""
         try:
@@ -462,73 +995,67 @@ class DoubaoOCRConverter:
 
             pdf_name = os.path.splitext(os.path.basename(self.input_pdf_path))[0]
 
-            # 提取图像
-            image_paths = self._extract_images_from_pdf()
-
-            # 执行OCR
-            texts = []
-            image_base64_list = []
-
-            for i, img_path in enumerate(image_paths):
-                try:
-                    page_index = i + 1
-                    print(f"正在识别第{page_index}页文字...")
-
-                    temp_page_data = self._is_loaded_this_page(page_index)
-                    if temp_page_data is not None:
-                        page_data_list.append(temp_page_data)
-                        print("=====================================================")
-                        print("数据已经加载过  内容如下\n", temp_page_data["text"])
-                        continue
-
-                    # 编码图像
-                    image_base64 = self._encode_image_to_base64(img_path)
-                    image_base64_list.append(image_base64)
-
-                    # 调用API
-                    text = self._call_doubao_ocr_use_sdk(image_base64)
-                    if text:
-                        texts.append(text)
-                        print(f"第{i + 1}页识别完成")
-                    else:
-                        texts.append("[识别失败]")
-                        print(f"第{i + 1}页识别失败")
-
-                    page_data = {
-                        "page_index": i + 1,
-                        "image_path": img_path,
-                        "text": text,
-                        "pdf_name": pdf_name,
-                        "page_id": f"{pdf_name}_page_{i + 1}"
-                    }
-                    page_data_list.append(page_data)
-                    print(f"进行初步存储 page_index:{page_index}<UNK>")
-                    self.save_book_json_data_with_judge(page_data_list)
-                except Exception as e:
-                    print(e)
-
-                # 避免API限流
-                time.sleep(1)
+            # 渲染 -> 筛查与编码 -> (攒批) -> OCR -> 存储 各阶段流式重叠执行，
+            # 编码阶段encode_workers个线程，OCR阶段最多max_workers个请求同时进行
+            page_data_by_index = {}
+            waiting_duplicates = {}
+            self.page_screener = PageScreener() if self.screen_pages else None
+            print(f"OCR并发数：{self.max_workers}，每次请求{self.batch_size}页，编码线程数：{self.encode_workers}")
+            stages = [
+                PipelineStage("encode", lambda item: self._encode_stage(item, pdf_name),
+                              workers=self.encode_workers, queue_size=self.queue_size),
+            ]
+            if self.batch_size > 1:
+                batch = []
+                stages.append(PipelineStage("batch", lambda item: self._batch_stage(item, batch),
+                                            queue_size=self.queue_size,
+                                            flush=lambda: [{"batch": batch[:]}] if batch else []))
+            stages += [
+                PipelineStage("ocr", lambda item: self._ocr_stage(item, pdf_name),
+                              workers=self.max_workers, queue_size=self.queue_size),
+                PipelineStage("persist",
+                              lambda item: self._persist_stage(item, page_data_by_index, waiting_duplicates),
+                              queue_size=self.queue_size),
+            ]
+            if self.incremental_output:
+                self._output_writer = self._new_output_writer()
+            source = self._iter_rendered_pages(should_stop=lambda: pipeline.is_stopping())
+            pipeline = StreamingPipeline(source, stages)
+            try:
+                pipeline.run()
+            finally:
+                page_data_list = [page_data_by_index[k] for k in sorted(page_data_by_index)]
+                # 管线线程已全部结束，写出剩余的页并整理为完整文件，出错时磁盘上也保留按顺序写出的部分
+                if self._output_writer is not None:
+                    print(f"已边识别边输出{self._output_writer.close()}页到: {self.output_pdf_path}")
+                    self._output_writer = None
 
             self.save_book_json_data_with_judge(page_data_list)
-
-            # 创建新PDF
-            print("正在生成文字版PDF...")
-
-            texts=[]
-            for page_data in page_data_list:
-                texts.append(page_data["text"])
-            self._create_text_pdf(texts)
+            # 管线中重试耗尽的页在最后再集中重试一轮
+            recovered = self.retry_failed_pages(pdf_name)
+            self.compact_book_data()
+            if self.ocr_cache is not None:
+                print(f"OCR缓存统计：{self.ocr_cache.stats()}")
+            if self.page_screener is not None:
+                self.page_screener.report()
+
+            # 创建新PDF；边识别边输出时只有重试补回的页需要重新生成
+            if not self.incremental_output or recovered:
+                # 按页码逐页读取存储后的书籍数据（含重试补回的页），不整本读入
+                self._write_output(self.book_json_data)
 
             print(f"转换完成！输出文件：{self.output_pdf_path}")
 
         except Exception as e:
             print(f"转换过程中出现错误：{str(e)}")
             self.save_book_json_data_with_judge(page_data_list)
+            self.compact_book_data()
             raise
         finally:
             # 清理临时文件
             shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.close()
+            self.metrics.write_reports(f"data/{self.base_name}/json", f"{self.base_name}_metrics")
 
 
 def main():
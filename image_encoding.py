@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+页图像的内存编码
+直接把渲染得到的像素编码成灰度JPEG/WebP并限制长边像素，不经过磁盘，
+显著缩小请求体；另提供字符准确率，用于评估压缩对识别效果的影响
+"""
+
+import difflib
+import io
+
+from PIL import Image
+
+IMAGE_MIME = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+
+def pixmap_to_raw(pix):
+    """取出pixmap的像素数据，便于在渲染线程之外编码（PyMuPDF对象不跨线程使用）"""
+    return {
+        "samples": pix.samples,
+        "width": pix.width,
+        "height": pix.height,
+        "channels": pix.n - pix.alpha,
+        "stride": pix.stride,
+        "alpha": pix.alpha,
+    }
+
+
+def raw_to_image(raw):
+    """把pixmap_to_raw得到的像素数据包装成PIL图像（不含alpha通道）"""
+    if raw["alpha"]:
+        raise ValueError("请以alpha=False渲染页面")
+    mode = "L" if raw["channels"] == 1 else "RGB"
+    return Image.frombuffer(mode, (raw["width"], raw["height"]), raw["samples"], "raw", mode, raw["stride"], 1)
+
+
+def encode_image(raw, image_format="jpeg", quality=80, max_long_edge=None):
+    """
+    把pixmap_to_raw得到的像素数据编码为图像字节
+
+    Args:
+        raw: pixmap_to_raw 的返回值（不含alpha通道）
+        image_format: png / jpeg / webp
+        quality: JPEG/WebP质量
+        max_long_edge: 长边像素上限，超过时等比缩小；None表示不缩放
+    Returns:
+        (图像字节, MIME类型)
+    """
+    if image_format not in IMAGE_MIME:
+        raise ValueError(f"不支持的图像格式：{image_format}")
+
+    img = raw_to_image(raw)
+    width, height = img.size
+
+    long_edge = max(width, height)
+    if max_long_edge and long_edge > max_long_edge:
+        scale = max_long_edge / long_edge
+        img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    if image_format == "png":
+        img.save(buf, "PNG")
+    elif image_format == "jpeg":
+        img.save(buf, "JPEG", quality=quality, optimize=True)
+    else:
+        img.save(buf, "WEBP", quality=quality, method=4)
+    return buf.getvalue(), IMAGE_MIME[image_format]
+
+
+def char_accuracy(reference, candidate):
+    """以reference为参考的字符级准确率，1.0表示完全一致"""
+    reference = reference or ""
+    candidate = candidate or ""
+    if not reference and not candidate:
+        return 1.0
+    matcher = difflib.SequenceMatcher(None, reference, candidate, autojunk=False)
+    matched = sum(block.size for block in matcher.get_matching_blocks())
+    return matched / max(len(reference), len(candidate))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+边识别边输出的PDF写入器
+识别完成的页先进入重排缓冲区，按页码顺序写入输出文件，每攒够若干页做一次增量保存，
+磁盘上始终是一个可打开的PDF；渲染阶段需先取得窗口名额，同时在途的页数不超过窗口大小。
+PyMuPDF不支持多线程同时调用，add()只把结果放进缓冲区，写入PDF在持有fitz文档的渲染线程上进行：
+渲染线程每次取窗口名额时写出已就绪的页，管线结束后由close()写出剩余的页
+"""
+
+import io
+import os
+import threading
+
+import pymupdf as fitz
+
+from searchable_pdf import OUTPUT_SEARCHABLE, OUTPUT_TEXT, overlay_page
+from text_layout import TextLayout, clean_text, draw_text_pdf, register_cjk_font
+
+
+class IncrementalPDFWriter:
+    """按页码顺序增量写出的PDF"""
+
+    def __init__(self, output_path, output_mode=OUTPUT_TEXT, input_pdf_path=None, layout_options=None,
+                 window=16, flush_pages=8, metadata=None):
+        """
+        Args:
+            output_path: 输出PDF路径
+            output_mode: "text"写入重新排版的文字页，"searchable"复制原页并叠加不可见文字
+            input_pdf_path: 原PDF路径，searchable模式必需
+            layout_options: text模式下传给TextLayout的参数
+            window: 已开始处理但尚未写出的最大页数
+            flush_pages: 每写入多少页做一次增量保存
+            metadata: PDF元数据
+        """
+        if output_mode == OUTPUT_SEARCHABLE and not input_pdf_path:
+            raise ValueError("searchable模式需要提供原PDF路径")
+        self.output_path = output_path
+        self.output_mode = output_mode
+        self.input_pdf_path = input_pdf_path
+        self.window = max(1, int(window))
+        self.flush_pages = max(1, int(flush_pages))
+        self.metadata = metadata
+
+        # 与整本排版（pdf_compose）使用同一个reportlab排版实现，增量与非增量输出的版面一致
+        self.layout = TextLayout(register_cjk_font(), **(layout_options or {})) if output_mode == OUTPUT_TEXT else None
+        self._source = fitz.open(input_pdf_path) if output_mode == OUTPUT_SEARCHABLE else None
+
+        self._doc = None
+        self._buffer = {}
+        self._next_page = 1
+        self._in_flight = 0
+        self._unsaved = 0
+        self.written = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def acquire_slot(self, should_stop=None):
+        """
+        渲染一页之前在渲染线程中调用：先写出已就绪的页，窗口已满时等待前面的页识别完成
+
+        Args:
+            should_stop: 返回True时放弃等待（例如管线已出错）
+        Returns:
+            取得名额返回True，放弃等待返回False
+        """
+        while True:
+            self.write_ready()
+            with self._cond:
+                if self._in_flight < self.window:
+                    self._in_flight += 1
+                    return True
+                if self._closed or (should_stop is not None and should_stop()):
+                    return False
+                if self._next_page not in self._buffer:
+                    self._cond.wait(0.1)
+
+    def is_window_full(self):
+        """窗口是否已满；攒批阶段据此提前交出未满的批，避免等待中的页阻塞窗口"""
+        with self._cond:
+            return self._in_flight >= self.window
+
+    def add(self, page_index, text):
+        """交给写入器一页结果（可在任意线程调用），只放入重排缓冲区，由write_ready按页码顺序写出"""
+        with self._cond:
+            self._buffer[int(page_index)] = text
+            self._cond.notify_all()
+
+    def write_ready(self):
+        """把缓冲区中从下一页开始连续的页写入PDF，只能在持有fitz文档的线程中调用"""
+        with self._cond:
+            start = self._next_page
+            texts = []
+            while self._next_page in self._buffer:
+                texts.append(self._buffer.pop(self._next_page))
+                self._next_page += 1
+        if not texts:
+            return 0
+
+        self._write_pages(start, texts)
+        self._unsaved += len(texts)
+        if self._unsaved >= self.flush_pages:
+            self._save()
+        with self._cond:
+            self._in_flight -= len(texts)
+            self.written += len(texts)
+            self._cond.notify_all()
+        return len(texts)
+
+    def _write_pages(self, start, texts):
+        if self._doc is None:
+            self._doc = fitz.open()
+        if self.output_mode == OUTPUT_SEARCHABLE:
+            for page_index, text in enumerate(texts, start):
+                if page_index > len(self._source):
+                    continue
+                self._doc.insert_pdf(self._source, from_page=page_index - 1, to_page=page_index - 1)
+                overlay_page(self._doc[-1], clean_text(text))
+        else:
+            buffer = io.BytesIO()
+            draw_text_pdf(buffer, texts, self.layout)
+            with fitz.open("pdf", buffer.getvalue()) as pages:
+                self._doc.insert_pdf(pages)
+
+    def _save(self):
+        """把已写入的页保存到磁盘：首次整体写出并重新打开，之后追加增量更新"""
+        if self._doc is None or self._unsaved == 0:
+            return
+        if self._doc.is_pdf and self._doc.name == self.output_path:
+            self._doc.saveIncr()
+        else:
+            tmp_path = f"{self.output_path}.tmp"
+            self._doc.save(tmp_path)
+            self._doc.close()
+            os.replace(tmp_path, self.output_path)
+            self._doc = fitz.open(self.output_path)
+        self._unsaved = 0
+
+    def close(self):
+        """
+        写出缓冲区中剩余的页并把增量更新压缩为一个完整的文件
+        需在管线结束后、由不再有其他线程使用fitz时调用
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        try:
+            self.write_ready()
+            if self._buffer:
+                print(f"输出PDF缺少第{self._next_page}页，其后的{len(self._buffer)}页未写出")
+            if self._doc is None:
+                return self.written
+            self._save()
+            if self.metadata:
+                self._doc.set_metadata({**self._doc.metadata, **self.metadata})
+            tmp_path = f"{self.output_path}.tmp"
+            if self.output_mode == OUTPUT_TEXT:
+                # 各批页面各自嵌入了字体子集，保存时合并重复对象
+                self._doc.save(tmp_path, garbage=3, deflate=True)
+            else:
+                self._doc.save(tmp_path, garbage=1)
+        finally:
+            if self._doc is not None:
+                self._doc.close()
+                self._doc = None
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+        os.replace(tmp_path, self.output_path)
+        return self.written
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+按需读取的书籍数据
+流式扫描 _book_data.json 一次，记下每页在文件中的字节位置和识别状态，存为旁路索引文件；
+文件大小或修改时间变化时索引失效重建。续跑判断、统计页状态只查索引，访问某页时才读取并解析该页
+"""
+
+import json
+import os
+import re
+
+from book_pages import PAGE_MISSING, BookPages, page_status
+
+# 旁路索引格式版本，格式变化时旧索引自动失效
+INDEX_VERSION = 1
+# 流式扫描时每次读取的字节数
+SCAN_CHUNK_SIZE = 1 << 20
+
+# JSON中影响嵌套层次的字符；base64等长字符串内没有这些字符，扫描时整段跳过
+_STRUCTURAL = re.compile(rb'[\[\]{}"\\]')
+
+
+def index_path(book_data_path):
+    """旁路索引文件路径"""
+    return f"{book_data_path}.idx"
+
+
+def scan_json_array(path, chunk_size=SCAN_CHUNK_SIZE):
+    """
+    流式扫描顶层为数组的JSON文件，不解析元素内容
+
+    Returns:
+        每个对象元素的(字节偏移, 字节长度)列表
+    Raises:
+        ValueError: 文件不是完整的JSON数组
+    """
+    spans = []
+    depth = 0
+    in_string = False
+    skip_next = False
+    start = None
+    base = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            pos = 0
+            if skip_next:
+                # 上一块末尾是字符串中的反斜杠，本块第一个字节是被转义的字符
+                pos = 1
+                skip_next = False
+            while True:
+                match = _STRUCTURAL.search(chunk, pos)
+                if match is None:
+                    break
+                char = match.group()
+                pos = match.end()
+                if in_string:
+                    if char == b"\\":
+                        if pos >= len(chunk):
+                            skip_next = True
+                        pos += 1
+                    elif char == b'"':
+                        in_string = False
+                    continue
+                if char == b'"':
+                    in_string = True
+                elif char in (b"[", b"{"):
+                    if depth == 0 and char != b"[":
+                        raise ValueError(f"JSON顶层不是数组: {path}")
+                    if depth == 1:
+                        start = base + match.start()
+                    depth += 1
+                elif char in (b"]", b"}"):
+                    depth -= 1
+                    if depth < 0:
+                        raise ValueError(f"JSON括号不匹配: {path}")
+                    if depth == 1 and start is not None:
+                        spans.append((start, base + match.end() - start))
+                        start = None
+            base += len(chunk)
+    if depth != 0 or in_string:
+        raise ValueError(f"JSON数组不完整: {path}")
+    return spans
+
+
+def build_offset_index(book_data_path):
+    """扫描JSON文件，逐页解析一次得到页码和状态，返回[(页码, 字节偏移, 字节长度, 页状态)]"""
+    entries = []
+    with open(book_data_path, 'rb') as f:
+        for offset, length in scan_json_array(book_data_path):
+            f.seek(offset)
+            page_data = json.loads(f.read(length))
+            entries.append((int(page_data["page_index"]), offset, length, page_status(page_data)))
+    return entries
+
+
+def save_offset_index(book_data_path, entries):
+    """把索引连同JSON文件当前的大小和修改时间写入旁路文件"""
+    stat = os.stat(book_data_path)
+    path = index_path(book_data_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "version": INDEX_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "pages": [list(entry) for entry in entries],
+        }, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_offset_index(book_data_path):
+    """读取旁路索引；索引不存在、已损坏或与JSON文件的大小、修改时间不符时重新扫描并保存"""
+    path = index_path(book_data_path)
+    stat = os.stat(book_data_path)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if (index.get("version") == INDEX_VERSION and index.get("size") == stat.st_size
+                    and index.get("mtime_ns") == stat.st_mtime_ns):
+                return [tuple(entry) for entry in index["pages"]]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    entries = build_offset_index(book_data_path)
+    save_offset_index(book_data_path, entries)
+    return entries
+
+
+class LazyBookPages(BookPages):
+    """
+    按需读取的BookPages
+
+    内存中只有每页在 _book_data.json 中的位置和状态；get时才从文件读取解析该页，结果不缓存。
+    upsert的页保存在内存中并优先于文件中的同一页
+    """
+
+    def __init__(self, book_data_path=None, entries=None):
+        """
+        Args:
+            book_data_path: _book_data.json 路径，为None或文件不存在时为空
+            entries: 刚写出该文件时得到的[(页码, 字节偏移, 字节长度, 页状态)]，提供时直接保存为旁路索引
+        """
+        super().__init__()
+        self.book_data_path = book_data_path
+        self._index = {}
+        if book_data_path and os.path.exists(book_data_path):
+            if entries is None:
+                entries = load_offset_index(book_data_path)
+            else:
+                save_offset_index(book_data_path, entries)
+            self._index = {page_index: (offset, length, status) for page_index, offset, length, status in entries}
+
+    def _read(self, page_index):
+        offset, length, _ = self._index[page_index]
+        with open(self.book_data_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def get(self, page_index):
+        """返回该页的数据，不存在时返回None"""
+        page_index = int(page_index)
+        page_data = self._pages.get(page_index)
+        if page_data is None and page_index in self._index:
+            page_data = self._read(page_index)
+        return page_data
+
+    def status(self, page_index):
+        """返回该页状态，文件中的页直接使用索引里的状态，不读取页内容"""
+        page_index = int(page_index)
+        if page_index in self._pages:
+            return page_status(self._pages[page_index])
+        entry = self._index.get(page_index)
+        return entry[2] if entry else PAGE_MISSING
+
+    def page_indexes(self):
+        return sorted(self._pages.keys() | self._index.keys())
+
+    def __iter__(self):
+        return (self.get(page_index) for page_index in self.page_indexes())
+
+    def __len__(self):
+        return len(self._pages.keys() | self._index.keys())
+
+    def __contains__(self, page_index):
+        page_index = int(page_index)
+        return page_index in self._pages or page_index in self._index
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+本地模拟的OCR对话接口
+兼容OpenAI / 方舟的 chat/completions 请求与响应格式，可配置延迟、错误率和429限流行为，
+用于在没有网络和API额度的情况下测量DoubaoOCRConverter的吞吐
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic_pdf import TEXT_MIXED, page_text
+
+
+class MockOCRServer:
+    """在后台线程中运行的模拟OCR服务"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.3, latency_jitter=0.1, per_image_latency=0.05,
+                 error_rate=0.0, rate_limit_rate=0.0, max_concurrency=None, retry_after=0.5,
+                 chars_per_page=600, text_kind=TEXT_MIXED, seed=0):
+        """
+        Args:
+            host / port: 监听地址，port为0时自动分配
+            latency: 每个请求的基础延迟（秒）
+            latency_jitter: 延迟的随机波动范围（秒），实际延迟在 latency ± jitter 之间
+            per_image_latency: 请求中每张图片额外增加的延迟（秒）
+            error_rate: 返回500/503的概率
+            rate_limit_rate: 随机返回429的概率
+            max_concurrency: 同时处理的请求数上限，超出时返回429，None表示不限
+            retry_after: 429/503响应中Retry-After头的秒数，None表示不带该头
+            chars_per_page: 每页识别结果的字数
+            text_kind: 识别结果的文字类型 cjk / latin / mixed
+            seed: 随机种子
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.per_image_latency = per_image_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.chars_per_page = chars_per_page
+        self.text_kind = text_kind
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counts = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "images": 0,
+                        "bytes_received": 0, "peak_concurrency": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def endpoint(self):
+        """直接请求endpoint（use_sdk=False）时使用的完整地址"""
+        return f"{self.url}/v1/chat/completions"
+
+    @property
+    def base_url(self):
+        """方舟SDK的base_url，SDK会在其后拼接 /chat/completions"""
+        return f"{self.url}/api/v3"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-ocr-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def stats(self):
+        """返回请求数、成功数、429数、错误数、图片数、收到的字节数和最大并发"""
+        with self._lock:
+            return dict(self._counts)
+
+    def _decide(self, rng):
+        """决定本次请求的结果：None表示正常返回，否则为错误状态码"""
+        if self.max_concurrency is not None and self._in_flight > self.max_concurrency:
+            return 429
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 503 if rng.random() < 0.5 else 500
+        return None
+
+    def _completion(self, rng, body, image_count):
+        """生成与OpenAI格式一致的响应；多张图片时按 <<<PAGE n>>> 分隔逐页输出"""
+        if image_count <= 1:
+            content = page_text(rng, self.text_kind, self.chars_per_page)
+        else:
+            content = "\n".join(
+                f"<<<PAGE {n}>>>\n{page_text(rng, self.text_kind, self.chars_per_page)}"
+                for n in range(1, image_count + 1)
+            )
+        return {
+            "id": f"mock-{rng.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": 50 + 1000 * image_count,
+                "completion_tokens": len(content),
+                "total_tokens": 50 + 1000 * image_count + len(content),
+            },
+        }
+
+    def _handle(self, handler):
+        length = int(handler.headers.get("Content-Length") or 0)
+        raw = handler.rfile.read(length)
+        if not handler.path.rstrip("/").endswith("/chat/completions"):
+            return 404, {"error": {"message": "not found"}}, None
+
+        with self._lock:
+            self._counts["requests"] += 1
+            self._counts["bytes_received"] += len(raw)
+            self._in_flight += 1
+            self._counts["peak_concurrency"] = max(self._counts["peak_concurrency"], self._in_flight)
+            rng = random.Random(self.seed * 1_000_003 + self._counts["requests"])
+            status = self._decide(rng)
+        try:
+            body = json.loads(raw or b"{}")
+            messages = body.get("messages") or [{}]
+            parts = messages[-1].get("content") or []
+            image_count = sum(1 for part in parts if isinstance(part, dict) and part.get("type") == "image_url")
+
+            if status == 429:
+                with self._lock:
+                    self._counts["rate_limited"] += 1
+                return 429, {"error": {"code": "RateLimitExceeded", "message": "too many requests"}}, \
+                    self.retry_after
+            # 错误响应也要等待一段时间，模拟服务端处理后失败
+            delay = self.latency + rng.uniform(-self.latency_jitter, self.latency_jitter)
+            delay += self.per_image_latency * image_count
+            time.sleep(max(0.0, delay))
+            if status is not None:
+                with self._lock:
+                    self._counts["errors"] += 1
+                return status, {"error": {"code": "InternalServiceError", "message": "mock failure"}}, \
+                    self.retry_after if status == 503 else None
+
+            with self._lock:
+                self._counts["ok"] += 1
+                self._counts["images"] += image_count
+            return 200, self._completion(rng, body, image_count), None
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                status, payload, retry_after = server._handle(self)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                if retry_after is not None:
+                    self.send_header("Retry-After", str(retry_after))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    """单独运行模拟服务，供手动测试"""
+    with MockOCRServer(port=8765) as server:
+        print(f"模拟OCR服务已启动：endpoint={server.endpoint}，base_url={server.base_url}")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"统计：{server.stats()}")
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+按内容寻址的OCR结果缓存
+以渲染后页图像的哈希 + 模型/提示词/max_tokens 作为键，跨书籍、跨运行共享，
+空白页、丛书扉页、同一本书的不同版本都只需要识别一次
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 缓存放在所有书籍目录之外
+DEFAULT_CACHE_DIR = "data/.ocr_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# 超出上限时一次淘汰到上限的这个比例，避免此后每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+
+class OCRCache:
+    """基于SQLite的OCR结果缓存，超过容量上限时按最近最少使用淘汰"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存中文本总字节数上限
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_path = os.path.join(cache_dir, "ocr_cache.sqlite3")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.cache_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_cache ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON ocr_cache(last_access)")
+        self._conn.commit()
+        # 缓存文本总字节数，只在打开和淘汰时统计全表，写入和删除时增量维护
+        self._total = self._sum_sizes()
+
+    @staticmethod
+    def make_key(image_bytes, model, prompt, max_tokens):
+        """由页图像内容和识别参数生成缓存键"""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        params = json.dumps([model, prompt, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(f"{digest}|{params}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """命中时返回识别文字并刷新访问时间，否则返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE ocr_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, text):
+        """写入一条识别结果，必要时淘汰最久未使用的条目"""
+        if not text:
+            return
+        size = len(text.encode('utf-8'))
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, text, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time())
+            )
+            self._total += size - (row[0] if row else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _sum_sizes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+
+    def _evict(self):
+        # 其他进程可能也写入了同一个缓存，淘汰前重新统计一次总量
+        self._total = self._sum_sizes()
+        if self._total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_access"):
+            if self._total <= target:
+                break
+            evicted.append((key,))
+            self._total -= size
+        self._conn.executemany("DELETE FROM ocr_cache WHERE key = ?", evicted)
+        print(f"OCR缓存超出容量，已淘汰{len(evicted)}条")
+
+    def stats(self):
+        """返回命中/未命中次数与当前条目数"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
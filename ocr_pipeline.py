@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+流式处理管线
+各阶段之间通过有界队列连接，上游每产出一项下游即可开始处理，
+渲染（CPU）与OCR请求（网络）可以相互重叠，内存中同时存在的页数受队列长度限制
+"""
+
+import queue
+import threading
+
+# 队列结束标记
+_END = object()
+
+
+class PipelineStage:
+    """管线中的一个处理阶段"""
+
+    def __init__(self, name, func, workers=1, queue_size=4, flush=None):
+        """
+        Args:
+            name: 阶段名称，用于日志
+            func: 处理函数，接收上游的一项，返回交给下游的一项；返回None表示丢弃（或暂存）
+            workers: 该阶段的工作线程数
+            queue_size: 该阶段输入队列的长度上限
+            flush: 上游结束后调用一次，返回仍需交给下游的项（例如攒批阶段未满的最后一批）
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.flush = flush
+
+
+class StreamingPipeline:
+    """由一个数据源和若干阶段组成的流式管线"""
+
+    def __init__(self, source, stages):
+        """
+        Args:
+            source: 可迭代的数据源（通常是生成器），在独立线程中迭代
+            stages: PipelineStage列表，按顺序连接
+        """
+        self.source = source
+        self.stages = stages
+        self._stop = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def is_stopping(self):
+        """管线是否因错误正在停止，数据源中可能阻塞的等待应据此退出"""
+        return self._stop.is_set()
+
+    def _fail(self, stage_name, e):
+        """记录第一个异常并通知所有线程停止"""
+        with self._error_lock:
+            if self._error is None:
+                print(f"管线阶段[{stage_name}]出现错误：{e}")
+                self._error = e
+        self._stop.set()
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _finish(self, index):
+        """向第index个阶段发送结束标记，每个工作线程一个"""
+        if index < len(self.stages):
+            for _ in range(self.stages[index].workers):
+                self._put(self.queues[index], _END)
+
+    def _run_source(self):
+        try:
+            for item in self.source:
+                if not self._put(self.queues[0], item):
+                    break
+        except Exception as e:
+            self._fail("source", e)
+        finally:
+            self._finish(0)
+
+    def _flush(self, index):
+        stage = self.stages[index]
+        if stage.flush is None or self._stop.is_set():
+            return
+        try:
+            for result in stage.flush():
+                if index + 1 < len(self.stages):
+                    self._put(self.queues[index + 1], result)
+        except Exception as e:
+            self._fail(stage.name, e)
+
+    def _run_stage(self, index):
+        stage = self.stages[index]
+        try:
+            while True:
+                item = self._get(self.queues[index])
+                if item is _END:
+                    break
+                result = stage.func(item)
+                if result is not None and index + 1 < len(self.stages):
+                    if not self._put(self.queues[index + 1], result):
+                        break
+        except Exception as e:
+            self._fail(stage.name, e)
+        finally:
+            # 本阶段最后一个退出的线程负责交出暂存的项并通知下游结束
+            with self._remaining_lock:
+                self._remaining[index] -= 1
+                last = self._remaining[index] == 0
+            if last:
+                self._flush(index)
+                self._finish(index + 1)
+
+    def run(self):
+        """运行管线直到数据源耗尽且所有阶段处理完毕，任一阶段出错时抛出该异常"""
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        self._remaining = [stage.workers for stage in self.stages]
+        self._remaining_lock = threading.Lock()
+
+        threads = [threading.Thread(target=self._run_source, name="pipeline-source", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._run_stage, args=(index,), name=f"pipeline-{stage.name}-{n}", daemon=True
+                ))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+页面分类
+与 test_ocr.test_pdf_info 的判断一致：文字少于10个且含图像的页是扫描页，需要OCR；
+文字少于10个、没有图像但有矢量绘制（矢量化的字形、图形）的页同样需要OCR；
+什么都没有的页是空白页；其余页已有可用的文字层，直接通过PyMuPDF提取，混合PDF只对扫描页付出OCR成本
+"""
+
+PAGE_KIND_TEXT = "text"
+PAGE_KIND_IMAGE = "image"
+PAGE_KIND_BLANK = "blank"
+
+# 少于该字符数且含图像的页视为扫描页
+MIN_TEXT_CHARS = 10
+
+
+def classify_page(page, min_chars=MIN_TEXT_CHARS):
+    """返回(页类型, 文字层文本)；需OCR的页文本为None，空白页文本为空字符串"""
+    text = page.get_text().strip()
+    if len(text) >= min_chars:
+        return PAGE_KIND_TEXT, text
+    # 文字很少时，页面内容可能在图像或矢量绘制中；get_drawings较慢，只在没有图像时才调用
+    if len(page.get_images()) > 0 or len(page.get_drawings()) > 0:
+        return PAGE_KIND_IMAGE, None
+    if not text:
+        return PAGE_KIND_BLANK, ""
+    return PAGE_KIND_TEXT, text
+
+
+def classify_pages(doc, page_indexes=None, min_chars=MIN_TEXT_CHARS):
+    """
+    对文档中的页逐一分类
+
+    Args:
+        doc: 已打开的PyMuPDF文档
+        page_indexes: 需要分类的页码（从1开始），为None时分类全部页
+        min_chars: 文字层的最少字符数
+    Returns:
+        {页码: 文字层文本}，只包含有文字层的页和空白页，空白页的文本为空字符串
+    """
+    if page_indexes is None:
+        page_indexes = range(1, len(doc) + 1)
+
+    text_pages = {}
+    image_count = 0
+    blank_count = 0
+    for page_index in page_indexes:
+        kind, text = classify_page(doc[page_index - 1], min_chars)
+        if kind == PAGE_KIND_IMAGE:
+            image_count += 1
+            continue
+        text_pages[page_index] = text
+        if kind == PAGE_KIND_BLANK:
+            blank_count += 1
+
+    print(f"页面分类完成：文字层页{len(text_pages) - blank_count}页，空白页{blank_count}页，"
+          f"需OCR的扫描页{image_count}页")
+    return text_pages
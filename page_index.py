@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+书库索引的公共部分
+全文索引与向量索引都按page_id缓冲新加入的页、攒够一定页数再批量写出，
+崩溃恢复时按manifest记录的长度截断数据文件，并从各书的 _book_data_no_img.json 建立整个书库的索引
+"""
+
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+
+
+class BufferedPageIndex(ABC):
+    """按page_id缓冲新加入的页，攒够auto_commit_pages页自动写出；子类设置auto_commit_pages并实现commit()"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._pending = {}
+
+    def add_page(self, page_data):
+        """加入（或更新）一页，先缓冲在内存中，攒够auto_commit_pages页自动写出；识别失败的页不加入"""
+        text = page_data.get("text")
+        if not text or not text.strip():
+            return
+        with self._lock:
+            self._pending[page_data["page_id"]] = {
+                "page_id": page_data["page_id"],
+                "pdf_name": page_data.get("pdf_name"),
+                "page_index": page_data.get("page_index"),
+                "text": text,
+            }
+            if len(self._pending) >= self.auto_commit_pages:
+                self.commit()
+
+    def add_pages(self, page_data_list):
+        """批量加入页并立即写出"""
+        with self._lock:
+            for page_data in page_data_list:
+                self.add_page(page_data)
+            self.commit()
+
+    @abstractmethod
+    def commit(self):
+        """把缓冲的页写出，返回写入的条目数"""
+
+
+def truncate_file(path, size):
+    """文件比manifest记录的长度长时截断，丢弃上次崩溃时写了一半的内容"""
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+
+
+def add_library(index, root="data"):
+    """把root下所有书的 _book_data_no_img.json 加入索引，未变化的页由索引自行跳过"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename.endswith("_book_data_no_img.json"):
+                with open(os.path.join(dirpath, filename), 'r', encoding='utf-8') as f:
+                    index.add_pages(json.load(f))
+    return index
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+按页追加写入的书籍数据日志
+每识别完一页只追加一行JSON并fsync，不再整本重写；
+转换结束后再压缩成原有的 _book_data.json / _book_data_no_img.json 格式
+"""
+
+import json
+import os
+import threading
+
+from book_pages import page_status
+
+# _book_data_no_img.json 中保留的字段
+NO_IMG_FIELDS = ("page_index", "text", "pdf_name", "page_id")
+
+
+def atomic_write_json(path, data):
+    """先写临时文件并fsync，再原子替换目标文件，崩溃时不会损坏已有的文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JSONArrayWriter:
+    """
+    逐项写出JSON数组，内存中只保留当前一项；输出与atomic_write_json逐字节相同
+
+    先写临时文件，commit时fsync并原子替换目标文件
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self._file = open(self.tmp_path, 'wb')
+        self._file.write(b"[")
+        self._offset = 1
+        self.count = 0
+
+    def append(self, item):
+        """写出一项，返回该项在文件中的(字节偏移, 字节长度)"""
+        data = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ").encode('utf-8')
+        prefix = b",\n  " if self.count else b"\n  "
+        self._file.write(prefix)
+        self._file.write(data)
+        offset = self._offset + len(prefix)
+        self._offset = offset + len(data)
+        self.count += 1
+        return offset, len(data)
+
+    def commit(self):
+        self._file.write(b"\n]" if self.count else b"]")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class PageJournal:
+    """JSONL格式的页数据日志，一行一页，同一页码以最后一次写入为准"""
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self._lock = threading.Lock()
+        self._tail_checked = False
+
+    def _repair_tail(self):
+        """上次崩溃时若留下写了一半的行，先补一个换行，避免与新记录粘在一起"""
+        self._tail_checked = True
+        if not os.path.exists(self.journal_path) or os.path.getsize(self.journal_path) == 0:
+            return
+        with open(self.journal_path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def append(self, page_data):
+        """追加一页数据，返回前已落盘"""
+        line = json.dumps(page_data, ensure_ascii=False) + "\n"
+        with self._lock:
+            if not self._tail_checked:
+                self._repair_tail()
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read(self):
+        """按写入顺序读取日志中的所有页数据，忽略崩溃时写了一半的行"""
+        if not os.path.exists(self.journal_path):
+            return []
+
+        records = []
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line_num, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"警告: 日志第{line_num}行不完整，已忽略: {self.journal_path}")
+        return records
+
+    def compact(self, page_data_list, book_data_path, no_img_path=None):
+        """
+        将日志合并进完整的书籍数据并原子写出，随后清空日志
+
+        逐页写出，page_data_list可以是按页码排序的惰性序列（如LazyBookPages），整本书不必同时在内存中
+        Args:
+            page_data_list: 按页码排序的已有页数据（通常来自上一次的 _book_data.json）
+            book_data_path: _book_data.json 路径
+            no_img_path: _book_data_no_img.json 路径，为None时不生成
+        Returns:
+            每页在 _book_data.json 中的位置：[(页码, 字节偏移, 字节长度, 页状态)]
+        """
+        with self._lock:
+            overrides = {int(page_data["page_index"]): page_data for page_data in self.read()}
+            writers = [JSONArrayWriter(book_data_path)]
+            if no_img_path:
+                writers.append(JSONArrayWriter(no_img_path))
+            entries = []
+            try:
+                for page_data in _merge_pages(page_data_list, overrides):
+                    offset, length = writers[0].append(page_data)
+                    entries.append((int(page_data["page_index"]), offset, length, page_status(page_data)))
+                    if no_img_path:
+                        writers[1].append({field: page_data.get(field) for field in NO_IMG_FIELDS})
+            except BaseException:
+                for writer in writers:
+                    writer.abort()
+                raise
+            for writer in writers:
+                writer.commit()
+
+            # 两个文件都已落盘后再清空日志，中途崩溃时重放日志结果不变
+            self._clear()
+        return entries
+
+    def clear(self):
+        """日志中的页已写入其他存储后清空日志"""
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._tail_checked = True
+
+
+def _merge_pages(page_data_list, overrides):
+    """按页码归并已有页数据和日志中的页，日志中的页优先"""
+    journal_indexes = sorted(overrides)
+    i = 0
+    for page_data in page_data_list:
+        page_index = int(page_data["page_index"])
+        while i < len(journal_indexes) and journal_indexes[i] < page_index:
+            yield overrides[journal_indexes[i]]
+            i += 1
+        if i < len(journal_indexes) and journal_indexes[i] == page_index:
+            yield overrides[page_index]
+            i += 1
+        else:
+            yield page_data
+    for page_index in journal_indexes[i:]:
+        yield overrides[page_index]
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+OCR前的空白页与重复页筛查
+在渲染结果上用NumPy统计墨迹和感知哈希：真正空白的页直接记为空文本；
+同一本书中感知哈希相近、且二值化墨迹掩码逐格比较也相同的页（衬页、隔页、图版背面等）复用先识别的那一页，不再调用API
+"""
+
+import threading
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from image_encoding import raw_to_image
+
+SCREEN_NEW = "new"
+SCREEN_BLANK = "blank"
+SCREEN_DUPLICATE = "duplicate"
+
+
+def page_fingerprint(raw, hash_size=32, cell_size=4):
+    """
+    计算页面的墨迹像素数、差值哈希(dHash)和墨迹掩码
+
+    墨迹在原分辨率上统计，小字号的献词、题署等稀疏页面不会因缩小而丢失笔画
+    Args:
+        raw: pixmap_to_raw 的返回值
+        hash_size: dHash边长
+        cell_size: 墨迹掩码的格子边长，格子内有任一墨迹像素即记为墨迹
+    Returns:
+        (墨迹像素数, 纸张底色亮度, 哈希整数, 墨迹掩码)
+    """
+    img = raw_to_image(raw).convert("L")
+    gray = np.asarray(img)
+
+    # 去掉四周5%的边缘，避免扫描黑边被当作墨迹
+    h, w = gray.shape
+    margin_h, margin_w = h // 20, w // 20
+    body = gray[margin_h:h - margin_h, margin_w:w - margin_w]
+
+    # 以亮部作为纸张底色，明显比底色暗的像素才算墨迹，透印和噪点不计入；底色只需抽样估计
+    background = float(np.percentile(body[::4, ::4], 90))
+    dark = body < background - 60
+    ink_pixels = int(np.count_nonzero(dark))
+
+    # 按格子做最大池化得到二值掩码，细笔画也会保留下来
+    rows, cols = dark.shape[0] // cell_size, dark.shape[1] // cell_size
+    mask = dark[:rows * cell_size, :cols * cell_size].reshape(rows, cell_size, cols, cell_size).any(axis=(1, 3))
+
+    hash_img = img.resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = np.asarray(hash_img, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    fingerprint = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return ink_pixels, background, fingerprint, mask
+
+
+class PageScreener:
+    """筛查一本书的页，记录节省的API调用次数；可在多个线程中同时调用，重复页指向先完成筛查的那一页"""
+
+    def __init__(self, blank_max_ink_pixels=8, min_paper_brightness=128, max_hash_distance=12,
+                 max_mask_diff=0.02, hash_size=32, cell_size=4):
+        """
+        Args:
+            blank_max_ink_pixels: 原分辨率下墨迹像素不超过该数才视为空白页，只接受真正空白的页
+            min_paper_brightness: 底色不低于该亮度才可能是空白页，深色封面等低对比度页面不会被误判
+            max_hash_distance: 哈希的汉明距离不超过该值的页才作为重复页候选
+            max_mask_diff: 候选页与原页的墨迹掩码中不同的格子数不超过墨迹格子数的该比例，才视为重复页
+            hash_size: dHash边长，哈希共hash_size*hash_size位
+            cell_size: 墨迹掩码的格子边长
+        """
+        self.blank_max_ink_pixels = blank_max_ink_pixels
+        self.min_paper_brightness = min_paper_brightness
+        self.max_hash_distance = max_hash_distance
+        self.max_mask_diff = max_mask_diff
+        self.hash_size = hash_size
+        self.cell_size = cell_size
+        # 已见过的页：(墨迹格子数, 哈希, 页码, 掩码形状, 压缩后的掩码)；文字页的掩码大多是空白，压缩后很小
+        self._seen = []
+        self.blank_count = 0
+        self.duplicate_count = 0
+        # 计算指纹不加锁，只有与已见页比较和登记时加锁
+        self._lock = threading.Lock()
+
+    def screen(self, page_index, raw):
+        """
+        筛查一页
+
+        Returns:
+            (SCREEN_NEW / SCREEN_BLANK / SCREEN_DUPLICATE, 重复页对应的原页码或None)
+        """
+        ink_pixels, background, fingerprint, mask = page_fingerprint(raw, self.hash_size, self.cell_size)
+        if background >= self.min_paper_brightness and ink_pixels <= self.blank_max_ink_pixels:
+            with self._lock:
+                self.blank_count += 1
+            return SCREEN_BLANK, None
+
+        ink_cells = int(np.count_nonzero(mask))
+        packed = zlib.compress(np.packbits(mask).tobytes(), 1)
+        with self._lock:
+            for seen_cells, seen_fingerprint, seen_page_index, seen_shape, seen_mask in self._seen:
+                if (fingerprint ^ seen_fingerprint).bit_count() > self.max_hash_distance:
+                    continue
+                # 不同的格子数至少是墨迹格子数之差，先用它排除，再逐格比较
+                allowed = self.max_mask_diff * max(ink_cells, seen_cells)
+                if abs(ink_cells - seen_cells) > allowed or seen_shape != mask.shape:
+                    continue
+                seen_bits = np.unpackbits(np.frombuffer(zlib.decompress(seen_mask), dtype=np.uint8),
+                                          count=mask.size)
+                if np.count_nonzero(seen_bits.reshape(mask.shape).view(bool) != mask) > allowed:
+                    continue
+                self.duplicate_count += 1
+                return SCREEN_DUPLICATE, seen_page_index
+
+            self._seen.append((ink_cells, fingerprint, page_index, mask.shape, packed))
+        return SCREEN_NEW, None
+
+    @property
+    def saved_calls(self):
+        return self.blank_count + self.duplicate_count
+
+    def report(self):
+        """打印并返回筛查统计"""
+        print(f"空白页{self.blank_count}页，重复页{self.duplicate_count}页，共节省{self.saved_calls}次API调用")
+        return {
+            "blank_pages": self.blank_count,
+            "duplicate_pages": self.duplicate_count,
+            "saved_calls": self.saved_calls,
+        }
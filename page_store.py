@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+书籍页存储
+每本书一个SQLite文件，页文字和元数据存在按页码索引的表中，页图像以编码后的原始字节单独存为BLOB，
+不再base64后塞进一个巨大的JSON；读取单页文字或图像都是一次按主键的查询。
+启用页存储时它是转换器的主存储，续跑从这里读取；原有的 _book_data.json / _book_data_no_img.json 由它按需导出
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+
+from book_pages import PAGE_DONE, PAGE_MISSING, BookPages, page_status
+from page_journal import NO_IMG_FIELDS, JSONArrayWriter
+
+# 单独成列的字段，其余字段以JSON存在extra列
+_COLUMNS = ("page_index", "page_id", "pdf_name", "text")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_index INTEGER PRIMARY KEY,
+    page_id TEXT,
+    pdf_name TEXT,
+    text TEXT,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS images (
+    page_index INTEGER PRIMARY KEY,
+    mime TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+
+class PageStore:
+    """一本书的页存储，可在多个线程中使用"""
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: SQLite文件路径，不存在时创建
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL下写入只追加日志；synchronous=FULL保证每页提交返回前已落盘，与页日志一致
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _row_to_page_data(row):
+        page_index, page_id, pdf_name, text, extra = row
+        extra = json.loads(extra)
+        # 按原JSON的字段顺序组装
+        page_data = {"page_index": page_index}
+        if "image_path" in extra:
+            page_data["image_path"] = extra.pop("image_path")
+        page_data.update({"text": text, "pdf_name": pdf_name, "page_id": page_id})
+        page_data.update(extra)
+        return page_data
+
+    def put(self, page_data, image_bytes=None, image_mime=None):
+        """
+        写入（或替换）一页数据
+
+        Args:
+            page_data: 页数据，其中的image_base64会解码后存为图像
+            image_bytes: 编码后的页图像，为None时保留该页已存的图像
+            image_mime: 图像的MIME类型
+        """
+        self.put_many([(page_data, image_bytes, image_mime)])
+
+    def put_many(self, pages):
+        """在一个事务中写入多页，pages为(page_data, image_bytes, image_mime)的列表"""
+        with self._lock, self._conn:
+            for page_data, image_bytes, image_mime in pages:
+                extra = {k: v for k, v in page_data.items() if k not in _COLUMNS}
+                image_base64 = extra.pop("image_base64", None)
+                if image_bytes is None and image_base64:
+                    image_bytes = base64.b64decode(image_base64)
+                    image_mime = image_mime or "image/png"
+                page_index = int(page_data["page_index"])
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pages (page_index, page_id, pdf_name, text, extra) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (page_index, page_data.get("page_id"), page_data.get("pdf_name"), page_data.get("text"),
+                     json.dumps(extra, ensure_ascii=False)),
+                )
+                if image_bytes is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO images (page_index, mime, data) VALUES (?, ?, ?)",
+                        (page_index, image_mime or "application/octet-stream", sqlite3.Binary(image_bytes)),
+                    )
+
+    def get(self, page_index):
+        """返回该页数据（不含图像），不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_index, page_id, pdf_name, text, extra FROM pages WHERE page_index = ?",
+                (int(page_index),),
+            ).fetchone()
+        return self._row_to_page_data(row) if row else None
+
+    def text(self, page_index):
+        """只读取该页文字"""
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM pages WHERE page_index = ?", (int(page_index),)).fetchone()
+        return row[0] if row else None
+
+    def image(self, page_index):
+        """返回该页图像(字节, MIME类型)，没有存图像时返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT data, mime FROM images WHERE page_index = ?",
+                                     (int(page_index),)).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+
+    def page_indexes(self):
+        """按顺序返回已存储的页码"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT page_index FROM pages ORDER BY page_index")]
+
+    def iter_pages(self, with_images=False):
+        """
+        按页码顺序逐页返回页数据，不一次性读入整本书
+
+        Args:
+            with_images: 为True时返回(page_data, (图像字节, MIME类型)或None)
+        """
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT page_index, page_id, pdf_name, text, extra FROM pages "
+                    "WHERE page_index > ? ORDER BY page_index LIMIT 256",
+                    (last,),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                page_data = self._row_to_page_data(row)
+                yield (page_data, self.image(row[0])) if with_images else page_data
+            last = rows[-1][0]
+
+    def statuses(self):
+        """返回{页码: 页状态}；只有文字为空的页才读取extra判断是否为空白页，不读取页文字"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page_index, CASE WHEN text IS NULL OR text IN ('', '<UNK>') THEN extra END FROM pages"
+            ).fetchall()
+        return {page_index: PAGE_DONE if extra is None else page_status({"text": None, **json.loads(extra)})
+                for page_index, extra in rows}
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def __contains__(self, page_index):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM pages WHERE page_index = ?",
+                                      (int(page_index),)).fetchone() is not None
+
+    def export_json(self, book_data_path, no_img_path=None, include_images=True):
+        """
+        导出为原有的JSON格式，逐页写出，内存中只保留一页
+
+        Args:
+            book_data_path: _book_data.json 路径
+            no_img_path: _book_data_no_img.json 路径，为None时不导出
+            include_images: 有图像的页是否写入image_base64字段
+        Returns:
+            导出的页数
+        """
+        writers = [JSONArrayWriter(book_data_path)]
+        if no_img_path:
+            writers.append(JSONArrayWriter(no_img_path))
+        try:
+            for item in self.iter_pages(with_images=include_images):
+                page_data, image = item if include_images else (item, None)
+                if no_img_path:
+                    writers[1].append({field: page_data.get(field) for field in NO_IMG_FIELDS})
+                if image is not None:
+                    page_data = _with_image_base64(page_data, image[0])
+                writers[0].append(page_data)
+        except BaseException:
+            for writer in writers:
+                writer.abort()
+            raise
+        for writer in writers:
+            writer.commit()
+        return writers[0].count
+
+    def import_json(self, book_data_path):
+        """导入原有格式的 _book_data.json，image_base64解码后存为图像，返回导入的页数"""
+        with open(book_data_path, 'r', encoding='utf-8') as f:
+            page_data_list = json.load(f)
+        self.put_many([(page_data, None, None) for page_data in page_data_list])
+        return len(page_data_list)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class StoredBookPages(BookPages):
+    """
+    以PageStore为数据源的BookPages
+
+    内存中只有每页的状态；get时按主键读取该页，upsert直接写入页存储
+    """
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self._status = store.statuses()
+
+    def upsert(self, page_data, image_bytes=None, image_mime=None):
+        """写入（或替换）一页，可连同页图像一起写入"""
+        self.store.put(page_data, image_bytes, image_mime)
+        self._status[int(page_data["page_index"])] = page_status(page_data)
+
+    def get(self, page_index):
+        return self.store.get(page_index)
+
+    def status(self, page_index):
+        """返回该页状态，只查内存中的状态，不读取页内容"""
+        return self._status.get(int(page_index), PAGE_MISSING)
+
+    def page_indexes(self):
+        return sorted(self._status)
+
+    def __iter__(self):
+        return self.store.iter_pages()
+
+    def __len__(self):
+        return len(self._status)
+
+    def __contains__(self, page_index):
+        return int(page_index) in self._status
+
+
+def _with_image_base64(page_data, image_bytes):
+    """在image_path之后插入image_base64字段，与原JSON的字段顺序一致"""
+    result = {}
+    for key, value in page_data.items():
+        if key == "text" and "image_base64" not in result:
+            result["image_base64"] = base64.b64encode(image_bytes).decode('utf-8')
+        result[key] = value
+    return result
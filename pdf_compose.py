@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+分片并行生成文字版PDF
+按页码范围把书切成若干分片，各分片在独立进程中排版，再用PyMuPDF的insert_pdf按顺序合并；
+分片按其文字和排版参数的哈希缓存，修正少数页后重新导出只需重排有变化的分片；
+不同排版参数的分片放在各自的子目录中，两种转换器共用同一个缓存目录时不会互相清理
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pymupdf as fitz
+from reportlab.pdfbase import pdfmetrics
+
+from text_layout import TextLayout, draw_text_pdf, register_cjk_font
+
+# 排版逻辑变化时递增，使旧的分片缓存失效
+LAYOUT_VERSION = 2
+DEFAULT_SHARD_SIZE = 50
+SHARD_SUFFIX = ".shard.pdf"
+
+
+def _layout_from_options(layout_options):
+    """在当前进程中注册字体并按参数构造TextLayout"""
+    return TextLayout(register_cjk_font(), **layout_options)
+
+
+def _font_fingerprint():
+    """实际使用的字体：字体名加上字体文件的路径、大小和修改时间，换字体后旧分片随之失效"""
+    font_name = register_cjk_font()
+    font_path = getattr(getattr(pdfmetrics.getFont(font_name), 'face', None), 'filename', None)
+    if not font_path or not os.path.exists(font_path):
+        return {"name": font_name}
+    stat = os.stat(font_path)
+    return {"name": font_name, "path": os.path.abspath(font_path), "size": stat.st_size,
+            "mtime": stat.st_mtime_ns}
+
+
+def layout_key(layout_options):
+    """排版参数的哈希，作为分片缓存的子目录名"""
+    payload = json.dumps(
+        {"version": LAYOUT_VERSION, "layout": layout_options, "font": _font_fingerprint()},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def shard_key(texts, layout_options):
+    """分片缓存键：分片内各页文字与排版参数的sha256"""
+    payload = json.dumps(
+        {"version": LAYOUT_VERSION, "layout": layout_options, "font": _font_fingerprint(), "texts": texts},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _render_shard(shard_path, texts, layout_options):
+    """排版一个分片并原子地写入缓存目录（在工作进程中执行）"""
+    tmp_path = f"{shard_path}.{os.getpid()}.tmp"
+    draw_text_pdf(tmp_path, texts, _layout_from_options(layout_options))
+    os.replace(tmp_path, shard_path)
+    return shard_path
+
+
+def compose_text_pdf(output_path, texts, shard_dir, layout_options=None, shard_size=DEFAULT_SHARD_SIZE,
+                     processes=None, metadata=None):
+    """
+    分片并行排版每页识别文字并合并为一个PDF
+
+    Args:
+        output_path: 输出PDF路径
+        texts: 每页的识别文字
+        shard_dir: 分片缓存目录，分片按排版参数存放在子目录中，同一排版参数下不再被引用的旧分片会被清理
+        layout_options: 传给TextLayout的参数，例如{"font_size": 14, "line_height": 24}
+        shard_size: 每个分片包含的源页数
+        processes: 排版进程数，None表示CPU核数，1表示在当前进程中排版
+        metadata: PDF元数据，例如{"title": ..., "author": ..., "subject": ...}
+    Returns:
+        输出的总页数
+    """
+    layout_options = dict(layout_options or {})
+    texts = list(texts)
+    if not texts:
+        draw_text_pdf(output_path, texts, _layout_from_options(layout_options))
+        with fitz.open(output_path) as doc:
+            return len(doc)
+
+    layout_dir = os.path.join(shard_dir, layout_key(layout_options))
+    os.makedirs(layout_dir, exist_ok=True)
+    shard_size = max(1, int(shard_size))
+    shards = []
+    missing = []
+    for start in range(0, len(texts), shard_size):
+        shard_texts = texts[start:start + shard_size]
+        shard_path = os.path.join(layout_dir, shard_key(shard_texts, layout_options) + SHARD_SUFFIX)
+        shards.append(shard_path)
+        if not os.path.exists(shard_path):
+            missing.append((shard_path, shard_texts))
+
+    print(f"文字版PDF共{len(shards)}个分片，需重新排版{len(missing)}个")
+    processes = max(1, int(processes or os.cpu_count() or 1))
+    if len(missing) > 1 and processes > 1:
+        with ProcessPoolExecutor(max_workers=min(processes, len(missing))) as executor:
+            futures = [executor.submit(_render_shard, path, shard_texts, layout_options)
+                       for path, shard_texts in missing]
+            for future in futures:
+                future.result()
+    else:
+        for path, shard_texts in missing:
+            _render_shard(path, shard_texts, layout_options)
+
+    out = fitz.open()
+    try:
+        for shard_path in shards:
+            with fitz.open(shard_path) as shard:
+                out.insert_pdf(shard)
+        if metadata:
+            out.set_metadata({**out.metadata, **metadata})
+        tmp_path = f"{output_path}.tmp"
+        out.save(tmp_path, garbage=3, deflate=True)
+        page_count = len(out)
+    finally:
+        out.close()
+    os.replace(tmp_path, output_path)
+
+    _prune_shards(layout_dir, set(shards))
+    return page_count
+
+
+def _prune_shards(shard_dir, keep):
+    """删除目录中本次未用到的分片，只处理该目录本身，不进入其他排版参数的子目录"""
+    keep = {os.path.abspath(path) for path in keep}
+    for name in os.listdir(shard_dir):
+        path = os.path.abspath(os.path.join(shard_dir, name))
+        if name.endswith(SHARD_SUFFIX) and path not in keep:
+            os.remove(path)
@@ -11,21 +11,34 @@ import os
 import sys
 import fitz  # PyMuPDF
 import pytesseract
-from PIL import Image
 import cv2
 import numpy as np
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import tempfile
-import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ocr_cache import OCRCache
+from page_classifier import classify_pages
+from pdf_compose import compose_text_pdf
+from render_policy import RenderPolicy
+from run_metrics import DISABLED, RunMetrics
+from searchable_pdf import OUTPUT_MODES, OUTPUT_SEARCHABLE, OUTPUT_TEXT, write_searchable_pdf
+
+try:
+    # 安装了tesserocr时在进程内调用libtesseract，不经过临时图片文件和tesseract子进程
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Tesseract识别参数，同时参与OCR缓存键的计算
+TESSERACT_PSM = 6
+TESSERACT_WHITELIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz，。：、；！？""（）【】《》〈〉""·—…¥£€'
+TESSERACT_CONFIG = f'--psm {TESSERACT_PSM} -c tessedit_char_whitelist={TESSERACT_WHITELIST}'
 
 
 class PDFOCRConverter:
     """PDF OCR转换器类"""
     
-    def __init__(self, input_pdf_path, output_pdf_path=None, lang='chi_sim+eng'):
+    def __init__(self, input_pdf_path, output_pdf_path=None, lang='chi_sim+eng', use_cache=True,
+                 render_policy=None, processes=1, use_text_layer=True, output_mode=OUTPUT_TEXT, metrics=None):
         """
         初始化转换器
         
@@ -33,165 +46,244 @@ class PDFOCRConverter:
             input_pdf_path: 输入PDF文件路径
             output_pdf_path: 输出PDF文件路径，如果为None则自动生成
             lang: OCR语言，中文简体+英文
+            use_cache: 是否启用跨书籍共享的OCR结果缓存
+            render_policy: 自定义的RenderPolicy，为None时按144 DPI和像素预算逐页决定缩放倍数
+            processes: OCR进程数，大于1时每个进程独立渲染、预处理并识别页面
+            use_text_layer: 有可用文字层的页直接提取文字，不调用OCR
+            output_mode: "text"重新排版为文字版PDF，"searchable"在原扫描页上叠加不可见文字层
+            metrics: RunMetrics，记录各阶段耗时，多进程时由工作进程记录后交回主进程
         """
         self.input_pdf_path = input_pdf_path
         self.output_pdf_path = output_pdf_path or self._generate_output_path()
         self.lang = lang
-        
-        # 创建临时目录
-        self.temp_dir = tempfile.mkdtemp()
+        self.ocr_cache = OCRCache() if use_cache else None
+        self.render_policy = render_policy or RenderPolicy(target_dpi=144)
+        self.processes = max(1, int(processes or os.cpu_count() or 1))
+        self.use_text_layer = use_text_layer
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"不支持的输出方式：{output_mode}")
+        self.output_mode = output_mode
+        self.metrics = metrics or DISABLED
+        # tesserocr的识别引擎，首次识别时创建，同一进程内复用
+        self._tess_api = None
         
     def _generate_output_path(self):
         """生成输出文件路径"""
         base_name = os.path.splitext(os.path.basename(self.input_pdf_path))[0]
         return f"{base_name}_ocr.pdf"
     
-    def _preprocess_image(self, image_path):
-        """预处理图像以提高OCR准确性"""
-        # 读取图像
-        img = cv2.imread(image_path)
-        
-        # 转换为灰度图
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    def _preprocess_image(self, image):
+        """预处理图像以提高OCR准确性，输入输出都是内存中的数组"""
+        # 转换为灰度图，灰度渲染的页面本身就是单通道
+        if image.shape[2] == 1:
+            gray = image[:, :, 0]
+        else:
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
         
         # 应用高斯模糊去噪
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
         
-        # 自适应阈值二值化
-        thresh = cv2.adaptiveThreshold(
-            blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+        # 自适应阈值二值化，结果直接写在bytearray上，识别时整块交给tesserocr而不再拷贝
+        thresh = np.ndarray(blurred.shape, dtype=np.uint8, buffer=bytearray(blurred.size))
+        cv2.adaptiveThreshold(
+            blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2, dst=thresh
         )
         
-        # 保存预处理后的图像
-        temp_path = os.path.join(self.temp_dir, f"preprocessed_{os.path.basename(image_path)}")
-        cv2.imwrite(temp_path, thresh)
+        return thresh
+    
+    def _ocr_page(self, page):
+        """渲染并识别单页，渲染 -> 灰度 -> 模糊 -> 二值化 -> Tesseract 全程在内存中完成"""
+        page_index = page.number + 1
+        # 按页面尺寸决定分辨率，原图为黑白/灰度时直接灰度渲染
+        with self.metrics.stage("render", page_index):
+            pix = self.render_policy.render(page)
         
-        return temp_path
+        # 直接在pixmap的像素缓冲区上构造数组，不拷贝像素；pix需在识别结束前保持存活
+        image = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        text = self._perform_ocr(image, page_index)
+        del image, pix
+        return text
+    
+    def _classify_pages(self, doc):
+        """返回{页码: 文字层文本}，未启用文字层时为空"""
+        if not self.use_text_layer:
+            return {}
+        return classify_pages(doc)
     
-    def _extract_images_from_pdf(self):
-        """从PDF中提取图像"""
+    def _ocr_pages_in_processes(self):
+        """用进程池并行识别所有扫描页，按页码顺序返回文字列表"""
         doc = fitz.open(self.input_pdf_path)
-        image_paths = []
+        page_count = len(doc)
+        text_pages = self._classify_pages(doc)
+        doc.close()
         
-        print(f"正在处理PDF，共{len(doc)}页...")
+        # 每个进程分到的OpenMP线程数，进程数已占满CPU时为1
+        omp_threads = max(1, (os.cpu_count() or 1) // self.processes)
+        print(f"正在处理PDF，共{page_count}页，使用{self.processes}个进程识别...")
         
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            
-            # 设置DPI为300以获得更好的OCR效果
-            mat = fitz.Matrix(2.0, 2.0)
-            pix = page.get_pixmap(matrix=mat)
-            
-            # 保存图像
-            img_path = os.path.join(self.temp_dir, f"page_{page_num + 1}.png")
-            pix.save(img_path)
-            image_paths.append(img_path)
-            
-            print(f"已提取第{page_num + 1}页图像")
+        texts = [""] * page_count
+        for page_index, text in text_pages.items():
+            texts[page_index - 1] = text
+            self.metrics.add("pages")
+        with ProcessPoolExecutor(
+            max_workers=self.processes,
+            initializer=_init_ocr_worker,
+            initargs=(self.input_pdf_path, self.lang, self.ocr_cache is not None,
+                      self.render_policy, omp_threads, self.metrics.enabled),
+        ) as executor:
+            futures = [
+                executor.submit(_ocr_page_in_worker, page_num)
+                for page_num in range(page_count) if page_num + 1 not in text_pages
+            ]
+            for future in as_completed(futures):
+                page_num, text, metrics_data = future.result()
+                texts[page_num] = text
+                self.metrics.merge(metrics_data)
+                self.metrics.add("pages")
+                print(f"第{page_num + 1}页识别完成，共{len(text)}个字符")
         
-        doc.close()
-        return image_paths
+        return texts
     
-    def _perform_ocr(self, image_path):
-        """对图像执行OCR识别"""
+    def _ocr_pages_serially(self):
+        """在当前进程中逐页识别，返回文字列表"""
+        doc = fitz.open(self.input_pdf_path)
+        print(f"正在处理PDF，共{len(doc)}页...")
+        text_pages = self._classify_pages(doc)
+        
+        texts = []
+        try:
+            for page_num in range(len(doc)):
+                if page_num + 1 in text_pages:
+                    print(f"第{page_num + 1}页使用PDF自带文字层")
+                    texts.append(text_pages[page_num + 1])
+                    self.metrics.add("pages")
+                    continue
+                
+                print(f"正在识别第{page_num + 1}页文字...")
+                text = self._ocr_page(doc[page_num])
+                texts.append(text)
+                self.metrics.add("pages")
+                print(f"第{page_num + 1}页识别完成，共{len(text)}个字符")
+        finally:
+            doc.close()
+        return texts
+    
+    def _perform_ocr(self, image, page_index=None):
+        """对页图像数组执行OCR识别"""
+        # 先查OCR缓存，相同页图像在相同参数下只识别一次
+        cache_key = None
+        if self.ocr_cache is not None:
+            cache_key = OCRCache.make_key(
+                memoryview(np.ascontiguousarray(image)), "tesseract", f"{self.lang}|{TESSERACT_CONFIG}", None
+            )
+            text = self.ocr_cache.get(cache_key)
+            if text is not None:
+                self.metrics.add("cache_hits")
+                return text
+
         # 预处理图像
-        preprocessed_path = self._preprocess_image(image_path)
+        with self.metrics.stage("preprocess", page_index):
+            preprocessed = self._preprocess_image(image)
         
         # 执行OCR
-        image = Image.open(preprocessed_path)
-        text = pytesseract.image_to_string(
-            image, 
-            lang=self.lang,
-            config='--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz，。：、；！？""''（）【】《》〈〉""''·—…¥£€'
-        )
+        with self.metrics.stage("tesseract", page_index):
+            text = self._recognize(preprocessed)
+        text = text.strip()
+
+        if cache_key is not None:
+            self.ocr_cache.put(cache_key, text)
+        return text
+    
+    def _recognize(self, image):
+        """识别二值化后的单通道图像；未安装tesserocr时退回pytesseract，后者每页要写临时图片并启动tesseract进程"""
+        if tesserocr is None:
+            return pytesseract.image_to_string(image, lang=self.lang, config=TESSERACT_CONFIG)
         
-        return text.strip()
+        if self._tess_api is None:
+            self._tess_api = tesserocr.PyTessBaseAPI(lang=self.lang, psm=TESSERACT_PSM)
+            self._tess_api.SetVariable("tessedit_char_whitelist", TESSERACT_WHITELIST)
+        # SetImageBytes只接受bytes/bytearray；_preprocess_image的结果本身就存放在bytearray中
+        data = image.base if isinstance(image.base, bytearray) else np.ascontiguousarray(image).tobytes()
+        self._tess_api.SetImageBytes(data, image.shape[1], image.shape[0], 1, image.shape[1])
+        return self._tess_api.GetUTF8Text()
     
-    def _create_text_pdf(self, texts, image_paths):
+    def close(self):
+        """释放tesserocr识别引擎"""
+        if self._tess_api is not None:
+            self._tess_api.End()
+            self._tess_api = None
+    
+    def _create_text_pdf(self, texts):
         """创建包含识别文字的新PDF"""
-        c = canvas.Canvas(self.output_pdf_path, pagesize=A4)
-        width, height = A4
-        
-        # 设置中文字体（使用系统默认字体）
-        try:
-            pdfmetrics.registerFont(TTFont('SimSun', '/System/Library/Fonts/PingFang.ttc'))
-            font_name = 'SimSun'
-        except:
-            font_name = 'Helvetica'
-        
-        for i, (text, img_path) in enumerate(zip(texts, image_paths)):
-            if i > 0:
-                c.showPage()
-            
-            # 设置字体和大小
-            c.setFont(font_name, 12)
-            
-            # 计算文本位置
-            x = 50
-            y = height - 50
-            line_height = 20
-            max_width = width - 100
-            
-            # 分割文本为多行
-            lines = text.split('\n')
-            
-            for line in lines:
-                if not line.strip():
-                    y -= line_height
-                    continue
-                
-                # 处理长行
-                words = line.split()
-                current_line = ""
-                
-                for word in words:
-                    test_line = current_line + " " + word if current_line else word
-                    if c.stringWidth(test_line, font_name, 12) < max_width:
-                        current_line = test_line
-                    else:
-                        if current_line:
-                            c.drawString(x, y, current_line)
-                            y -= line_height
-                        current_line = word
-                
-                if current_line:
-                    c.drawString(x, y, current_line)
-                    y -= line_height
-                
-                if y < 50:
-                    c.showPage()
-                    y = height - 50
-        
-        c.save()
+        # 按页码范围分片，与OCR共用进程数并行排版
+        base_name = os.path.splitext(os.path.basename(self.input_pdf_path))[0]
+        compose_text_pdf(
+            self.output_pdf_path, texts,
+            shard_dir=f"data/{base_name}/pdf_shards",
+            layout_options={"font_size": 12, "line_height": 20},
+            processes=self.processes,
+        )
     
     def convert(self):
         """执行完整的转换流程"""
+        self.metrics.start()
         try:
             print("开始PDF OCR转换...")
             
-            # 提取图像
-            image_paths = self._extract_images_from_pdf()
-            
             # 执行OCR
-            texts = []
-            for i, img_path in enumerate(image_paths):
-                print(f"正在识别第{i + 1}页文字...")
-                text = self._perform_ocr(img_path)
-                texts.append(text)
-                print(f"第{i + 1}页识别完成，共{len(text)}个字符")
+            if self.processes > 1:
+                texts = self._ocr_pages_in_processes()
+            else:
+                texts = self._ocr_pages_serially()
             
             # 创建新PDF
-            print("正在生成文字版PDF...")
-            self._create_text_pdf(texts, image_paths)
+            with self.metrics.stage("output"):
+                if self.output_mode == OUTPUT_SEARCHABLE:
+                    print("正在生成可搜索PDF...")
+                    write_searchable_pdf(self.input_pdf_path, self.output_pdf_path,
+                                         {i + 1: text for i, text in enumerate(texts)})
+                else:
+                    print("正在生成文字版PDF...")
+                    self._create_text_pdf(texts)
             
             print(f"转换完成！输出文件：{self.output_pdf_path}")
+            if self.ocr_cache is not None:
+                print(f"OCR缓存统计：{self.ocr_cache.stats()}")
             
         except Exception as e:
             print(f"转换过程中出现错误：{str(e)}")
             raise
         finally:
-            # 清理临时文件
-            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.close()
+            base_name = os.path.splitext(os.path.basename(self.input_pdf_path))[0]
+            self.metrics.write_reports(f"data/{base_name}/json", f"{base_name}_ocr_metrics")
+
+
+# 进程池中每个工作进程各自持有的转换器与PDF文档
+_worker_converter = None
+_worker_doc = None
+
+
+def _init_ocr_worker(input_pdf_path, lang, use_cache, render_policy, omp_threads, collect_metrics=False):
+    """工作进程初始化：限制OpenMP线程数，打开各自的PDF文档"""
+    global _worker_converter, _worker_doc
+    
+    # Tesseract与OpenCV默认按核数开线程，多进程时需要限制，避免相互争抢CPU
+    os.environ["OMP_THREAD_LIMIT"] = str(omp_threads)
+    os.environ["OMP_NUM_THREADS"] = str(omp_threads)
+    cv2.setNumThreads(omp_threads)
+    
+    _worker_converter = PDFOCRConverter(input_pdf_path, lang=lang, use_cache=use_cache,
+                                        render_policy=render_policy,
+                                        metrics=RunMetrics(name="worker") if collect_metrics else None)
+    _worker_doc = fitz.open(input_pdf_path)
+
+
+def _ocr_page_in_worker(page_num):
+    """在工作进程中渲染、预处理并识别一页，返回(页序号, 文字, 本页的统计数据)"""
+    text = _worker_converter._ocr_page(_worker_doc[page_num])
+    metrics = _worker_converter.metrics
+    return page_num, text, metrics.drain() if metrics.enabled else None
 
 
 def main():
@@ -213,7 +305,7 @@ def main():
         sys.exit(1)
     
     # 创建转换器并执行转换
-    converter = PDFOCRConverter(input_pdf, lang='chi_sim+eng')
+    converter = PDFOCRConverter(input_pdf, lang='chi_sim+eng', processes=os.cpu_count())
     converter.convert()
 
 
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+API限流与重试
+令牌桶控制请求速率，AIMD控制同时进行的请求数：成功时缓慢加并发，
+遇到429/5xx/超时时减半；失败的请求按带抖动的指数退避重试，仍失败的页写入持久化的重试队列
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+import httpx
+
+
+class OCRCallError(Exception):
+    """一次API调用失败"""
+
+    def __init__(self, message, status=None, retryable=False, congested=False, retry_after=None):
+        """
+        Args:
+            message: 错误信息
+            status: HTTP状态码，没有时为None
+            retryable: 是否值得重试
+            congested: 是否为服务端过载信号（429/5xx/超时），AIMD据此降低并发
+            retry_after: 服务端要求的等待秒数
+        """
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.congested = congested
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(response):
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def error_from_status(status, message, response=None):
+    """根据HTTP状态码生成OCRCallError"""
+    congested = status == 429 or status >= 500
+    return OCRCallError(
+        f"{status} - {message}",
+        status=status,
+        retryable=congested or status == 408,
+        congested=congested,
+        retry_after=_parse_retry_after(response),
+    )
+
+
+def error_from_exception(e):
+    """把httpx或Ark SDK抛出的异常归类为OCRCallError"""
+    if isinstance(e, OCRCallError):
+        return e
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return error_from_status(status, str(e), getattr(e, "response", None))
+    name = type(e).__name__
+    if isinstance(e, httpx.TimeoutException) or "Timeout" in name:
+        return OCRCallError(f"请求超时：{e}", retryable=True, congested=True)
+    if isinstance(e, httpx.TransportError) or "Connection" in name:
+        return OCRCallError(f"连接异常：{e}", retryable=True)
+    return OCRCallError(str(e))
+
+
+class TokenBucket:
+    """令牌桶：平均每秒rate个请求，最多积攒capacity个"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，不足时等待"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AIMDController:
+    """加性增、乘性减的并发控制器"""
+
+    def __init__(self, max_limit, initial_limit=None, min_limit=1, decrease_factor=0.5, cooldown=2.0):
+        """
+        Args:
+            max_limit: 并发上限
+            initial_limit: 初始并发，默认等于上限
+            min_limit: 并发下限
+            decrease_factor: 遇到过载信号时的乘数
+            cooldown: 两次减并发之间的最短间隔（秒），避免同一波429把并发连续减到底
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(initial_limit or self.max_limit)
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self._in_flight = 0
+        # 各占用者（进程号）持有的名额数，占用者异常退出时据此收回
+        self._holders = Counter()
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, owner=None):
+        """占用一个并发名额，超过当前上限时等待"""
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+            self._holders[owner] += 1
+
+    def release(self, congested=False, owner=None):
+        """归还名额；成功时每完成约limit个请求并发加1，过载时并发乘以decrease_factor"""
+        with self._cond:
+            self._in_flight -= 1
+            self._holders[owner] -= 1
+            if self._holders[owner] <= 0:
+                del self._holders[owner]
+            now = time.monotonic()
+            if congested:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                    print(f"API过载，并发降至{int(self.limit)}")
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def release_owner(self, owner):
+        """收回owner仍占用的全部名额（占用的进程已异常退出），返回收回的名额数"""
+        with self._cond:
+            count = self._holders.pop(owner, 0)
+            self._in_flight -= count
+            if count:
+                self._cond.notify_all()
+            return count
+
+
+class RetryPolicy:
+    """带完全抖动的指数退避"""
+
+    def __init__(self, max_retries=4, base_delay=1.0, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """第attempt次重试（从0开始）前的等待秒数"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class RateLimiter:
+    """令牌桶、AIMD并发控制与重试策略的组合，可在多本书之间共享"""
+
+    def __init__(self, max_concurrency, requests_per_second=None, retry_policy=None, bucket=None, controller=None):
+        """
+        Args:
+            max_concurrency: 同时进行的请求数上限
+            requests_per_second: 每秒请求数上限，None表示不限速
+            retry_policy: RetryPolicy
+            bucket / controller: 已有的TokenBucket与AIMDController（可以是跨进程的代理），
+                多个进程中的RateLimiter借此共用同一份额度
+        """
+        self.bucket = bucket or TokenBucket(requests_per_second, capacity=max_concurrency)
+        self.controller = controller or AIMDController(max_concurrency)
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    def call(self, func, *args, on_retry=None):
+        """
+        在限流下调用func，失败时按退避策略重试
+
+        func失败时应抛出异常（会经error_from_exception归类）；
+        重试耗尽或遇到不可重试的错误时抛出最后一个OCRCallError
+        Args:
+            on_retry: 每次重试前以OCRCallError调用，用于统计重试次数
+        """
+        attempt = 0
+        # 名额记在当前进程名下，共用额度的进程异常退出时由调度方收回
+        owner = os.getpid()
+        while True:
+            self.bucket.acquire()
+            self.controller.acquire(owner)
+            congested = False
+            try:
+                return func(*args)
+            except Exception as e:
+                error = error_from_exception(e)
+                congested = error.congested
+                if not error.retryable or attempt >= self.retry_policy.max_retries:
+                    raise error
+            finally:
+                self.controller.release(congested, owner)
+
+            delay = self.retry_policy.delay(attempt, error.retry_after)
+            attempt += 1
+            print(f"API调用失败（{error}），{delay:.1f}秒后第{attempt}次重试")
+            if on_retry is not None:
+                on_retry(error)
+            time.sleep(delay)
+
+
+class RetryQueue:
+    """持久化的失败页队列，JSONL格式，重启后仍可继续重试"""
+
+    def __init__(self, queue_path):
+        self.queue_path = queue_path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        entries = {}
+        if not os.path.exists(self.queue_path):
+            return entries
+        with open(self.queue_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("done"):
+                    entries.pop(entry["page_index"], None)
+                else:
+                    entries[entry["page_index"]] = entry
+        return entries
+
+    def _append(self, entry):
+        with open(self.queue_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, page_index, reason):
+        """记录一页失败"""
+        with self._lock:
+            self._append({"page_index": page_index, "reason": reason, "time": time.time()})
+
+    def remove(self, page_index):
+        """该页已成功，从队列中移除"""
+        with self._lock:
+            self._append({"page_index": page_index, "done": True})
+
+    def pending(self):
+        """返回仍待重试的页码列表"""
+        with self._lock:
+            return sorted(self._load())
+
+    def compact(self):
+        """只保留仍待重试的记录，队列为空时删除文件"""
+        with self._lock:
+            entries = self._load()
+            if not entries:
+                if os.path.exists(self.queue_path):
+                    os.remove(self.queue_path)
+                return
+            tmp_path = f"{self.queue_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for page_index in sorted(entries):
+                    f.write(json.dumps(entries[page_index], ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.queue_path)
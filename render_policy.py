@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+页面渲染策略
+按页面尺寸和目标DPI/像素预算逐页计算缩放倍数，
+原图为黑白/灰度扫描时直接以灰度、无alpha渲染，避免大幅面扫描页产生巨大的pixmap
+"""
+
+import math
+import re
+
+import pymupdf as fitz
+
+# 渲染使用的基准分辨率，缩放倍数1.0对应72 DPI
+BASE_DPI = 72
+
+_GRAY_COLORSPACES = ("DeviceGray", "CalGray", "G")
+
+
+def _image_is_monochrome(doc, xref, bpc, colorspace_name):
+    """判断页面中的一张图像是否为黑白/灰度"""
+    if bpc == 1 or colorspace_name in _GRAY_COLORSPACES:
+        return True
+    if colorspace_name == "ICCBased":
+        # ICC颜色空间需要看其分量数N
+        kind, value = doc.xref_get_key(xref, "ColorSpace")
+        if kind == "xref":
+            value = doc.xref_object(int(value.split()[0]))
+        match = re.search(r"/ICCBased\s+(\d+)\s+0\s+R", value)
+        if match:
+            _, n = doc.xref_get_key(int(match.group(1)), "N")
+            return n == "1"
+    return False
+
+
+def page_is_monochrome(page):
+    """页面上有图像且所有图像都是黑白/灰度时返回True"""
+    images = page.get_images(full=True)
+    if not images:
+        return False
+    doc = page.parent
+    for xref, _, _, _, bpc, colorspace_name, *_ in images:
+        if not _image_is_monochrome(doc, xref, bpc, colorspace_name):
+            return False
+    return True
+
+
+class RenderPolicy:
+    """逐页决定渲染的缩放倍数和颜色空间"""
+
+    def __init__(self, target_dpi=216, max_pixels=6_000_000, min_zoom=0.25, grayscale="auto"):
+        """
+        Args:
+            target_dpi: 目标渲染分辨率
+            max_pixels: 单页像素上限，超过时降低缩放倍数；None表示不限制
+            min_zoom: 缩放倍数下限
+            grayscale: True总是灰度渲染，False总是RGB，"auto"在原图为黑白/灰度时灰度渲染
+        """
+        self.target_dpi = target_dpi
+        self.max_pixels = max_pixels
+        self.min_zoom = min_zoom
+        self.grayscale = grayscale
+
+    def zoom_for(self, page):
+        """按页面尺寸与目标DPI计算缩放倍数，并受像素预算约束"""
+        zoom = self.target_dpi / BASE_DPI
+        rect = page.rect
+        if self.max_pixels and rect.width > 0 and rect.height > 0:
+            budget_zoom = math.sqrt(self.max_pixels / (rect.width * rect.height))
+            zoom = min(zoom, budget_zoom)
+        return max(zoom, self.min_zoom)
+
+    def colorspace_for(self, page):
+        """返回渲染该页使用的颜色空间"""
+        if self.grayscale == "auto":
+            return fitz.csGRAY if page_is_monochrome(page) else fitz.csRGB
+        return fitz.csGRAY if self.grayscale else fitz.csRGB
+
+    def render(self, page):
+        """按策略渲染页面，始终不带alpha通道"""
+        zoom = self.zoom_for(page)
+        return page.get_pixmap(
+            matrix=fitz.Matrix(zoom, zoom),
+            colorspace=self.colorspace_for(page),
+            alpha=False,
+        )
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+转换过程的计时与吞吐统计
+按页、按阶段记录耗时，累计发送字节数、token用量和重试次数；
+汇总出各阶段的p50/p95/p99和每秒页数，导出JSON运行报告和Prometheus文本文件。
+未启用时计时器是一个什么都不做的共享对象，对转换速度几乎没有影响
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# Prometheus指标名前缀
+METRIC_PREFIX = "book_pavilion"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _NullTimer:
+    """未启用统计时使用的计时器"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "page_index", "start")
+
+    def __init__(self, metrics, stage, page_index):
+        self.metrics = metrics
+        self.stage = stage
+        self.page_index = page_index
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(self.stage, time.perf_counter() - self.start, self.page_index)
+        return False
+
+
+class RunMetrics:
+    """一次转换（或一次批量转换）的统计数据，可在多个线程中同时记录"""
+
+    def __init__(self, enabled=True, name="run"):
+        """
+        Args:
+            enabled: 为False时所有记录操作直接返回
+            name: 运行名称，作为报告中的run标签
+        """
+        self.enabled = enabled
+        self.name = name
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._pages = {}
+        self._counters = {}
+        self.started_at = None
+        self._start = None
+        self._end = None
+
+    def start(self):
+        """开始计算总耗时"""
+        if self.enabled:
+            self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+            self._start = time.perf_counter()
+            self._end = None
+
+    def finish(self):
+        """结束计算总耗时"""
+        if self.enabled and self._start is not None:
+            self._end = time.perf_counter()
+
+    def stage(self, stage, page_index=None):
+        """
+        计时上下文：with metrics.stage("render", page_index): ...
+
+        Args:
+            stage: 阶段名
+            page_index: 所属页码，不属于某一页的阶段（如生成PDF）为None
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage, page_index)
+
+    def record(self, stage, seconds, page_index=None):
+        """记录一次阶段耗时"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+            if page_index is not None:
+                page = self._pages.setdefault(int(page_index), {})
+                page[stage] = page.get(stage, 0.0) + seconds
+
+    def add(self, counter, value=1):
+        """累加计数器，例如 pages、bytes_sent、prompt_tokens、api_retries"""
+        if not self.enabled or not value:
+            return
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def drain(self):
+        """取出并清空已记录的数据，供工作进程把统计交回主进程"""
+        with self._lock:
+            data = {"samples": self._samples, "pages": self._pages, "counters": self._counters}
+            self._samples, self._pages, self._counters = {}, {}, {}
+        return data
+
+    def merge(self, data):
+        """合并drain()取出的数据"""
+        if not self.enabled or not data:
+            return
+        with self._lock:
+            for stage, values in data["samples"].items():
+                self._samples.setdefault(stage, []).extend(values)
+            for page_index, stages in data["pages"].items():
+                page = self._pages.setdefault(int(page_index), {})
+                for stage, seconds in stages.items():
+                    page[stage] = page.get(stage, 0.0) + seconds
+            for counter, value in data["counters"].items():
+                self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def wall_seconds(self):
+        if self._start is None:
+            return 0.0
+        return (self._end or time.perf_counter()) - self._start
+
+    def summary(self):
+        """汇总各阶段的次数、总耗时、均值、分位数和每秒页数"""
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+            counters = dict(self._counters)
+
+        stages = {}
+        for stage, values in sorted(samples.items()):
+            array = np.asarray(values, dtype=np.float64)
+            p50, p95, p99 = np.percentile(array, [q * 100 for q in QUANTILES])
+            stages[stage] = {
+                "count": len(values),
+                "total_seconds": float(array.sum()),
+                "mean": float(array.mean()),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "max": float(array.max()),
+            }
+        wall = self.wall_seconds()
+        pages = counters.get("pages", 0)
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "wall_seconds": wall,
+            "pages": pages,
+            "pages_per_second": pages / wall if wall > 0 else 0.0,
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def report(self):
+        """打印各阶段耗时"""
+        summary = self.summary()
+        print(f"共{summary['pages']}页，用时{summary['wall_seconds']:.2f}秒，"
+              f"每秒{summary['pages_per_second']:.2f}页")
+        for stage, stats in summary["stages"].items():
+            print(f"  {stage}: {stats['count']}次，合计{stats['total_seconds']:.2f}秒，"
+                  f"p50 {stats['p50'] * 1000:.1f}ms，p95 {stats['p95'] * 1000:.1f}ms，"
+                  f"p99 {stats['p99'] * 1000:.1f}ms")
+        if summary["counters"]:
+            print(f"  计数：{summary['counters']}")
+        return summary
+
+    def write_reports(self, json_dir, file_prefix):
+        """
+        结束计时并打印各阶段耗时，在json_dir下写出JSON报告和Prometheus文本文件；未启用统计时不做任何事
+
+        Args:
+            json_dir: 报告所在目录，通常是 data/{pdf_name}/json
+            file_prefix: 文件名前缀，分别写出 {file_prefix}.json 与 {file_prefix}.prom
+        Returns:
+            JSON报告路径，未启用统计时为None
+        """
+        if not self.enabled:
+            return None
+        self.finish()
+        self.report()
+        report_path = self.write_json(os.path.join(json_dir, f"{file_prefix}.json"))
+        self.write_prometheus(os.path.join(json_dir, f"{file_prefix}.prom"))
+        print(f"运行统计已保存到: {report_path}")
+        return report_path
+
+    def write_json(self, path):
+        """写出JSON运行报告，包含汇总和每页各阶段耗时"""
+        report = self.summary()
+        with self._lock:
+            report["page_stages"] = {str(k): dict(v) for k, v in sorted(self._pages.items())}
+        _atomic_write_text(path, json.dumps(report, ensure_ascii=False, indent=2))
+        return path
+
+    def write_prometheus(self, path):
+        """写出供node_exporter textfile collector读取的Prometheus文本文件"""
+        summary = self.summary()
+        run = f'run="{_escape_label(self.name)}"'
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_seconds 各阶段单次耗时（秒）",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds summary",
+        ]
+        for stage, stats in summary["stages"].items():
+            labels = f'{run},stage="{_escape_label(stage)}"'
+            for q in QUANTILES:
+                lines.append(f'{METRIC_PREFIX}_stage_seconds{{{labels},quantile="{q}"}} '
+                             f'{stats[f"p{round(q * 100)}"]:.6f}')
+            lines.append(f"{METRIC_PREFIX}_stage_seconds_sum{{{labels}}} {stats['total_seconds']:.6f}")
+            lines.append(f"{METRIC_PREFIX}_stage_seconds_count{{{labels}}} {stats['count']}")
+
+        for counter, value in sorted(summary["counters"].items()):
+            name = f"{METRIC_PREFIX}_{_metric_name(counter)}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{{{run}}} {value}")
+
+        for gauge in ("wall_seconds", "pages_per_second"):
+            name = f"{METRIC_PREFIX}_run_{gauge}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{{{run}}} {summary[gauge]:.6f}")
+        _atomic_write_text(path, "\n".join(lines) + "\n")
+        return path
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _atomic_write_text(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# 未传入统计对象时使用的共享实例
+DISABLED = RunMetrics(enabled=False)
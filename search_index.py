@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+书籍全文检索索引
+中文按单字和相邻两字切分，西文按单词切分，建立倒排索引；倒排表以numpy数组保存并内存映射读取，
+新识别的页写成新的段追加到索引中，段多了再合并；查询返回page_id和上下文摘要
+"""
+
+import bisect
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from page_index import BufferedPageIndex, add_library, truncate_file
+from page_journal import atomic_write_json
+
+DEFAULT_INDEX_DIR = "data/.search_index"
+# 段数超过该值时自动合并为一个段
+MAX_SEGMENTS = 8
+
+_CJK_CHARS = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_CJK_RUN = re.compile(rf"[{_CJK_CHARS}]+")
+_TOKEN_RUN = re.compile(rf"[{_CJK_CHARS}]+|[0-9A-Za-z\u00c0-\u024f]+")
+
+
+def _run_terms(run, for_query=False):
+    if not _CJK_RUN.fullmatch(run):
+        return [run.lower()]
+    if for_query:
+        # 查询时两字及以上的中文只需相邻两字即可覆盖
+        if len(run) == 1:
+            return [run]
+        return [run[i:i + 2] for i in range(len(run) - 1)]
+    return list(run) + [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text):
+    """把文本切成索引词：中文单字与相邻两字，西文和数字按单词小写"""
+    terms = []
+    for run in _TOKEN_RUN.findall(text or ""):
+        terms.extend(_run_terms(run))
+    return terms
+
+
+def tokenize_query(query):
+    """把查询切成(索引词列表, 需在原文中连续出现的中文片段列表)"""
+    terms = []
+    phrases = []
+    for run in _TOKEN_RUN.findall(query or ""):
+        terms.extend(_run_terms(run, for_query=True))
+        if len(run) > 2 and _CJK_RUN.fullmatch(run):
+            phrases.append(run)
+    return list(dict.fromkeys(terms)), phrases
+
+
+class _Segment:
+    """一个不可变的索引段：有序词表 + 内存映射的倒排表"""
+
+    def __init__(self, index_dir, name):
+        self.name = name
+        prefix = os.path.join(index_dir, name)
+        with open(f"{prefix}.terms.txt", 'r', encoding='utf-8') as f:
+            content = f.read()
+        self.terms = content.split("\n") if content else []
+        self.offsets = np.load(f"{prefix}.offsets.npy")
+        self.doc_ids = np.load(f"{prefix}.docs.npy", mmap_mode='r')
+        self.tfs = np.load(f"{prefix}.tfs.npy", mmap_mode='r')
+
+    def postings(self, term):
+        """返回该词在本段的(doc_id数组, 词频数组)，不存在时返回None"""
+        i = bisect.bisect_left(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    @property
+    def size(self):
+        """倒排表总长度，用于挑选待合并的段"""
+        return len(self.doc_ids)
+
+    @staticmethod
+    def write(index_dir, name, terms, offsets, doc_ids, tfs):
+        """写出一个段：有序词表、每个词在倒排表中的起止位置、doc_id数组、词频数组"""
+        prefix = os.path.join(index_dir, name)
+        with open(f"{prefix}.terms.txt", 'w', encoding='utf-8') as f:
+            f.write("\n".join(terms))
+        np.save(f"{prefix}.offsets.npy", np.asarray(offsets, dtype=np.int64))
+        np.save(f"{prefix}.docs.npy", np.asarray(doc_ids, dtype=np.int32))
+        # 词频超过uint16上限时截断，对排序没有影响
+        np.save(f"{prefix}.tfs.npy", np.minimum(np.asarray(tfs), 65535).astype(np.uint16))
+
+    @staticmethod
+    def write_postings(index_dir, name, postings):
+        """把{词: {doc_id: 词频}}写成一个段"""
+        terms = sorted(postings)
+        offsets = [0]
+        doc_ids = []
+        tfs = []
+        for term in terms:
+            doc_tf = postings[term]
+            ids = sorted(doc_tf)
+            doc_ids.extend(ids)
+            tfs.extend(doc_tf[doc_id] for doc_id in ids)
+            offsets.append(len(doc_ids))
+        _Segment.write(index_dir, name, terms, offsets, doc_ids, tfs)
+
+    def close(self):
+        """释放内存映射，之后才能删除段文件（Windows不允许删除仍被映射的文件）"""
+        self.doc_ids = self.tfs = None
+
+
+class SearchIndex(BufferedPageIndex):
+    """
+    整个书库共用的全文索引
+
+    文件布局（index_dir下）：
+        manifest.json   段列表、文档表名称、文档数、文档表长度，原子替换
+        docs*.bin       所有页文本依次拼接（UTF-8），用于生成摘要
+        docs*.jsonl     每行一个文档：page_id、pdf_name、page_index、文本在.bin中的位置
+        seg_N.*         索引段
+    同一page_id再次加入时以最新的文档为准，旧文档在查询时被过滤；合并段时从倒排表中清除，
+    合并全部段时同时重写文档表去掉旧文档。manifest未引用的文件在合并后和下次打开时删除
+    """
+
+    # 缓冲的页数达到该值时自动写出一个段
+    auto_commit_pages = 64
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        super().__init__()
+        self._text_map = None
+        self._load()
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.index_dir, "manifest.json")
+
+    @property
+    def _docs_bin_path(self):
+        return os.path.join(self.index_dir, f"{self._manifest.get('docs_name', 'docs')}.bin")
+
+    @property
+    def _docs_meta_path(self):
+        return os.path.join(self.index_dir, f"{self._manifest.get('docs_name', 'docs')}.jsonl")
+
+    def _load(self):
+        """读取manifest，丢弃上次崩溃时写了一半的文档和段"""
+        manifest = {"segments": [], "doc_count": 0, "docs_bin_size": 0, "docs_meta_size": 0, "next_segment": 0}
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        self._manifest = manifest
+
+        self._docs = []
+        self._live_doc = {}
+        if os.path.exists(self._docs_meta_path):
+            with open(self._docs_meta_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if len(self._docs) >= manifest["doc_count"]:
+                        break
+                    doc = json.loads(line)
+                    self._live_doc[doc["page_id"]] = len(self._docs)
+                    self._docs.append(doc)
+        truncate_file(self._docs_meta_path, manifest["docs_meta_size"])
+        truncate_file(self._docs_bin_path, manifest["docs_bin_size"])
+        self._refresh_live()
+
+        self._segments = [_Segment(self.index_dir, name) for name in manifest["segments"]]
+        self._close_text_map()
+        self._remove_unreferenced()
+
+    def _remove_unreferenced(self):
+        """删除manifest未引用的段和文档表：已合并的旧文件，以及崩溃前写了一半的新文件"""
+        keep = {"manifest.json", os.path.basename(self._docs_bin_path), os.path.basename(self._docs_meta_path)}
+        keep.update(f"{name}{suffix}" for name in self._manifest["segments"]
+                    for suffix in (".terms.txt", ".offsets.npy", ".docs.npy", ".tfs.npy"))
+        for name in os.listdir(self.index_dir):
+            if name in keep or not (name.startswith("seg_") or name.startswith("docs")):
+                continue
+            try:
+                os.remove(os.path.join(self.index_dir, name))
+            except OSError as e:
+                # 其他进程仍映射着该文件时（Windows）留到下次打开时再删
+                print(f"暂时无法删除旧索引文件 {name}: {e}")
+
+    def _refresh_live(self):
+        """标记每个page_id最新的文档"""
+        self._live = np.zeros(len(self._docs), dtype=bool)
+        if self._live_doc:
+            self._live[list(self._live_doc.values())] = True
+
+    def _close_text_map(self):
+        if self._text_map is not None:
+            self._text_map.close()
+            self._text_map = None
+
+    def _text(self, doc_id):
+        doc = self._docs[doc_id]
+        if self._text_map is None:
+            if self._manifest["docs_bin_size"] == 0:
+                return ""
+            with open(self._docs_bin_path, 'rb') as f:
+                self._text_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._text_map[doc["offset"]:doc["offset"] + doc["length"]].decode('utf-8')
+
+    def commit(self):
+        """把缓冲的页写成一个新段，段数过多时合并"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending = list(self._pending.values())
+            self._pending = {}
+
+            # 内容未变的页不重复索引
+            pending = [page for page in pending if not self._unchanged(page)]
+            if not pending:
+                return 0
+
+            postings = {}
+            bin_offset = self._manifest["docs_bin_size"]
+            meta_size = self._manifest["docs_meta_size"]
+            with open(self._docs_bin_path, 'ab') as bin_file, \
+                    open(self._docs_meta_path, 'ab') as meta_file:
+                for page in pending:
+                    doc_id = len(self._docs)
+                    data = page["text"].encode('utf-8')
+                    bin_file.write(data)
+                    doc = {
+                        "page_id": page["page_id"],
+                        "pdf_name": page["pdf_name"],
+                        "page_index": page["page_index"],
+                        "offset": bin_offset,
+                        "length": len(data),
+                    }
+                    bin_offset += len(data)
+                    line = (json.dumps(doc, ensure_ascii=False) + "\n").encode('utf-8')
+                    meta_file.write(line)
+                    meta_size += len(line)
+                    self._docs.append(doc)
+                    self._live_doc[doc["page_id"]] = doc_id
+                    for term, tf in Counter(tokenize(page["text"])).items():
+                        postings.setdefault(term, {})[doc_id] = tf
+                for f in (bin_file, meta_file):
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            name = f"seg_{self._manifest['next_segment']}"
+            _Segment.write_postings(self.index_dir, name, postings)
+            self._manifest = {
+                **self._manifest,
+                "segments": self._manifest["segments"] + [name],
+                "doc_count": len(self._docs),
+                "docs_bin_size": bin_offset,
+                "docs_meta_size": meta_size,
+                "next_segment": self._manifest["next_segment"] + 1,
+            }
+            atomic_write_json(self._manifest_path, self._manifest)
+            self._segments.append(_Segment(self.index_dir, name))
+            self._refresh_live()
+            # docs.bin已变长，下次读取摘要时重新映射
+            self._close_text_map()
+
+            if 2 * len(self._live_doc) < len(self._docs):
+                # 旧文档超过一半时合并全部段，同时重写文档表
+                self.merge()
+            elif len(self._segments) > MAX_SEGMENTS:
+                # 每次合并最小的几个段，段大小按几何级数增长，总合并代价为O(N log N)
+                smallest = sorted(self._segments, key=lambda segment: segment.size)[:MAX_SEGMENTS // 2 + 1]
+                self.merge(smallest)
+            return len(pending)
+
+    def _unchanged(self, page):
+        doc_id = self._live_doc.get(page["page_id"])
+        return doc_id is not None and self._text(doc_id) == page["text"]
+
+    def merge(self, segments=None):
+        """
+        合并索引段，只保留每个page_id最新的文档；合并全部段且有旧文档时同时重写文档表
+
+        Args:
+            segments: 待合并的段，None表示合并全部段
+        """
+        with self._lock:
+            segments = list(self._segments if segments is None else segments)
+            merged = {segment.name for segment in segments}
+            remaining = [segment for segment in self._segments if segment.name not in merged]
+            # 其余段仍按旧的doc_id引用文档表，只有合并全部段时才能给文档重新编号
+            compact_docs = not remaining and len(self._live_doc) < len(self._docs)
+            if len(segments) <= 1 and not compact_docs:
+                return
+
+            next_segment = self._manifest["next_segment"]
+            name = f"seg_{next_segment}"
+            manifest = {**self._manifest, "next_segment": next_segment + 1}
+            remap = None
+            if compact_docs:
+                docs_name = f"docs_{next_segment}"
+                docs, docs_sizes = self._write_live_docs(docs_name)
+                remap = np.full(len(self._docs), -1, dtype=np.int32)
+                remap[np.flatnonzero(self._live)] = np.arange(len(docs), dtype=np.int32)
+                manifest.update(docs_name=docs_name, doc_count=len(docs), **docs_sizes)
+
+            _Segment.write(self.index_dir, name, *self._merge_postings(segments, remap))
+            manifest["segments"] = [segment.name for segment in remaining] + [name]
+            atomic_write_json(self._manifest_path, manifest)
+
+            self._manifest = manifest
+            if compact_docs:
+                self._docs = docs
+                self._live_doc = {doc["page_id"]: doc_id for doc_id, doc in enumerate(docs)}
+                self._refresh_live()
+                self._close_text_map()
+            for segment in segments:
+                segment.close()
+            self._segments = remaining + [_Segment(self.index_dir, name)]
+            self._remove_unreferenced()
+            print(f"检索索引已合并{len(segments)}个段" + (f"，文档表保留{len(self._docs)}页" if compact_docs else ""))
+
+    def _merge_postings(self, segments, remap=None):
+        """多路归并各段的倒排表，去掉旧文档；remap给出旧doc_id到新doc_id的映射（保持顺序）"""
+        # 各段词表有序，多路归并后逐词拼接倒排表
+        streams = [zip(segment.terms, itertools.repeat(n), itertools.count()) for n, segment in enumerate(segments)]
+        terms, offsets, id_parts, tf_parts = [], [0], [], []
+        for term, group in itertools.groupby(heapq.merge(*streams), key=lambda entry: entry[0]):
+            ids_list, tfs_list = [], []
+            for _, n, i in group:
+                segment = segments[n]
+                start, end = segment.offsets[i], segment.offsets[i + 1]
+                ids_list.append(segment.doc_ids[start:end])
+                tfs_list.append(segment.tfs[start:end])
+            ids = np.concatenate(ids_list)
+            tfs = np.concatenate(tfs_list)
+            keep = self._live[ids]
+            if not keep.any():
+                continue
+            ids, tfs = ids[keep], tfs[keep]
+            if remap is not None:
+                ids = remap[ids]
+            order = np.argsort(ids, kind='stable')
+            terms.append(term)
+            id_parts.append(ids[order])
+            tf_parts.append(tfs[order])
+            offsets.append(offsets[-1] + len(ids))
+        return (
+            terms, offsets,
+            np.concatenate(id_parts) if id_parts else np.zeros(0, dtype=np.int32),
+            np.concatenate(tf_parts) if tf_parts else np.zeros(0, dtype=np.uint16),
+        )
+
+    def _write_live_docs(self, docs_name):
+        """把每个page_id最新的文档按原顺序写成新的文档表，返回(文档列表, manifest中的长度字段)"""
+        docs = []
+        bin_offset = meta_size = 0
+        with open(os.path.join(self.index_dir, f"{docs_name}.bin"), 'wb') as bin_file, \
+                open(os.path.join(self.index_dir, f"{docs_name}.jsonl"), 'wb') as meta_file:
+            for doc_id in np.flatnonzero(self._live):
+                doc = self._docs[doc_id]
+                data = self._text(doc_id).encode('utf-8')
+                bin_file.write(data)
+                doc = {**doc, "offset": bin_offset, "length": len(data)}
+                bin_offset += len(data)
+                line = (json.dumps(doc, ensure_ascii=False) + "\n").encode('utf-8')
+                meta_file.write(line)
+                meta_size += len(line)
+                docs.append(doc)
+            for f in (bin_file, meta_file):
+                f.flush()
+                os.fsync(f.fileno())
+        return docs, {"docs_bin_size": bin_offset, "docs_meta_size": meta_size}
+
+    def _term_postings(self, term):
+        """该词在所有段中的(doc_id数组, 词频数组)，只含最新文档"""
+        ids_list, tfs_list = [], []
+        for segment in self._segments:
+            result = segment.postings(term)
+            if result is not None:
+                ids_list.append(result[0])
+                tfs_list.append(result[1])
+        if not ids_list:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16)
+        ids = np.concatenate(ids_list)
+        tfs = np.concatenate(tfs_list)
+        keep = self._live[ids]
+        return ids[keep], tfs[keep]
+
+    def _snippet(self, text, query_runs, snippet_chars):
+        lowered = text.lower()
+        pos = -1
+        for run in query_runs:
+            pos = lowered.find(run.lower())
+            if pos >= 0:
+                break
+        if pos < 0:
+            pos = 0
+        start = max(0, pos - snippet_chars)
+        end = min(len(text), pos + snippet_chars)
+        snippet = text[start:end].replace("\n", " ")
+        return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+    def search(self, query, limit=10, snippet_chars=40, pdf_name=None):
+        """
+        查询包含所有查询词的页
+
+        Args:
+            query: 查询文本，中文片段须在原文中连续出现
+            limit: 最多返回的结果数
+            snippet_chars: 摘要中命中位置前后各保留的字符数
+            pdf_name: 只在该书中查询
+        Returns:
+            [{"page_id", "pdf_name", "page_index", "score", "snippet"}]，按相关度从高到低
+        """
+        terms, phrases = tokenize_query(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            live_count = max(1, int(self._live.sum()))
+            term_postings = sorted((self._term_postings(term) for term in terms), key=lambda p: len(p[0]))
+            doc_ids = scores = None
+            # 从最稀有的词开始求交集
+            for ids, tfs in term_postings:
+                if len(ids) == 0:
+                    return []
+                term_scores = tfs * math.log(1 + live_count / len(ids))
+                if doc_ids is None:
+                    doc_ids, scores = ids, term_scores
+                else:
+                    doc_ids, left, right = np.intersect1d(doc_ids, ids, assume_unique=True, return_indices=True)
+                    scores = scores[left] + term_scores[right]
+                if len(doc_ids) == 0:
+                    return []
+
+            results = []
+            query_runs = phrases + _TOKEN_RUN.findall(query)
+            for i in np.argsort(-scores, kind='stable'):
+                doc_id, score = int(doc_ids[i]), float(scores[i])
+                doc = self._docs[doc_id]
+                if pdf_name is not None and doc["pdf_name"] != pdf_name:
+                    continue
+                text = self._text(doc_id)
+                # 相邻两字都出现不代表整个片段连续出现，用原文确认
+                if any(phrase not in text for phrase in phrases):
+                    continue
+                results.append({
+                    "page_id": doc["page_id"],
+                    "pdf_name": doc["pdf_name"],
+                    "page_index": doc["page_index"],
+                    "score": round(score, 4),
+                    "snippet": self._snippet(text, query_runs, snippet_chars),
+                })
+                if len(results) >= limit:
+                    break
+            return results
+
+    def stats(self):
+        """返回文档数、有效页数和段数"""
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "pages": int(self._live.sum()),
+                "segments": len(self._segments),
+                "pending": len(self._pending),
+            }
+
+    def close(self):
+        """写出缓冲的页并释放内存映射"""
+        with self._lock:
+            self.commit()
+            self._close_text_map()
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+
+
+def index_library(root="data", index_dir=DEFAULT_INDEX_DIR):
+    """把root下所有书的 _book_data_no_img.json 加入索引，未变化的页会被跳过"""
+    index = add_library(SearchIndex(index_dir), root)
+    print(f"检索索引：{index.stats()}")
+    return index
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+可搜索PDF输出
+在原扫描页上叠加不可见的文字层（render mode 3），页面图像原样保留、不重新编码，
+输出与原书逐页对应，耗时只与文字量有关
+"""
+
+import math
+import os
+
+import pymupdf as fitz
+
+from page_classifier import PAGE_KIND_TEXT, classify_page
+
+# 输出方式：重新排版的文字版PDF / 原扫描页叠加文字层的可搜索PDF
+OUTPUT_TEXT = "text"
+OUTPUT_SEARCHABLE = "searchable"
+OUTPUT_MODES = (OUTPUT_TEXT, OUTPUT_SEARCHABLE)
+
+# PDF阅读器内置的简体中文字体，不嵌入字体文件，同时覆盖中英文
+INVISIBLE_FONT = "china-s"
+# 不可见文字层的行高约为字号的1.2倍
+_LINE_SPACING = 1.2
+
+
+def _insert_invisible_text(page, text, margin, max_font_size, min_font_size):
+    """把文字以不可见方式写满页面，放不下时逐步缩小字号，返回最终字号"""
+    rect = page.rect + (margin, margin, -margin, -margin)
+    # 按文字量估计能铺满页面的字号，通常一两次即可放下
+    font_size = math.sqrt(rect.width * rect.height / (_LINE_SPACING * max(len(text), 1)))
+    font_size = max(min_font_size, min(max_font_size, font_size))
+    while True:
+        rc = page.insert_textbox(rect, text, fontsize=font_size, fontname=INVISIBLE_FONT, render_mode=3)
+        if rc >= 0:
+            return font_size
+        if font_size <= min_font_size:
+            break
+        font_size = max(min_font_size, font_size * 0.8)
+
+    # 最小字号仍放不下时不换行地写在左上角，至少保证全文可搜索
+    page.insert_text(rect.tl + (0, min_font_size), text, fontsize=min_font_size,
+                     fontname=INVISIBLE_FONT, render_mode=3)
+    return min_font_size
+
+
+def overlay_page(page, text, margin=10, max_font_size=12, min_font_size=1):
+    """在一页上叠加不可见文字；文字为空或该页已有文字层时不叠加，返回是否叠加"""
+    if not text or not text.strip():
+        return False
+    kind, _ = classify_page(page)
+    if kind == PAGE_KIND_TEXT:
+        return False
+    _insert_invisible_text(page, text, margin, max_font_size, min_font_size)
+    return True
+
+
+def write_searchable_pdf(input_pdf_path, output_path, texts_by_page, margin=10, max_font_size=12,
+                         min_font_size=1):
+    """
+    在原PDF的每一页上叠加识别文字，生成可搜索PDF
+
+    已有文字层的页不再叠加，避免搜索结果重复
+    Args:
+        input_pdf_path: 原扫描版PDF路径
+        output_path: 输出PDF路径
+        texts_by_page: {页码(从1开始): 识别文字}
+        margin: 文字框距页面边缘的距离
+        max_font_size: 不可见文字的最大字号
+        min_font_size: 不可见文字的最小字号
+    Returns:
+        叠加了文字层的页数
+    """
+    doc = fitz.open(input_pdf_path)
+    overlaid = 0
+    try:
+        for page_index, text in sorted(texts_by_page.items()):
+            if not 1 <= page_index <= len(doc):
+                continue
+            if overlay_page(doc[page_index - 1], text, margin, max_font_size, min_font_size):
+                overlaid += 1
+
+        # 不做压缩和去重，原有图像流原样写出，保存耗时与图像大小无关
+        tmp_path = f"{output_path}.tmp"
+        doc.save(tmp_path)
+    finally:
+        doc.close()
+    os.replace(tmp_path, output_path)
+
+    print(f"可搜索PDF已生成：{overlaid}页叠加了文字层")
+    return overlaid
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+生成用于基准测试的合成扫描版PDF
+按随机种子生成中文、英文或中英混排的文字页，栅格化后加入轻微噪声，以JPEG图像写入PDF，
+页面没有文字层，与真实扫描件一样需要OCR；同一组参数每次生成的文件完全相同
+"""
+
+import html
+import json
+import os
+import random
+
+import numpy as np
+import pymupdf as fitz
+
+# 页面尺寸（点）
+PAGE_SIZES = {
+    "A4": (595, 842),
+    "A5": (420, 595),
+    "B5": (499, 709),
+    "letter": (612, 792),
+}
+TEXT_CJK = "cjk"
+TEXT_LATIN = "latin"
+TEXT_MIXED = "mixed"
+
+_CJK_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后"
+    "多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还"
+    "因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结"
+)
+_CJK_PUNCT = "，，，。、；："
+_LATIN_WORDS = (
+    "the of and to in is that for it as with was on be by this are from at or an which have not they "
+    "page book text chapter reading history scan image result model process pipeline memory latency "
+    "throughput library archive edition volume author translation commentary index preface"
+).split()
+
+
+def _cjk_sentence(rng):
+    length = rng.randint(8, 30)
+    chars = [rng.choice(_CJK_CHARS) for _ in range(length)]
+    for i in range(rng.randint(0, 2)):
+        chars.insert(rng.randint(2, length - 1), rng.choice(_CJK_PUNCT))
+    return "".join(chars) + "。"
+
+
+def _latin_sentence(rng):
+    words = [rng.choice(_LATIN_WORDS) for _ in range(rng.randint(6, 18))]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + "."
+
+
+def page_text(rng, text_kind, chars_per_page):
+    """生成一页文字，按段落分行，总字数约为chars_per_page"""
+    paragraphs = []
+    total = 0
+    while total < chars_per_page:
+        sentences = []
+        for _ in range(rng.randint(2, 5)):
+            if text_kind == TEXT_CJK or (text_kind == TEXT_MIXED and rng.random() < 0.7):
+                sentences.append(_cjk_sentence(rng))
+            else:
+                sentences.append(_latin_sentence(rng))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph)
+    return "\n".join(paragraphs)
+
+
+def _scan_effects(pix, rng, noise):
+    """给栅格化的页面加上扫描件常见的灰底和噪点"""
+    image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n).astype(np.int16)
+    image -= rng.randint(8, 20)
+    if noise > 0:
+        np_rng = np.random.default_rng(rng.getrandbits(32))
+        image += np_rng.normal(0, noise, image.shape).astype(np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def generate_scanned_pdf(output_path, pages=20, page_size="A4", text_kind=TEXT_MIXED, chars_per_page=600,
+                         dpi=200, font_size=11, noise=6.0, jpeg_quality=75, seed=0, truth_path=None):
+    """
+    生成合成扫描版PDF
+
+    Args:
+        output_path: 输出PDF路径
+        pages: 页数
+        page_size: PAGE_SIZES中的名称，或(宽, 高)点数
+        text_kind: cjk / latin / mixed
+        chars_per_page: 每页大约的字数
+        dpi: 栅格化分辨率，决定页图像大小
+        font_size: 字号
+        noise: 高斯噪声的标准差，0表示不加噪声
+        jpeg_quality: 页图像的JPEG质量
+        seed: 随机种子，相同参数和种子生成相同的文件
+        truth_path: 每页原文的JSON输出路径，为None时不输出
+    Returns:
+        每页原文列表
+    """
+    if text_kind not in (TEXT_CJK, TEXT_LATIN, TEXT_MIXED):
+        raise ValueError(f"不支持的文字类型：{text_kind}")
+    width, height = PAGE_SIZES[page_size] if isinstance(page_size, str) else page_size
+    rng = random.Random(seed)
+    margin = 50
+    zoom = dpi / 72
+
+    texts = []
+    out = fitz.open()
+    for _ in range(pages):
+        text = page_text(rng, text_kind, chars_per_page)
+        texts.append(text)
+
+        # 先排出文字页，再栅格化成图像，图像页不保留文字层
+        scratch = fitz.open()
+        page = scratch.new_page(width=width, height=height)
+        rect = fitz.Rect(margin, margin, width - margin, height - margin)
+        # HTML排版自动为中文和西文选用PyMuPDF内置字体，放不下时整体缩小
+        body = "".join(f"<p>{html.escape(line)}</p>" for line in text.split("\n"))
+        css = f"p {{font-size: {font_size}pt; line-height: 1.6; margin: 0 0 0.4em 0; text-indent: 2em;}}"
+        page.insert_htmlbox(rect, body, css=css, scale_low=0)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY)
+        pixels = _scan_effects(pix, rng, noise)
+        scratch.close()
+
+        gray = fitz.Pixmap(fitz.csGRAY, pix.width, pix.height, pixels.tobytes(), False)
+        out_page = out.new_page(width=width, height=height)
+        out_page.insert_image(out_page.rect, stream=gray.tobytes("jpeg", jpg_quality=jpeg_quality))
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    out.set_metadata({"title": os.path.basename(output_path), "producer": "synthetic_pdf",
+                      "creationDate": "", "modDate": ""})
+    out.save(output_path, garbage=3, deflate=True, no_new_id=True)
+    out.close()
+
+    if truth_path:
+        with open(truth_path, 'w', encoding='utf-8') as f:
+            json.dump(texts, f, ensure_ascii=False, indent=2)
+    print(f"已生成合成扫描PDF：{output_path}，共{pages}页")
+    return texts
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+批量转换的书籍发现、剩余页估计与额度回收测试
+"""
+
+import os
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pymupdf as fitz
+
+from batch_runner import ENGINE_TESSERACT, BatchRunner, BookJob, discover_pdfs, remaining_pages
+from page_journal import PageJournal, atomic_write_json
+from rate_limit import AIMDController
+
+
+def _write_pdf(path, pages):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_discover_skips_generated_and_hidden_directories(tmp_path):
+    root = tmp_path / "data"
+    expected = [_write_pdf(str(root / "a.pdf"), 1), _write_pdf(str(root / "shelf" / "b.PDF"), 1)]
+    for skipped in ("json", "pdf_imgs", "pdf_shards", ".ocr_cache", ".search_index", ".benchmarks", ".anything"):
+        _write_pdf(str(root / "book" / skipped / "x.pdf"), 1)
+
+    assert discover_pdfs(str(root)) == expected
+    assert discover_pdfs(str(root), recursive=False) == expected[:1]
+
+
+def test_remaining_pages_counts_json_and_journal(tmp_path, monkeypatch):
+    """已有JSON中识别成功的页和日志中补上的页不再计入，失败页和缺失页计入"""
+    monkeypatch.chdir(tmp_path)
+    pdf_path = _write_pdf(str(tmp_path / "data" / "book.pdf"), 5)
+    json_dir = tmp_path / "data" / "book" / "json"
+    json_dir.mkdir(parents=True)
+    atomic_write_json(str(json_dir / "book_book_data.json"), [
+        {"page_index": 1, "text": "第一页"},
+        {"page_index": 2, "text": "第二页"},
+        {"page_index": 3, "text": None},
+    ])
+    PageJournal(str(json_dir / "book_book_data.journal.jsonl")).append({"page_index": 4, "text": "第四页"})
+
+    assert remaining_pages(pdf_path) == (5, 2)
+    assert remaining_pages(pdf_path, ENGINE_TESSERACT) == (5, 5)
+
+
+def test_remaining_pages_without_previous_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert remaining_pages(_write_pdf(str(tmp_path / "data" / "new.pdf"), 3)) == (3, 3)
+
+
+def test_jobs_are_ordered_by_priority_then_remaining_pages():
+    jobs = [BookJob("big.pdf"), BookJob("small.pdf"), BookJob("urgent.pdf", priority=1)]
+    for job, pending in zip(jobs, (900, 10, 500)):
+        job.pending = pending
+    assert [job.pdf_path for job in sorted(jobs, key=BookJob.sort_key)] == ["urgent.pdf", "small.pdf", "big.pdf"]
+
+
+def test_per_book_max_retries_reaches_shared_rate_limiter():
+    runner = BatchRunner("key", api_concurrency=6, converter_options={"max_retries": 2})
+    bucket, controller = object(), AIMDController(6)
+    options = runner._converter_options(BookJob("a.pdf", options={"max_retries": 7}), bucket, controller)
+    limiter = options["rate_limiter"]
+    assert limiter.retry_policy.max_retries == 7
+    assert limiter.bucket is bucket and limiter.controller is controller
+
+    default = runner._converter_options(BookJob("b.pdf"), bucket, controller)["rate_limiter"]
+    assert default.retry_policy.max_retries == 2
+
+
+def test_release_owner_returns_slots_and_wakes_waiters():
+    controller = AIMDController(2)
+    controller.acquire(owner=101)
+    controller.acquire(owner=101)
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (controller.acquire(owner=202), acquired.set()))
+    waiter.start()
+    assert not acquired.wait(0.1)
+
+    assert controller.release_owner(101) == 2
+    assert acquired.wait(2)
+    waiter.join()
+    assert controller.release_owner(101) == 0
+    controller.release(owner=202)
+
+
+def _broken_future():
+    future = Future()
+    future.set_exception(BrokenProcessPool("进程被杀掉"))
+    return future
+
+
+def test_dead_book_process_gives_back_its_api_slots():
+    runner = BatchRunner("key")
+    controller = AIMDController(4)
+    for _ in range(3):
+        controller.acquire(owner=4321)
+    controller.acquire(owner=1111)
+    job = BookJob("dead.pdf")
+
+    assert runner._finish_job(job, _broken_future(), controller, {"dead.pdf": 4321}) is True
+    assert job.status == "failed"
+    assert controller.release_owner(4321) == 0
+    assert controller.release_owner(1111) == 1
+
+
+def test_book_that_never_started_is_requeued():
+    runner = BatchRunner("key")
+    job = BookJob("waiting.pdf")
+    assert runner._finish_job(job, _broken_future(), AIMDController(4), {}) is False
+    assert job.status == "queued"
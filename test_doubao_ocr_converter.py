@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+批量识别结果拆分与并发识别测试
+"""
+
+import pymupdf as fitz
+
+from doubao_ocr_converter import DoubaoOCRConverter, _split_batch_result
+from mock_ocr_server import MockOCRServer
+from searchable_pdf import OUTPUT_SEARCHABLE
+from synthetic_pdf import TEXT_LATIN, generate_scanned_pdf
+
+
+def test_split_in_order():
+    result = "<<<PAGE 1>>>\n第一页\n第二行\n<<<PAGE 2>>>\n第二页"
+    assert _split_batch_result(result, 2) == {1: "第一页\n第二行", 2: "第二页"}
+
+
+def test_split_tolerates_whitespace_and_out_of_order_markers():
+    result = "  <<<PAGE  2>>>  \n第二页\n\n<<<PAGE 1>>>\n第一页\n"
+    assert _split_batch_result(result, 2) == {1: "第一页", 2: "第二页"}
+
+
+def test_missing_marker_leaves_page_out():
+    """缺少分隔标记的页不在结果中，由调用方单独重试"""
+    result = "<<<PAGE 1>>>\n第一页\n第三页没有标记"
+    assert _split_batch_result(result, 3) == {1: "第一页\n第三页没有标记"}
+
+
+def test_duplicate_out_of_range_and_empty_pages_are_dropped():
+    result = ("<<<PAGE 1>>>\n第一页\n<<<PAGE 1>>>\n重复的第一页\n"
+              "<<<PAGE 4>>>\n越界\n<<<PAGE 2>>>\n   \n<<<PAGE 3>>>\n第三页")
+    assert _split_batch_result(result, 3) == {1: "第一页", 3: "第三页"}
+
+
+def test_marker_must_be_on_its_own_line():
+    """正文中间出现的标记文字不作为分隔"""
+    result = "<<<PAGE 1>>>\n提到<<<PAGE 2>>>的正文\n<<<PAGE 2>>>\n第二页"
+    assert _split_batch_result(result, 2) == {1: "提到<<<PAGE 2>>>的正文", 2: "第二页"}
+
+
+def test_text_before_first_marker_is_ignored():
+    assert _split_batch_result("好的，结果如下：\n<<<PAGE 1>>>\n第一页", 1) == {1: "第一页"}
+
+
+def test_empty_result():
+    assert _split_batch_result(None, 2) == {}
+    assert _split_batch_result("", 2) == {}
+
+
+def test_concurrent_convert_persists_every_page_in_order(tmp_path, monkeypatch):
+    """多个请求同时进行时，各页结果仍按页码存储并写入输出PDF的对应页"""
+    monkeypatch.chdir(tmp_path)
+    pdf_path = str(tmp_path / "book.pdf")
+    generate_scanned_pdf(pdf_path, pages=8, page_size="A5", text_kind=TEXT_LATIN, chars_per_page=80, dpi=72, noise=0)
+    with MockOCRServer(latency=0.15, latency_jitter=0.1, per_image_latency=0, chars_per_page=40,
+                       text_kind=TEXT_LATIN) as server:
+        converter = DoubaoOCRConverter("key", pdf_path, endpoint=server.endpoint, use_sdk=False, use_cache=False,
+                                       max_workers=4, screen_pages=False, output_mode=OUTPUT_SEARCHABLE)
+        converter.convert()
+        stats = server.stats()
+
+    assert stats["ok"] == 8 and stats["peak_concurrency"] > 1
+    converter.load_book_json_data()
+    pages = list(converter.book_json_data)
+    assert [page_data["page_index"] for page_data in pages] == list(range(1, 9))
+    assert all(page_data["text"] and page_data["page_id"] == f"book_page_{page_data['page_index']}"
+               for page_data in pages)
+    assert converter.pending_pages() == []
+    converter.close()
+
+    with fitz.open(converter.output_pdf_path) as doc:
+        assert len(doc) == 8
+        for page, page_data in zip(doc, pages):
+            assert page_data["text"].split()[0] in page.get_text()
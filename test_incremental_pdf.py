@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+增量PDF写入器的重排缓冲、窗口与页数测试
+"""
+
+import pymupdf as fitz
+import pytest
+
+from incremental_pdf import IncrementalPDFWriter
+from searchable_pdf import OUTPUT_SEARCHABLE
+
+
+def _page_texts(path):
+    with fitz.open(path) as doc:
+        return [page.get_text().strip() for page in doc]
+
+
+def test_out_of_order_pages_are_written_in_page_order(tmp_path):
+    output_path = str(tmp_path / "out.pdf")
+    writer = IncrementalPDFWriter(output_path, flush_pages=100)
+    writer.add(3, "page 3")
+    writer.add(2, "page 2")
+    assert writer.write_ready() == 0
+    writer.add(1, "page 1")
+    assert writer.write_ready() == 3
+    writer.add(5, "page 5")
+    writer.add(4, "")
+    assert writer.close() == 5
+    assert _page_texts(output_path) == ["page 1", "page 2", "page 3", "", "page 5"]
+
+
+def test_partial_saves_leave_an_openable_file(tmp_path):
+    """每攒够flush_pages页保存一次，磁盘上的文件可以打开，页数等于已保存的页数"""
+    output_path = str(tmp_path / "out.pdf")
+    writer = IncrementalPDFWriter(output_path, flush_pages=2)
+    for page_index in range(1, 4):
+        writer.add(page_index, f"page {page_index}")
+        writer.write_ready()
+        if page_index == 2:
+            assert _page_texts(output_path) == ["page 1", "page 2"]
+    writer.add(4, "page 4")
+    writer.write_ready()
+    assert _page_texts(output_path) == [f"page {n}" for n in range(1, 5)]
+    assert writer.close() == 4
+    assert _page_texts(output_path) == [f"page {n}" for n in range(1, 5)]
+    assert not (tmp_path / "out.pdf.tmp").exists()
+
+
+def test_close_stops_at_first_missing_page(tmp_path):
+    output_path = str(tmp_path / "out.pdf")
+    writer = IncrementalPDFWriter(output_path)
+    writer.add(1, "page 1")
+    writer.add(3, "page 3")
+    assert writer.close() == 1
+    assert _page_texts(output_path) == ["page 1"]
+
+
+def test_window_limits_pages_in_flight(tmp_path):
+    writer = IncrementalPDFWriter(str(tmp_path / "out.pdf"), window=2)
+    assert writer.acquire_slot() and writer.acquire_slot()
+    assert writer.is_window_full()
+    assert writer.acquire_slot(should_stop=lambda: True) is False
+
+    # 第1页完成后，下一次取名额时先写出它，窗口随即空出一个名额
+    writer.add(1, "page 1")
+    assert writer.acquire_slot(should_stop=lambda: True) is True
+    assert writer.written == 1
+    writer.add(2, "page 2")
+    writer.add(3, "page 3")
+    assert writer.close() == 3
+
+
+def test_searchable_mode_keeps_source_pages(tmp_path):
+    source_path = str(tmp_path / "source.pdf")
+    source = fitz.open()
+    for n in range(3):
+        source.new_page(width=300 + n, height=400)
+    source.save(source_path)
+    source.close()
+
+    output_path = str(tmp_path / "out.pdf")
+    writer = IncrementalPDFWriter(output_path, OUTPUT_SEARCHABLE, input_pdf_path=source_path, flush_pages=1)
+    for page_index in (2, 1, 3):
+        writer.add(page_index, f"hidden {page_index}")
+    assert writer.close() == 3
+    with fitz.open(output_path) as doc:
+        assert [int(page.rect.width) for page in doc] == [300, 301, 302]
+        assert [page.get_text().strip() for page in doc] == ["hidden 1", "hidden 2", "hidden 3"]
+
+
+def test_searchable_mode_requires_source():
+    with pytest.raises(ValueError):
+        IncrementalPDFWriter("out.pdf", OUTPUT_SEARCHABLE)
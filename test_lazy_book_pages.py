@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+JSON数组流式扫描、旁路索引失效与变化页判断测试
+"""
+
+import json
+import os
+
+import pytest
+
+from book_pages import PAGE_DONE, PAGE_FAILED
+from lazy_book_pages import LazyBookPages, index_path, load_offset_index, scan_json_array
+from page_journal import atomic_write_json
+
+
+TRICKY_PAGES = [
+    {"page_index": 1, "text": "括号[{不应计入}]", "image_base64": "QUJD" * 50},
+    {"page_index": 2, "text": "转义的\"引号\"与反斜杠\\", "pdf_name": "书"},
+    {"page_index": 3, "text": "\\\\\"]}", "nested": {"a": [1, {"b": "}"}]}},
+    {"page_index": 4, "text": None},
+]
+
+
+def _write(path, pages):
+    atomic_write_json(str(path), pages)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 20])
+def test_scan_spans_parse_to_each_element(tmp_path, chunk_size):
+    """任意分块大小下（含反斜杠落在块末尾），每个区间恰好是一个完整的元素"""
+    path = _write(tmp_path / "book.json", TRICKY_PAGES)
+    data = open(path, 'rb').read()
+
+    spans = scan_json_array(path, chunk_size=chunk_size)
+
+    assert [json.loads(data[offset:offset + length]) for offset, length in spans] == TRICKY_PAGES
+
+
+def test_scan_empty_array(tmp_path):
+    assert scan_json_array(_write(tmp_path / "book.json", [])) == []
+
+
+@pytest.mark.parametrize("content", [
+    b'[{"page_index": 1}, {"page_index": 2',
+    '[{"page_index": 1, "text": "未结束的字符串}]'.encode('utf-8'),
+    b'{"page_index": 1}',
+    b'[{"page_index": 1}]]',
+])
+def test_scan_rejects_incomplete_or_invalid_json(tmp_path, content):
+    """写了一半的文件或顶层不是数组时报错，而不是返回错误的位置"""
+    path = tmp_path / "book.json"
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        scan_json_array(str(path))
+
+
+def test_offset_index_is_saved_and_reused(tmp_path):
+    """首次加载生成旁路索引，文件未变时直接使用索引，不再扫描"""
+    path = _write(tmp_path / "book.json", TRICKY_PAGES)
+    entries = load_offset_index(path)
+    assert os.path.exists(index_path(path))
+    assert [entry[0] for entry in entries] == [1, 2, 3, 4]
+    assert [entry[3] for entry in entries] == [PAGE_DONE, PAGE_DONE, PAGE_DONE, PAGE_FAILED]
+
+    # 把索引中的状态改掉，文件未变时应原样读回，说明没有重新扫描
+    with open(index_path(path), 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    index["pages"][0][3] = "marker"
+    with open(index_path(path), 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    assert load_offset_index(path)[0][3] == "marker"
+
+
+def test_offset_index_rebuilt_when_file_changes(tmp_path):
+    """JSON文件被改写（大小或修改时间变化）后旧索引失效，重新扫描"""
+    path = _write(tmp_path / "book.json", TRICKY_PAGES)
+    load_offset_index(path)
+
+    _write(tmp_path / "book.json", [{"page_index": 7, "text": "新内容"}])
+    pages = LazyBookPages(path)
+    assert pages.page_indexes() == [7]
+    assert pages.get(7)["text"] == "新内容"
+
+
+def test_corrupt_offset_index_is_rebuilt(tmp_path):
+    path = _write(tmp_path / "book.json", TRICKY_PAGES)
+    with open(index_path(path), 'w', encoding='utf-8') as f:
+        f.write("{不是JSON")
+    assert [entry[0] for entry in load_offset_index(path)] == [1, 2, 3, 4]
+
+
+def test_lazy_pages_read_on_demand_and_upsert_wins(tmp_path):
+    """按索引读取单页，upsert的页优先于文件中的同一页"""
+    path = _write(tmp_path / "book.json", TRICKY_PAGES)
+    pages = LazyBookPages(path)
+    assert pages.get(3) == TRICKY_PAGES[2]
+    assert pages.status(4) == PAGE_FAILED
+    assert pages.pending_pages(5) == [4, 5]
+
+    pages.upsert({"page_index": 4, "text": "补识别"})
+    assert pages.status(4) == PAGE_DONE
+    assert pages.get(4)["text"] == "补识别"
+    assert len(pages) == 4
+
+
+def test_judge_compares_with_stored_pages_without_reading_disk(tmp_path, monkeypatch):
+    """已存储的页不再从磁盘读回比较，只有内容变化的页追加到日志"""
+    from doubao_ocr_converter import DoubaoOCRConverter
+
+    monkeypatch.chdir(tmp_path)
+    json_dir = tmp_path / "data" / "book" / "json"
+    json_dir.mkdir(parents=True)
+    loaded = {"page_index": 1, "text": "第一页"}
+    _write(json_dir / "book_book_data.json", [loaded])
+    converter = DoubaoOCRConverter("key", str(tmp_path / "book.pdf"), use_sdk=False, use_cache=False,
+                                   use_page_store=False)
+    converter.load_book_json_data()
+    loaded = converter._is_loaded_this_page(1)
+    # 渲染阶段跳过已识别的页时同样记下
+    converter._stored_pages[1] = loaded
+    new_page = {"page_index": 2, "text": "第二页"}
+    converter._append_page_data(new_page)
+
+    def no_disk_read(page_index):
+        raise AssertionError(f"第{page_index}页不应从磁盘读取")
+
+    monkeypatch.setattr(converter.book_json_data, "_read", no_disk_read)
+    appended = []
+    monkeypatch.setattr(converter, "_append_page_data", appended.append)
+    changed = {"page_index": 2, "text": "改过的第二页"}
+    converter.save_book_json_data_with_judge([loaded, new_page])
+    converter.save_book_json_data_with_judge([loaded, changed])
+    assert appended == [changed]
+    converter.close()
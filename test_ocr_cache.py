@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+OCR结果缓存的容量统计与淘汰测试
+"""
+
+import itertools
+
+import pytest
+
+import ocr_cache
+from ocr_cache import OCRCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """每次取时间加1秒，使访问先后可区分"""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(ocr_cache.time, "time", lambda: float(next(ticks)))
+
+
+def _sizes(cache):
+    return cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+
+
+def test_key_depends_on_image_and_parameters():
+    key = OCRCache.make_key(b"image", "model", "prompt", 100)
+    assert key == OCRCache.make_key(memoryview(b"image"), "model", "prompt", 100)
+    assert key != OCRCache.make_key(b"image2", "model", "prompt", 100)
+    assert key != OCRCache.make_key(b"image", "model", "prompt", 200)
+
+
+def test_get_put_and_counters(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    assert cache.get("k") is None
+    cache.put("k", "识别结果")
+    cache.put("empty", "")
+    assert cache.get("k") == "识别结果"
+    assert cache.get("empty") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 1}
+    cache.close()
+
+
+def test_running_total_tracks_inserts_and_replacements(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    cache.put("a", "x" * 100)
+    cache.put("b", "中" * 10)
+    assert cache._total == 130 == _sizes(cache)
+    cache.put("a", "x" * 40)
+    assert cache._total == 70 == _sizes(cache)
+    cache.close()
+
+    reopened = OCRCache(str(tmp_path))
+    assert reopened._total == 70
+    reopened.close()
+
+
+def test_eviction_removes_least_recently_used_down_to_target(tmp_path, clock):
+    """超过上限时按最近访问时间从旧到新淘汰，直到不超过上限的90%"""
+    cache = OCRCache(str(tmp_path), max_bytes=1000)
+    for n in range(10):
+        cache.put(f"k{n}", "x" * 100)
+    assert cache._total == 1000
+    # 访问k0、k1后它们成为最近使用的条目
+    assert cache.get("k0") and cache.get("k1")
+
+    cache.put("k10", "x" * 100)
+
+    remaining = {row[0] for row in cache._conn.execute("SELECT key FROM ocr_cache")}
+    assert remaining == {"k0", "k1", "k4", "k5", "k6", "k7", "k8", "k9", "k10"}
+    assert cache._total == _sizes(cache) == 900
+    cache.close()
+
+
+def test_eviction_recounts_writes_from_other_processes(tmp_path, clock):
+    """各进程只维护自己写入的增量，淘汰时重新统计全表，其他进程写入的条目一并参与淘汰"""
+    first = OCRCache(str(tmp_path), max_bytes=500)
+    second = OCRCache(str(tmp_path), max_bytes=500)
+    for n in range(4):
+        second.put(f"other{n}", "y" * 100)
+    for n in range(6):
+        first.put(f"mine{n}", "x" * 100)
+
+    remaining = {row[0] for row in first._conn.execute("SELECT key FROM ocr_cache")}
+    assert remaining == {"mine2", "mine3", "mine4", "mine5"}
+    assert first._total == _sizes(first) == 400
+    first.close()
+    second.close()
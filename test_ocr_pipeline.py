@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+流式管线的顺序、结束标记与错误传播测试
+"""
+
+import random
+import threading
+import time
+
+import pytest
+
+from ocr_pipeline import PipelineStage, StreamingPipeline
+
+
+def _jitter(item):
+    time.sleep(random.uniform(0, 0.002))
+    return item
+
+
+def test_single_worker_stages_keep_source_order():
+    seen = []
+    StreamingPipeline(range(50), [
+        PipelineStage("double", lambda x: x * 2),
+        PipelineStage("collect", seen.append),
+    ]).run()
+    assert seen == [x * 2 for x in range(50)]
+
+
+def test_multiple_workers_deliver_every_item_exactly_once():
+    """多线程阶段不保证顺序，但每一项恰好到达下游一次，下游按页码排序即可恢复顺序"""
+    seen = []
+    lock = threading.Lock()
+    active = []
+    peak = [0]
+
+    def work(item):
+        with lock:
+            active.append(item)
+            peak[0] = max(peak[0], len(active))
+        _jitter(item)
+        with lock:
+            active.remove(item)
+        return item
+
+    def collect(item):
+        with lock:
+            seen.append(item)
+
+    StreamingPipeline(iter(range(200)), [
+        PipelineStage("work", work, workers=4, queue_size=2),
+        PipelineStage("square", lambda x: _jitter(x * x), workers=3),
+        PipelineStage("collect", collect),
+    ]).run()
+    assert sorted(seen) == [x * x for x in range(200)]
+    assert peak[0] > 1
+
+
+def test_none_results_are_dropped():
+    seen = []
+    StreamingPipeline(range(10), [
+        PipelineStage("odd", lambda x: x if x % 2 else None, workers=2),
+        PipelineStage("collect", seen.append),
+    ]).run()
+    assert sorted(seen) == [1, 3, 5, 7, 9]
+
+
+def test_flush_reaches_downstream_once_after_all_items():
+    """攒批阶段的最后一批在所有工作线程退出后交出一次，下游随后收到结束标记正常退出"""
+    batch = []
+    lock = threading.Lock()
+    seen = []
+    processed = []
+    flushes = []
+
+    def collect_batch(item):
+        with lock:
+            processed.append(item)
+            batch.append(item)
+            if len(batch) == 4:
+                full = list(batch)
+                batch.clear()
+                return full
+        return None
+
+    def flush():
+        flushes.append(len(processed))
+        return [list(batch)] if batch else []
+
+    StreamingPipeline(range(10), [
+        PipelineStage("batch", collect_batch, workers=3, flush=flush),
+        PipelineStage("collect", seen.append),
+    ]).run()
+    assert flushes == [10]
+    assert sorted(x for group in seen for x in group) == list(range(10))
+    assert sorted(len(group) for group in seen) == [2, 4, 4]
+
+
+def test_flush_of_last_stage_runs():
+    flushed = []
+    StreamingPipeline(range(3), [PipelineStage("last", lambda x: None, workers=2,
+                                               flush=lambda: flushed.append(True) or [])]).run()
+    assert flushed == [True]
+
+
+def test_stage_error_stops_pipeline_and_is_raised():
+    def fail(item):
+        if item == 5:
+            raise RuntimeError("第5项出错")
+        return item
+
+    def endless():
+        n = 0
+        while True:
+            yield n
+            n += 1
+
+    with pytest.raises(RuntimeError, match="第5项出错"):
+        StreamingPipeline(endless(), [
+            PipelineStage("fail", fail, workers=2),
+            PipelineStage("slow", lambda x: time.sleep(0.001), queue_size=1),
+        ]).run()
+
+
+def test_source_error_is_raised():
+    def broken_source():
+        yield 1
+        raise ValueError("源出错")
+
+    with pytest.raises(ValueError, match="源出错"):
+        StreamingPipeline(broken_source(), [PipelineStage("pass", lambda x: x)]).run()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+页日志的崩溃恢复与压缩测试
+"""
+
+import json
+
+from book_pages import PAGE_DONE, PAGE_FAILED
+from lazy_book_pages import LazyBookPages
+from page_journal import PageJournal, atomic_write_json
+
+
+def _page(page_index, text="正文", image_path=None):
+    return {
+        "page_index": page_index,
+        "image_path": image_path,
+        "text": text,
+        "pdf_name": "book",
+        "page_id": f"book_page_{page_index}",
+    }
+
+
+def test_read_ignores_torn_last_line(tmp_path):
+    """崩溃时写了一半的最后一行被忽略，之前的记录完整保留"""
+    journal_path = tmp_path / "book.journal.jsonl"
+    journal = PageJournal(str(journal_path))
+    journal.append(_page(1))
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"page_index": 2, "te')
+
+    assert PageJournal(str(journal_path)).read() == [_page(1)]
+
+
+def test_append_after_crash_does_not_glue_to_torn_line(tmp_path):
+    """重启后第一次追加先补换行，新记录不会与半行粘在一起而丢失"""
+    journal_path = tmp_path / "book.journal.jsonl"
+    PageJournal(str(journal_path)).append(_page(1))
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"page_index": 2, "te')
+
+    journal = PageJournal(str(journal_path))
+    journal.append(_page(3))
+    assert journal.read() == [_page(1), _page(3)]
+
+
+def test_later_record_of_same_page_wins_on_compact(tmp_path):
+    """同一页码以日志中最后一次写入为准，且优先于已有的book_data"""
+    book_data_path = tmp_path / "book_book_data.json"
+    atomic_write_json(str(book_data_path), [_page(1, "旧1"), _page(2, None), _page(4, "旧4")])
+    journal = PageJournal(str(tmp_path / "book.journal.jsonl"))
+    journal.append(_page(2, None))
+    journal.append(_page(2, "新2"))
+    journal.append(_page(3, "新3"))
+
+    existing = LazyBookPages(str(book_data_path))
+    journal.compact(existing, str(book_data_path))
+
+    with open(book_data_path, 'r', encoding='utf-8') as f:
+        pages = json.load(f)
+    assert [page["text"] for page in pages] == ["旧1", "新2", "新3", "旧4"]
+
+
+def test_compact_writes_both_files_and_clears_journal(tmp_path):
+    """压缩写出与整本重写相同的JSON和无图片版本，随后删除日志"""
+    book_data_path = tmp_path / "book_book_data.json"
+    no_img_path = tmp_path / "book_book_data_no_img.json"
+    journal_path = tmp_path / "book.journal.jsonl"
+    journal = PageJournal(str(journal_path))
+    pages = [_page(1, "第一页", "p1.png"), _page(2, None, "p2.png")]
+    for page in pages:
+        journal.append(page)
+
+    journal.compact([], str(book_data_path), str(no_img_path))
+
+    expected_path = tmp_path / "expected.json"
+    atomic_write_json(str(expected_path), pages)
+    assert book_data_path.read_bytes() == expected_path.read_bytes()
+    with open(no_img_path, 'r', encoding='utf-8') as f:
+        assert json.load(f) == [{k: v for k, v in page.items() if k != "image_path"} for page in pages]
+    assert not journal_path.exists()
+    assert journal.read() == []
+
+
+def test_compact_entries_locate_each_page(tmp_path):
+    """压缩返回的偏移可直接定位每一页，状态与页内容一致"""
+    book_data_path = tmp_path / "book_book_data.json"
+    journal = PageJournal(str(tmp_path / "book.journal.jsonl"))
+    journal.append(_page(1, "含有\"引号\"和[括号]的文字"))
+    journal.append(_page(2, ""))
+
+    entries = journal.compact([], str(book_data_path))
+
+    data = book_data_path.read_bytes()
+    for page_index, offset, length, status in entries:
+        page = json.loads(data[offset:offset + length])
+        assert page["page_index"] == page_index
+    assert [entry[3] for entry in entries] == [PAGE_DONE, PAGE_FAILED]
+
+
+def test_journal_survives_until_compaction_finishes(tmp_path):
+    """压缩中途出错时日志保持不变，下次运行重放结果相同"""
+    book_data_path = tmp_path / "book_book_data.json"
+    journal_path = tmp_path / "book.journal.jsonl"
+    journal = PageJournal(str(journal_path))
+    journal.append(_page(1))
+
+    def broken_pages():
+        yield _page(5)
+        raise OSError("磁盘已满")
+
+    try:
+        journal.compact(broken_pages(), str(book_data_path))
+    except OSError:
+        pass
+    else:
+        raise AssertionError("压缩应当抛出异常")
+
+    assert not book_data_path.exists()
+    assert not (tmp_path / "book_book_data.json.tmp").exists()
+    assert journal.read() == [_page(1)]
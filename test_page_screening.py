@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+空白页与重复页筛查测试
+"""
+
+import threading
+
+import numpy as np
+
+from page_screening import SCREEN_BLANK, SCREEN_DUPLICATE, SCREEN_NEW, PageScreener
+
+WIDTH, HEIGHT = 400, 560
+
+
+def _raw(gray):
+    gray = np.ascontiguousarray(gray, dtype=np.uint8)
+    return {"samples": gray.tobytes(), "width": gray.shape[1], "height": gray.shape[0],
+            "channels": 1, "stride": gray.shape[1], "alpha": 0}
+
+
+def _text_page(seed, lines=20, paper=235):
+    """用随机长度的深色短横模拟一页文字"""
+    rng = np.random.default_rng(seed)
+    page = np.full((HEIGHT, WIDTH), paper, dtype=np.uint8)
+    for line in range(lines):
+        top = 40 + line * 24
+        left = 40
+        while left < WIDTH - 60:
+            word = int(rng.integers(8, 40))
+            page[top:top + 10, left:left + word] = 30
+            left += word + int(rng.integers(6, 14))
+    return page
+
+
+def _rescanned(page, seed):
+    """同一页换一次渲染：整体亮度略有偏移，并带几个噪点"""
+    rng = np.random.default_rng(seed)
+    noisy = page.astype(np.int16) + int(rng.integers(-10, 11))
+    for y, x in zip(rng.integers(40, HEIGHT - 40, 5), rng.integers(40, WIDTH - 40, 5)):
+        noisy[y, x] = 20
+    return np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def test_blank_page_with_specks_is_blank():
+    page = np.full((HEIGHT, WIDTH), 240, dtype=np.uint8)
+    page[100, 100] = page[300, 200] = 0
+    # 四周的扫描黑边不算墨迹
+    page[:, :8] = 0
+    screener = PageScreener()
+    assert screener.screen(1, _raw(page)) == (SCREEN_BLANK, None)
+    assert screener.blank_count == 1
+
+
+def test_dark_cover_and_sparse_page_are_not_blank():
+    """深色封面和只有一行小字的页都要识别"""
+    screener = PageScreener()
+    assert screener.screen(1, _raw(np.full((HEIGHT, WIDTH), 60, dtype=np.uint8)))[0] == SCREEN_NEW
+    sparse = np.full((HEIGHT, WIDTH), 240, dtype=np.uint8)
+    sparse[280:286, 180:220:3] = 20
+    assert screener.screen(2, _raw(sparse))[0] == SCREEN_NEW
+    assert screener.blank_count == 0
+
+
+def test_rescanned_page_is_duplicate_of_first_occurrence():
+    page = _text_page(1)
+    screener = PageScreener()
+    assert screener.screen(3, _raw(page)) == (SCREEN_NEW, None)
+    assert screener.screen(9, _raw(_rescanned(page, 2))) == (SCREEN_DUPLICATE, 3)
+    assert screener.report() == {"blank_pages": 0, "duplicate_pages": 1, "saved_calls": 1}
+
+
+def test_different_text_pages_are_not_duplicates():
+    screener = PageScreener()
+    assert screener.screen(1, _raw(_text_page(1)))[0] == SCREEN_NEW
+    assert screener.screen(2, _raw(_text_page(2)))[0] == SCREEN_NEW
+
+    # 只差一行字的页也不是重复页
+    edited = _text_page(1)
+    edited[40 + 5 * 24:40 + 5 * 24 + 10, 40:WIDTH - 60] = 235
+    assert screener.screen(3, _raw(edited))[0] == SCREEN_NEW
+    assert screener.duplicate_count == 0
+
+
+def test_concurrent_screening_registers_one_original():
+    """多个线程同时筛查同一页，只有一页登记为新页，其余都指向它"""
+    page = _text_page(5)
+    screener = PageScreener()
+    results = {}
+    barrier = threading.Barrier(6)
+
+    def screen(page_index):
+        barrier.wait()
+        results[page_index] = screener.screen(page_index, _raw(_rescanned(page, page_index)))
+
+    threads = [threading.Thread(target=screen, args=(n,)) for n in range(1, 7)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    originals = [n for n, (status, _) in results.items() if status == SCREEN_NEW]
+    assert len(originals) == 1
+    assert all(result == (SCREEN_DUPLICATE, originals[0])
+               for n, result in results.items() if n != originals[0])
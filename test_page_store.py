@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+页存储的读写、导出与续跑测试
+"""
+
+import base64
+import json
+import os
+
+import pymupdf as fitz
+
+from batch_runner import remaining_pages
+from book_pages import PAGE_DONE, PAGE_FAILED, PAGE_MISSING
+from doubao_ocr_converter import DoubaoOCRConverter
+from page_journal import PageJournal, atomic_write_json
+from page_store import PageStore, StoredBookPages
+
+
+def _page(page_index, text=None, **extra):
+    page_data = {"page_index": page_index, "image_path": None,
+                 "text": f"第{page_index}页" if text is None else text,
+                 "pdf_name": "book", "page_id": f"book_page_{page_index}"}
+    page_data.update(extra)
+    return page_data
+
+
+def _write_pdf(path, pages):
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_put_get_and_image_round_trip(tmp_path):
+    store = PageStore(str(tmp_path / "book_pages.db"))
+    store.put(_page(2, duplicate_of=1), b"\xff\xd8jpeg", "image/jpeg")
+    store.put(_page(1))
+    # 不带图像重写一页时保留已存的图像
+    store.put(_page(2, text="改过的第二页"))
+
+    assert store.get(2) == _page(2, text="改过的第二页")
+    assert store.text(1) == "第1页"
+    assert store.image(2) == (b"\xff\xd8jpeg", "image/jpeg")
+    assert store.image(1) is None
+    assert store.get(3) is None
+    assert store.page_indexes() == [1, 2]
+    assert len(store) == 2 and 1 in store and 3 not in store
+    store.close()
+
+
+def test_iter_pages_in_order_across_query_batches(tmp_path):
+    store = PageStore(str(tmp_path / "book_pages.db"))
+    store.put_many([(_page(i), None, None) for i in range(600, 0, -1)])
+
+    assert [page_data["page_index"] for page_data in store.iter_pages()] == list(range(1, 601))
+    store.close()
+
+
+def test_export_json_matches_original_schema_and_imports_back(tmp_path):
+    store = PageStore(str(tmp_path / "book_pages.db"))
+    store.put(_page(1), b"png-bytes", "image/png")
+    store.put(_page(2))
+    book_data_path = str(tmp_path / "book_book_data.json")
+    no_img_path = str(tmp_path / "book_book_data_no_img.json")
+
+    assert store.export_json(book_data_path, no_img_path) == 2
+    with open(book_data_path, 'r', encoding='utf-8') as f:
+        exported = json.load(f)
+    assert list(exported[0]) == ["page_index", "image_path", "image_base64", "text", "pdf_name", "page_id"]
+    assert base64.b64decode(exported[0]["image_base64"]) == b"png-bytes"
+    assert exported[1] == _page(2)
+    with open(no_img_path, 'r', encoding='utf-8') as f:
+        assert json.load(f)[0] == {"page_index": 1, "text": "第1页", "pdf_name": "book", "page_id": "book_page_1"}
+
+    copy = PageStore(str(tmp_path / "copy_pages.db"))
+    assert copy.import_json(book_data_path) == 2
+    assert copy.get(1) == _page(1)
+    assert copy.image(1) == (b"png-bytes", "image/png")
+    store.close()
+    copy.close()
+
+
+def test_statuses_and_stored_book_pages(tmp_path):
+    store = PageStore(str(tmp_path / "book_pages.db"))
+    store.put_many([
+        (_page(1), None, None),
+        (_page(2, text=""), None, None),
+        (_page(3, text="", blank=True), None, None),
+        (_page(4, text="<UNK>"), None, None),
+    ])
+    assert store.statuses() == {1: PAGE_DONE, 2: PAGE_FAILED, 3: PAGE_DONE, 4: PAGE_FAILED}
+
+    pages = StoredBookPages(store)
+    pages.upsert(_page(2), b"img", "image/jpeg")
+    assert pages.status(2) == PAGE_DONE and pages.status(5) == PAGE_MISSING
+    assert store.get(2) == _page(2) and store.image(2) == (b"img", "image/jpeg")
+    assert pages.pending_pages(5) == [4, 5]
+    assert [page_data["page_index"] for page_data in pages] == [1, 2, 3, 4]
+    store.close()
+
+
+def test_converter_loads_from_page_store_and_exports_json(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pdf_path = _write_pdf(str(tmp_path / "book.pdf"), 3)
+    json_dir = tmp_path / "data" / "book" / "json"
+    json_dir.mkdir(parents=True)
+    # 未启用页存储时留下的JSON和日志在首次加载时并入页存储
+    atomic_write_json(str(json_dir / "book_book_data.json"), [_page(1), _page(2, text="")])
+    PageJournal(str(json_dir / "book_book_data.journal.jsonl")).append(_page(2))
+
+    converter = DoubaoOCRConverter("key", pdf_path, use_sdk=False, use_cache=False)
+    converter.load_book_json_data()
+    assert isinstance(converter.book_json_data, StoredBookPages)
+    assert converter.pending_pages() == [3]
+    assert not os.path.exists(json_dir / "book_book_data.journal.jsonl")
+
+    converter._append_page_data(_page(3), b"jpeg", "image/jpeg")
+    converter.compact_book_data()
+    converter.close()
+
+    with open(json_dir / "book_book_data.json", 'r', encoding='utf-8') as f:
+        assert json.load(f) == [_page(1), _page(2), _page(3)]
+    assert remaining_pages(pdf_path) == (3, 0)
+
+    # 续跑时从页存储读取，不依赖导出的JSON
+    os.remove(json_dir / "book_book_data.json")
+    resumed = DoubaoOCRConverter("key", pdf_path, use_sdk=False, use_cache=False)
+    resumed.load_book_json_data()
+    assert resumed.pending_pages() == []
+    assert resumed._find_page_data(3) == _page(3)
+    assert resumed.page_store.image(3) == (b"jpeg", "image/jpeg")
+    resumed.close()
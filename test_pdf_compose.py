@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+分片排版与缓存键测试
+"""
+
+import os
+from types import SimpleNamespace
+
+import pymupdf as fitz
+
+import pdf_compose
+from pdf_compose import compose_text_pdf, layout_key, shard_key
+from text_layout import TextLayout, draw_text_pdf, register_cjk_font
+
+
+def test_draw_text_pdf_keeps_trailing_empty_page(tmp_path):
+    """空白页（包括最后一页）也输出一页，返回的页数与文件一致"""
+    path = str(tmp_path / "out.pdf")
+    count = draw_text_pdf(path, ["a", "", "b", ""], TextLayout(register_cjk_font()))
+    with fitz.open(path) as doc:
+        assert count == len(doc) == 4
+
+
+def test_compose_matches_single_pass_and_reuses_shards(tmp_path):
+    texts = [f"page {i}" if i % 3 else "" for i in range(7)]
+    shard_dir = str(tmp_path / "shards")
+    output_path = str(tmp_path / "out.pdf")
+
+    count = compose_text_pdf(output_path, texts, shard_dir, shard_size=3, processes=1)
+    with fitz.open(output_path) as doc:
+        assert count == len(doc) == 7
+        assert [page.get_text().strip() for page in doc] == texts
+
+    layout_dir = os.path.join(shard_dir, layout_key({}))
+    before = {name: os.stat(os.path.join(layout_dir, name)).st_mtime_ns for name in os.listdir(layout_dir)}
+    compose_text_pdf(output_path, texts, shard_dir, shard_size=3, processes=1)
+    after = {name: os.stat(os.path.join(layout_dir, name)).st_mtime_ns for name in os.listdir(layout_dir)}
+    assert before == after
+
+
+def test_cache_keys_change_with_the_font_file(tmp_path, monkeypatch):
+    """字体名不变但字体文件换了，分片缓存键随之变化"""
+    font_path = tmp_path / "font.ttf"
+    font_path.write_bytes(b"old font")
+    font = SimpleNamespace(face=SimpleNamespace(filename=str(font_path)))
+    monkeypatch.setattr(pdf_compose.pdfmetrics, "getFont", lambda name: font)
+
+    old_keys = layout_key({}), shard_key(["正文"], {})
+    font_path.write_bytes(b"new font file")
+    assert layout_key({}) != old_keys[0]
+    assert shard_key(["正文"], {}) != old_keys[1]
+
+    other_path = tmp_path / "other.ttf"
+    other_path.write_bytes(font_path.read_bytes())
+    os.utime(other_path, ns=(font_path.stat().st_atime_ns, font_path.stat().st_mtime_ns))
+    new_key = layout_key({})
+    font.face.filename = str(other_path)
+    assert layout_key({}) != new_key
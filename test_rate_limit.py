@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+重试队列的持久化与压缩测试
+"""
+
+import json
+
+from rate_limit import OCRCallError, RetryQueue, error_from_status
+
+
+def test_pending_survives_restart(tmp_path):
+    queue_path = str(tmp_path / "retry_queue.jsonl")
+    queue = RetryQueue(queue_path)
+    queue.add(3, "ocr_failed")
+    queue.add(1, "exception: timeout")
+    queue.remove(3)
+
+    assert RetryQueue(queue_path).pending() == [1]
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    queue_path = tmp_path / "retry_queue.jsonl"
+    queue = RetryQueue(str(queue_path))
+    queue.add(2, "ocr_failed")
+    with open(queue_path, 'a', encoding='utf-8') as f:
+        f.write('{"page_index": 5, "rea')
+
+    assert queue.pending() == [2]
+
+
+def test_readded_page_is_pending_again(tmp_path):
+    queue = RetryQueue(str(tmp_path / "retry_queue.jsonl"))
+    queue.add(4, "ocr_failed")
+    queue.remove(4)
+    queue.add(4, "ocr_failed")
+    assert queue.pending() == [4]
+
+
+def test_compact_keeps_only_pending_entries(tmp_path):
+    queue_path = tmp_path / "retry_queue.jsonl"
+    queue = RetryQueue(str(queue_path))
+    for page_index in (5, 2, 9):
+        queue.add(page_index, "ocr_failed")
+    queue.remove(9)
+
+    queue.compact()
+
+    lines = [json.loads(line) for line in queue_path.read_text(encoding='utf-8').splitlines()]
+    assert [entry["page_index"] for entry in lines] == [2, 5]
+    assert not any(entry.get("done") for entry in lines)
+    assert queue.pending() == [2, 5]
+
+
+def test_compact_removes_empty_queue_file(tmp_path):
+    queue_path = tmp_path / "retry_queue.jsonl"
+    queue = RetryQueue(str(queue_path))
+    queue.add(1, "ocr_failed")
+    queue.remove(1)
+
+    queue.compact()
+
+    assert not queue_path.exists()
+    assert queue.pending() == []
+
+
+def test_status_classification():
+    """429/5xx是过载信号且可重试，408可重试但不降并发，其余4xx不重试"""
+    for status, retryable, congested in ((429, True, True), (503, True, True), (408, True, False),
+                                         (400, False, False)):
+        error = error_from_status(status, "message")
+        assert isinstance(error, OCRCallError)
+        assert (error.retryable, error.congested) == (retryable, congested)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+全文索引的写出、合并与重新索引测试
+"""
+
+import os
+
+from search_index import SearchIndex, tokenize, tokenize_query
+
+
+def _page(pdf_name, page_index, text):
+    return {"page_id": f"{pdf_name}_page_{page_index}", "pdf_name": pdf_name, "page_index": page_index, "text": text}
+
+
+def _page_ids(results):
+    return [result["page_id"] for result in results]
+
+
+def test_tokenize_cjk_and_latin():
+    assert tokenize("中文ABC") == ["中", "文", "中文", "abc"]
+    assert tokenize_query("人工智能") == (["人工", "工智", "智能"], ["人工智能"])
+
+
+def test_committed_pages_are_searchable_after_reopen(tmp_path):
+    index_dir = str(tmp_path / "index")
+    index = SearchIndex(index_dir)
+    index.add_pages([_page("a", 1, "机器学习的基本概念"), _page("b", 2, "深度学习与神经网络"), _page("b", 3, "   "),
+                     _page("c", 1, "练习基本功，学习")])
+    index.close()
+
+    index = SearchIndex(index_dir)
+    assert sorted(_page_ids(index.search("学习"))) == ["a_page_1", "b_page_2", "c_page_1"]
+    assert _page_ids(index.search("神经网络")) == ["b_page_2"]
+    assert _page_ids(index.search("学习", pdf_name="a")) == ["a_page_1"]
+    # 相邻两字都出现但片段不连续时不算命中
+    assert _page_ids(index.search("学习的基本")) == ["a_page_1"]
+    assert index.search("学习基本") == []
+    assert index.stats()["pages"] == 3
+    index.close()
+
+
+def test_reindexed_page_returns_only_new_text(tmp_path):
+    index = SearchIndex(str(tmp_path / "index"))
+    index.add_pages([_page("a", 1, "旧的识别结果")])
+    index.add_pages([_page("a", 1, "新的识别结果")])
+
+    assert _page_ids(index.search("新的")) == ["a_page_1"]
+    assert index.search("旧的") == []
+    assert index.search("识别")[0]["snippet"] == "新的识别结果"
+    index.close()
+
+
+def test_unchanged_page_is_not_indexed_again(tmp_path):
+    index = SearchIndex(str(tmp_path / "index"))
+    index.add_pages([_page("a", 1, "同样的内容")])
+    index.add_pages([_page("a", 1, "同样的内容")])
+    assert index.stats()["documents"] == 1
+    assert index.stats()["segments"] == 1
+    index.close()
+
+
+def test_merge_compacts_doc_table_and_removes_old_files(tmp_path):
+    """合并全部段后旧文档从文档表中清除，旧段和旧文档表文件被删除，查询结果不变"""
+    index_dir = tmp_path / "index"
+    index = SearchIndex(str(index_dir))
+    for version in range(2):
+        index.add_pages([_page("a", 1, f"第{version}版 公共内容"), _page("b", 2, f"另一本书 版本{version}")])
+    assert index.stats()["documents"] == 4
+
+    index.merge()
+
+    assert index.stats() == {"documents": 2, "pages": 2, "segments": 1, "pending": 0}
+    assert sorted(_page_ids(index.search("公共内容"))) == ["a_page_1"]
+    assert index.search("第0版") == []
+    assert index.search("公共")[0]["snippet"] == "第1版 公共内容"
+    files = sorted(os.listdir(index_dir))
+    assert [name for name in files if name.startswith("seg_")] == [
+        f"{index._manifest['segments'][0]}{suffix}" for suffix in (".docs.npy", ".offsets.npy", ".terms.txt", ".tfs.npy")]
+    assert [name for name in files if name.startswith("docs")] == [
+        f"{index._manifest['docs_name']}.bin", f"{index._manifest['docs_name']}.jsonl"]
+    index.close()
+
+    index = SearchIndex(str(index_dir))
+    assert _page_ids(index.search("另一本书")) == ["b_page_2"]
+    assert index.search("另一本书")[0]["snippet"] == "另一本书 版本1"
+    index.close()
+
+
+def test_auto_merge_when_most_documents_are_stale(tmp_path):
+    index = SearchIndex(str(tmp_path / "index"))
+    for text in ("初版", "第二版", "修订版"):
+        index.add_pages([_page("a", 1, text)])
+    assert index.stats()["documents"] == 1
+    assert index.stats()["segments"] == 1
+    assert _page_ids(index.search("修订")) == ["a_page_1"]
+    index.close()
+
+
+def test_files_from_an_interrupted_commit_are_discarded(tmp_path):
+    """manifest之后写出的半截文档和段在重新打开时丢弃"""
+    index_dir = tmp_path / "index"
+    index = SearchIndex(str(index_dir))
+    index.add_pages([_page("a", 1, "已提交的页")])
+    index.close()
+    with open(index_dir / "docs.bin", 'ab') as f:
+        f.write("半截".encode('utf-8'))
+    (index_dir / "seg_9.terms.txt").write_text("残留", encoding='utf-8')
+
+    index = SearchIndex(str(index_dir))
+    assert not (index_dir / "seg_9.terms.txt").exists()
+    assert index.search("已提交")[0]["snippet"] == "已提交的页"
+    index.add_pages([_page("a", 2, "之后的页")])
+    assert index.search("之后")[0]["snippet"] == "之后的页"
+    index.close()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+文字版PDF断行与分页测试
+"""
+
+from text_layout import TextLayout, register_cjk_font, wrap_line
+
+
+class FixedWidths:
+    """每个字符宽度为1，便于按字符数核对断行结果"""
+
+    def char_width(self, char):
+        return 1.0
+
+    def width(self, text):
+        return float(len(text))
+
+
+def test_short_line_is_unchanged():
+    assert wrap_line("hello world", 20, FixedWidths()) == ["hello world"]
+
+
+def test_latin_words_are_not_split():
+    assert wrap_line("aaa bbb ccc", 7, FixedWidths()) == ["aaa bbb", "ccc"]
+
+
+def test_cjk_breaks_between_any_two_characters():
+    assert wrap_line("一二三四五六七", 3, FixedWidths()) == ["一二三", "四五六", "七"]
+
+
+def test_overlong_word_is_split_by_character():
+    assert wrap_line("abcdefgh xy", 3, FixedWidths()) == ["abc", "def", "gh", "xy"]
+
+
+def test_no_line_start_punctuation_stays_with_previous_character():
+    """句号、逗号等不出现在行首，跟随前一个字换到下一行"""
+    lines = wrap_line("一二三。四", 3, FixedWidths())
+    assert lines == ["一二", "三。四"]
+    assert not any(line[0] in "，。" for line in lines)
+
+
+def test_leading_and_breaking_spaces_are_dropped():
+    assert wrap_line("   aa bb", 2, FixedWidths()) == ["aa", "bb"]
+
+
+def test_mixed_text_keeps_all_characters():
+    line = "中文English混排，数字12345与标点。"
+    lines = wrap_line(line, 5, FixedWidths())
+    assert all(FixedWidths().width(part) <= 5 for part in lines)
+    assert "".join(lines).replace(" ", "") == line.replace(" ", "")
+
+
+def test_paginate_continues_long_page_on_next_output_page():
+    layout = TextLayout(register_cjk_font(), line_height=200)
+    pages = layout.paginate("\n".join(f"第{i}行" for i in range(layout.lines_per_page + 2)))
+    assert [len(page) for page in pages] == [layout.lines_per_page, 2]
+
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+向量索引的写出、压缩与查询测试
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from vector_index import HashingEmbedder, VectorIndex, chunk_text
+
+
+def _page(pdf_name, page_index, text):
+    return {"page_id": f"{pdf_name}_page_{page_index}", "pdf_name": pdf_name, "page_index": page_index, "text": text}
+
+
+def _page_ids(results):
+    return [result["page_id"] for result in results]
+
+
+def test_chunks_cover_text_with_overlap():
+    text = "。".join(f"第{i}句话的内容" for i in range(60))
+    chunks = chunk_text(text, chunk_chars=100, overlap=10)
+    assert all(len(chunk) <= 100 for _, chunk in chunks)
+    assert chunks[0][0] == 0
+    assert chunks[-1][0] + len(chunks[-1][1]) == len(text)
+    for (start, chunk), (next_start, _) in zip(chunks, chunks[1:]):
+        assert start < next_start <= start + len(chunk)
+    assert chunk_text("  \n ") == []
+
+
+def test_embeddings_are_normalised_and_deterministic():
+    vectors = HashingEmbedder(dim=64).embed(["机器学习", "机器学习", ""])
+    assert vectors.shape == (3, 64)
+    assert np.allclose(np.linalg.norm(vectors[:2], axis=1), 1.0)
+    assert np.array_equal(vectors[0], HashingEmbedder(dim=64).embed(["机器学习"])[0])
+    assert not vectors[2].any()
+
+
+def test_search_after_reopen_and_pdf_filter(tmp_path):
+    index_dir = str(tmp_path / "index")
+    index = VectorIndex(index_dir)
+    index.add_pages([_page("a", 1, "机器学习的基本概念"), _page("a", 2, "古代诗词鉴赏"),
+                     _page("b", 1, "机器学习与深度学习")])
+    index.close()
+
+    index = VectorIndex(index_dir)
+    assert set(_page_ids(index.search("机器学习", k=2))) == {"a_page_1", "b_page_1"}
+    assert _page_ids(index.search("机器学习", pdf_name="b")) == ["b_page_1"]
+    assert index.search("机器学习", pdf_name="missing") == []
+    assert _page_ids(index.search("诗词", k=1)) == ["a_page_2"]
+    index.close()
+
+
+def test_reindexed_page_uses_new_text_and_compact_drops_old_rows(tmp_path):
+    index_dir = tmp_path / "index"
+    index = VectorIndex(str(index_dir))
+    index.add_pages([_page("a", 1, "古代诗词鉴赏"), _page("b", 1, "天文观测记录")])
+    index.add_pages([_page("a", 1, "机器学习入门")])
+    index.add_pages([_page("a", 1, "机器学习入门")])
+    assert index.stats()["rows"] == 3
+    assert index.search("诗词") == []
+    assert _page_ids(index.search("机器学习")) == ["a_page_1"]
+
+    assert index.compact() == 1
+    assert index.stats()["rows"] == index.stats()["live_rows"] == 2
+    assert os.path.getsize(index_dir / "vectors.f32") == 2 * index.embedder.dim * 4
+    assert _page_ids(index.search("机器学习", pdf_name="a")) == ["a_page_1"]
+    assert _page_ids(index.search("天文", pdf_name="b")) == ["b_page_1"]
+    index.close()
+
+    index = VectorIndex(str(index_dir))
+    assert _page_ids(index.search("天文观测")) == ["b_page_1"]
+    index.close()
+
+
+def test_rows_beyond_manifest_are_dropped_on_reopen(tmp_path):
+    """崩溃时manifest之后追加的半截行在重新打开时截掉"""
+    index_dir = tmp_path / "index"
+    index = VectorIndex(str(index_dir))
+    index.add_pages([_page("a", 1, "已提交的页")])
+    index.close()
+    with open(index_dir / "vectors.f32", 'ab') as f:
+        f.write(b"\0" * 10)
+    with open(index_dir / "chunks.jsonl", 'ab') as f:
+        f.write(b'{"page_id": "a_pa')
+
+    index = VectorIndex(str(index_dir))
+    assert index.stats()["rows"] == 1
+    index.add_pages([_page("a", 2, "之后写入的页")])
+    assert _page_ids(index.search("之后写入")) == ["a_page_2"]
+    index.close()
+
+
+def test_embedder_mismatch_is_rejected(tmp_path):
+    index_dir = str(tmp_path / "index")
+    VectorIndex(index_dir).add_pages([_page("a", 1, "内容")])
+    with pytest.raises(ValueError):
+        VectorIndex(index_dir, embedder=HashingEmbedder(dim=128))
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+文字版PDF的排版
+按字体和字号缓存每个字符的宽度，一次遍历完成中英文混排的断行；
+分页在断行之后按行数进行，段落中途超出页面时也能正确换页
+"""
+
+import os
+import re
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+# 依次尝试的中文字体
+CJK_FONT_PATHS = [
+    '/System/Library/Fonts/PingFang.ttc',  # macOS
+    '/System/Library/Fonts/STHeiti Medium.ttc',  # macOS
+    'C:/Windows/Fonts/simhei.ttf',  # Windows
+    'C:/Windows/Fonts/simsun.ttc',  # Windows
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',  # Linux
+    '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',  # Linux
+]
+CJK_FONT_NAME = 'CustomChinese'
+FALLBACK_FONT_NAME = 'Helvetica'
+
+# 断行单位：连续空白、一段不含空白的西文/数字、或单个中日韩字符（含全角标点）
+_CJK_RANGES = "\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef"
+_TOKEN = re.compile(rf"\s+|[^\s{_CJK_RANGES}]+|.", re.DOTALL)
+# 不能出现在行首的标点，断行时跟随前一个字符
+_NO_LINE_START = set("，。、；：？！）」』】》〉”’…,.;:?!)]}%")
+
+
+def register_cjk_font(font_paths=None, font_name=CJK_FONT_NAME):
+    """注册第一个可用的中文字体并返回字体名，都不可用时返回Helvetica"""
+    if font_name in pdfmetrics.getRegisteredFontNames():
+        return font_name
+
+    for font_path in font_paths or CJK_FONT_PATHS:
+        if os.path.exists(font_path):
+            try:
+                pdfmetrics.registerFont(TTFont(font_name, font_path))
+                return font_name
+            except Exception as e:
+                print(f"字体加载失败 {font_path}: {e}")
+                continue
+
+    print("警告：使用默认字体，中文字符可能显示为乱码")
+    return FALLBACK_FONT_NAME
+
+
+class GlyphWidthCache:
+    """某一字体、字号下每个字符的宽度，每个字符只测量一次"""
+
+    def __init__(self, font_name, font_size):
+        self.font_name = font_name
+        self.font_size = font_size
+        self._widths = {}
+
+    def char_width(self, char):
+        width = self._widths.get(char)
+        if width is None:
+            width = pdfmetrics.stringWidth(char, self.font_name, self.font_size)
+            self._widths[char] = width
+        return width
+
+    def width(self, text):
+        """文本宽度，等于各字符宽度之和（reportlab不做字偶距调整）"""
+        return sum(self.char_width(char) for char in text)
+
+
+def _tokens(line):
+    """把一行切成断行单位，行首禁则标点并入前一个单位"""
+    tokens = []
+    for token in _TOKEN.findall(line):
+        if tokens and token in _NO_LINE_START and not tokens[-1].isspace():
+            tokens[-1] += token
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def wrap_line(line, max_width, widths):
+    """
+    把一行文字按宽度断成多行，整行只遍历一次
+
+    西文单词整体换行，单词本身超过行宽时按字符拆分；中文在任意两个字之间都可以断行
+    Args:
+        line: 不含换行符的一行文字
+        max_width: 行宽上限
+        widths: GlyphWidthCache
+    Returns:
+        断行后的行列表
+    """
+    lines = []
+    current = []
+    current_width = 0.0
+    pending_space = 0.0
+
+    for token in _tokens(line):
+        if token.isspace():
+            # 行首空白丢弃，行内空白等到下一个单位放得下时才计入
+            if current:
+                pending_space = widths.char_width(" ")
+            continue
+
+        token_width = widths.width(token)
+        if current and current_width + pending_space + token_width <= max_width:
+            if pending_space:
+                current.append(" ")
+            current.append(token)
+            current_width += pending_space + token_width
+            pending_space = 0.0
+            continue
+
+        if current:
+            lines.append("".join(current))
+        current, current_width, pending_space = [], 0.0, 0.0
+
+        if token_width <= max_width:
+            current.append(token)
+            current_width = token_width
+            continue
+
+        # 超长单词按字符拆分
+        for char in token:
+            char_width = widths.char_width(char)
+            if current and current_width + char_width > max_width:
+                lines.append("".join(current))
+                current, current_width = [], 0.0
+            current.append(char)
+            current_width += char_width
+
+    if current:
+        lines.append("".join(current))
+    return lines
+
+
+def clean_text(text):
+    """统一转为字符串并去掉无法编码的字符；识别失败的页（None）视为空文本"""
+    if text is None:
+        return ""
+    if not isinstance(text, str):
+        text = str(text)
+    text = text.replace('\ufffd', '?')
+    return text.encode('utf-8', 'ignore').decode('utf-8')
+
+
+class TextLayout:
+    """一页识别文字在输出PDF中的排版参数与分页"""
+
+    def __init__(self, font_name, font_size=14, line_height=24, page_size=A4, margin=50):
+        """
+        Args:
+            font_name: 已注册的字体名
+            font_size: 字号
+            line_height: 行高
+            page_size: 页面尺寸
+            margin: 页边距
+        """
+        self.font_name = font_name
+        self.font_size = font_size
+        self.line_height = line_height
+        self.page_size = page_size
+        self.margin = margin
+        self.max_width = page_size[0] - 2 * margin
+        # 首行基线在 height - margin，最后一行基线不低于 margin
+        self.lines_per_page = max(1, int((page_size[1] - 2 * margin) // line_height) + 1)
+        self.widths = GlyphWidthCache(font_name, font_size)
+
+    def paginate(self, text):
+        """
+        把一页识别文字排成若干输出页
+
+        Returns:
+            输出页列表，每页是行列表；空字符串表示空行。至少返回一页
+        """
+        pages = []
+        page = []
+        for line in clean_text(text).split('\n'):
+            wrapped = wrap_line(line, self.max_width, self.widths) if line.strip() else [""]
+            for wrapped_line in wrapped:
+                if len(page) >= self.lines_per_page:
+                    pages.append(page)
+                    page = []
+                # 续页开头的空行没有意义
+                if not wrapped_line and not page and pages:
+                    continue
+                page.append(wrapped_line)
+        pages.append(page)
+        return pages
+
+    def draw_page(self, c, lines):
+        """在canvas当前页上绘制一页的行"""
+        # showPage之后canvas会重置字体，每页都要重新设置
+        c.setFont(self.font_name, self.font_size)
+        x = self.margin
+        y = self.page_size[1] - self.margin
+        for line in lines:
+            if line:
+                c.drawString(x, y, line)
+            y -= self.line_height
+
+
+def draw_text_pdf(output_path, texts, layout, title=None, author=None, subject=None):
+    """
+    把每页识别文字排版写入PDF，一页文字超出版面时自动续页
+
+    Args:
+        output_path: 输出PDF路径
+        texts: 每页的识别文字
+        layout: TextLayout
+        title / author / subject: PDF元数据
+    Returns:
+        输出的总页数
+    """
+    c = canvas.Canvas(output_path, pagesize=layout.page_size)
+    if title:
+        c.setTitle(title)
+    if author:
+        c.setAuthor(author)
+    if subject:
+        c.setSubject(subject)
+
+    page_count = 0
+    for text in texts:
+        for lines in layout.paginate(text):
+            layout.draw_page(c, lines)
+            # 每页画完立即结束，save()只补写有内容的最后一页，空白页会被丢掉
+            c.showPage()
+            page_count += 1
+
+    c.save()
+    return page_count
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@auther guxiang
+@date 2026-10-16
+书籍向量索引
+把每页识别文字切成文本块，用本地的哈希n-gram向量化器批量计算向量（不依赖网络和模型文件），
+向量以float32矩阵追加写入并内存映射读取，另存每行对应的page_id；查询按余弦相似度取前k页
+"""
+
+import hashlib
+import json
+import math
+import os
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from page_index import BufferedPageIndex, add_library, truncate_file
+from page_journal import atomic_write_json
+from search_index import tokenize
+
+DEFAULT_VECTOR_INDEX_DIR = "data/.vector_index"
+# 查询时每次参与矩阵乘法的行数，限制临时内存
+SEARCH_BLOCK_ROWS = 65536
+
+
+def chunk_text(text, chunk_chars=500, overlap=50):
+    """
+    把一页文字切成有重叠的文本块，尽量在换行或句末标点处断开
+
+    Returns:
+        [(起始位置, 文本块)]，空白文本返回空列表
+    """
+    text = text or ""
+    if not text.strip():
+        return []
+    if len(text) <= chunk_chars:
+        return [(0, text)]
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_chars)
+        if end < len(text):
+            # 在后半段里找最后一个自然断点
+            cut = max(text.rfind(mark, start + chunk_chars // 2, end) for mark in "\n。！？.!?")
+            if cut >= 0:
+                end = cut + 1
+        chunk = text[start:end]
+        if chunk.strip():
+            chunks.append((start, chunk))
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class HashingEmbedder:
+    """
+    哈希n-gram向量化器
+
+    词项与search_index相同（中文单字和相邻两字、西文单词），每个词项哈希到固定维度的一个桶并带正负号，
+    词频取1+log(tf)，结果按L2归一化，点积即余弦相似度。无需训练，同一文本在任何机器上结果相同
+
+    自定义向量化器只需提供 name、dim 属性和 embed(texts) 方法，
+    embed返回形状为(len(texts), dim)、已L2归一化的float32数组
+    """
+
+    def __init__(self, dim=512, max_cache_terms=1_000_000):
+        """
+        Args:
+            dim: 向量维度
+            max_cache_terms: 词项哈希结果缓存的上限
+        """
+        self.dim = int(dim)
+        self.name = f"hashing-ngram-v1-{self.dim}"
+        self.max_cache_terms = max_cache_terms
+        self._buckets = {}
+
+    def _bucket(self, term):
+        """词项 -> 带符号的桶号（1..dim 或 -1..-dim）"""
+        bucket = self._buckets.get(term)
+        if bucket is None:
+            h = zlib.crc32(term.encode('utf-8'))
+            bucket = (h % self.dim) + 1
+            if h & 0x80000000:
+                bucket = -bucket
+            if len(self._buckets) >= self.max_cache_terms:
+                self._buckets.clear()
+            self._buckets[term] = bucket
+        return bucket
+
+    def embed(self, texts):
+        """批量计算向量，整批文本的词项一次性散列累加到矩阵中"""
+        rows = []
+        buckets = []
+        weights = []
+        for row, text in enumerate(texts):
+            for term, tf in Counter(tokenize(text)).items():
+                rows.append(row)
+                buckets.append(self._bucket(term))
+                weights.append(1.0 + math.log(tf))
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if rows:
+            buckets = np.asarray(buckets, dtype=np.int64)
+            values = np.asarray(weights, dtype=np.float32) * np.sign(buckets).astype(np.float32)
+            np.add.at(matrix, (np.asarray(rows, dtype=np.int64), np.abs(buckets) - 1), values)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class VectorIndex(BufferedPageIndex):
+    """
+    整个书库共用的向量索引
+
+    文件布局（index_dir下）：
+        manifest.json   向量化器名称、维度、行数、chunks.jsonl长度，原子替换
+        vectors.f32     float32矩阵，每行一个文本块，按行追加
+        chunks.jsonl    每行对应一个文本块：page_id、pdf_name、page_index、块在页内的位置、页文本哈希
+    同一page_id再次加入时以最新写入的块为准，旧行在查询时被过滤，compact时清除
+    """
+
+    # 缓冲的页数达到该值时自动写出，同时也是一次批量计算向量的规模
+    auto_commit_pages = 128
+
+    def __init__(self, index_dir=DEFAULT_VECTOR_INDEX_DIR, embedder=None, chunk_chars=500, overlap=50):
+        """
+        Args:
+            index_dir: 索引目录
+            embedder: 向量化器，默认HashingEmbedder
+            chunk_chars: 文本块的字符数上限
+            overlap: 相邻文本块重叠的字符数
+        """
+        self.index_dir = index_dir
+        self.embedder = embedder or HashingEmbedder()
+        self.chunk_chars = chunk_chars
+        self.overlap = overlap
+        os.makedirs(index_dir, exist_ok=True)
+        super().__init__()
+        self._matrix = None
+        self._load()
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.index_dir, "manifest.json")
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.index_dir, "vectors.f32")
+
+    @property
+    def _chunks_path(self):
+        return os.path.join(self.index_dir, "chunks.jsonl")
+
+    def _load(self):
+        """读取manifest，丢弃上次崩溃时写了一半的行"""
+        manifest = {"embedder": self.embedder.name, "dim": self.embedder.dim, "rows": 0, "chunks_size": 0}
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        if manifest["embedder"] != self.embedder.name or manifest["dim"] != self.embedder.dim:
+            raise ValueError(f"索引由{manifest['embedder']}（{manifest['dim']}维）生成，"
+                             f"与当前向量化器{self.embedder.name}（{self.embedder.dim}维）不一致")
+        self._manifest = manifest
+
+        self._chunks = []
+        if os.path.exists(self._chunks_path):
+            with open(self._chunks_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if len(self._chunks) >= manifest["rows"]:
+                        break
+                    self._chunks.append(json.loads(line))
+        truncate_file(self._chunks_path, manifest["chunks_size"])
+        truncate_file(self._vectors_path, manifest["rows"] * manifest["dim"] * 4)
+        self._pdf_id = {}
+        self._pdf_ids = np.zeros(0, dtype=np.int32)
+        self._append_pdf_ids(self._chunks)
+        self._refresh_live()
+        self._close_matrix()
+
+    def _refresh_live(self):
+        """每个page_id只有最后一次写入的那一组块有效"""
+        self._page_rows = {}
+        for row, chunk in enumerate(self._chunks):
+            page_rows = self._page_rows.get(chunk["page_id"])
+            if page_rows is not None and page_rows[1] == row and page_rows[2] == chunk["text_hash"]:
+                self._page_rows[chunk["page_id"]] = (page_rows[0], row + 1, chunk["text_hash"])
+            else:
+                self._page_rows[chunk["page_id"]] = (row, row + 1, chunk["text_hash"])
+        self._live = np.zeros(len(self._chunks), dtype=bool)
+        for start, end, _ in self._page_rows.values():
+            self._live[start:end] = True
+
+    def _append_pdf_ids(self, chunks):
+        """与矩阵各行对应的书编号数组，按书过滤时做向量化比较"""
+        ids = [self._pdf_id.setdefault(chunk["pdf_name"], len(self._pdf_id)) for chunk in chunks]
+        self._pdf_ids = np.concatenate([self._pdf_ids, np.asarray(ids, dtype=np.int32)])
+
+    def _close_matrix(self):
+        self._matrix = None
+
+    def _vectors(self):
+        """内存映射的向量矩阵"""
+        if self._matrix is None and self._manifest["rows"]:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode='r',
+                                     shape=(self._manifest["rows"], self._manifest["dim"]))
+        return self._matrix
+
+    def commit(self):
+        """把缓冲的页切块、批量计算向量并追加写出，返回写入的块数"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending = list(self._pending.values())
+            self._pending = {}
+
+            chunks = []
+            texts = []
+            for page in pending:
+                text_hash = _text_hash(page["text"])
+                page_rows = self._page_rows.get(page["page_id"])
+                # 内容未变的页不重复计算
+                if page_rows is not None and page_rows[2] == text_hash:
+                    continue
+                for start, chunk in chunk_text(page["text"], self.chunk_chars, self.overlap):
+                    chunks.append({
+                        "page_id": page["page_id"],
+                        "pdf_name": page["pdf_name"],
+                        "page_index": page["page_index"],
+                        "start": start,
+                        "length": len(chunk),
+                        "text_hash": text_hash,
+                    })
+                    texts.append(chunk)
+            if not chunks:
+                return 0
+
+            vectors = np.ascontiguousarray(self.embedder.embed(texts), dtype=np.float32)
+            chunks_size = self._manifest["chunks_size"]
+            with open(self._vectors_path, 'ab') as vector_file, \
+                    open(self._chunks_path, 'ab') as chunk_file:
+                vector_file.write(vectors.tobytes())
+                for chunk in chunks:
+                    line = (json.dumps(chunk, ensure_ascii=False) + "\n").encode('utf-8')
+                    chunk_file.write(line)
+                    chunks_size += len(line)
+                for f in (vector_file, chunk_file):
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            self._chunks.extend(chunks)
+            self._append_pdf_ids(chunks)
+            self._manifest = {**self._manifest, "rows": len(self._chunks), "chunks_size": chunks_size}
+            atomic_write_json(self._manifest_path, self._manifest)
+            self._refresh_live()
+            # 矩阵已变长，下次查询时重新映射
+            self._close_matrix()
+            return len(chunks)
+
+    def compact(self):
+        """重写向量文件，去掉已被更新的页留下的旧行，返回清除的行数"""
+        with self._lock:
+            self.commit()
+            removed = int(len(self._chunks) - self._live.sum())
+            if removed == 0:
+                return 0
+            keep = np.flatnonzero(self._live)
+            matrix = self._vectors()
+            vectors_tmp = f"{self._vectors_path}.tmp"
+            chunks_tmp = f"{self._chunks_path}.tmp"
+            chunks = [self._chunks[row] for row in keep]
+            chunks_size = 0
+            with open(vectors_tmp, 'wb') as vector_file, open(chunks_tmp, 'wb') as chunk_file:
+                for start in range(0, len(keep), SEARCH_BLOCK_ROWS):
+                    vector_file.write(np.ascontiguousarray(matrix[keep[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+                for chunk in chunks:
+                    line = (json.dumps(chunk, ensure_ascii=False) + "\n").encode('utf-8')
+                    chunk_file.write(line)
+                    chunks_size += len(line)
+                for f in (vector_file, chunk_file):
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._close_matrix()
+            del matrix
+            # 先让manifest指向一个空索引，替换文件过程中崩溃时只会丢掉索引而不会错位
+            atomic_write_json(self._manifest_path, {**self._manifest, "rows": 0, "chunks_size": 0})
+            os.replace(vectors_tmp, self._vectors_path)
+            os.replace(chunks_tmp, self._chunks_path)
+            self._chunks = chunks
+            self._pdf_ids = self._pdf_ids[keep]
+            self._manifest = {**self._manifest, "rows": len(chunks), "chunks_size": chunks_size}
+            atomic_write_json(self._manifest_path, self._manifest)
+            self._refresh_live()
+            return removed
+
+    def search(self, query, k=10, pdf_name=None):
+        """
+        按余弦相似度查询最相近的页
+
+        Args:
+            query: 查询文本
+            k: 返回的页数上限
+            pdf_name: 只在这本书中查询
+        Returns:
+            [{"page_id", "pdf_name", "page_index", "score", "start", "length"}]，按相似度从高到低；
+            一页有多个块命中时只保留得分最高的块
+        """
+        with self._lock:
+            matrix = self._vectors()
+            if matrix is None or k <= 0:
+                return []
+            mask = self._live
+            if pdf_name is not None:
+                if pdf_name not in self._pdf_id:
+                    return []
+                mask = mask & (self._pdf_ids == self._pdf_id[pdf_name])
+            query_vector = self.embedder.embed([query])[0]
+            if not query_vector.any():
+                return []
+
+            rows = len(self._chunks)
+            scores = np.empty(rows, dtype=np.float32)
+            for start in range(0, rows, SEARCH_BLOCK_ROWS):
+                end = min(rows, start + SEARCH_BLOCK_ROWS)
+                np.dot(matrix[start:end], query_vector, out=scores[start:end])
+            scores[~mask] = -np.inf
+
+            # 候选多取一些，同一页的多个块合并后仍能凑够k页
+            candidates = min(rows, k * 4)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            results = []
+            seen = set()
+            for row in top:
+                if not np.isfinite(scores[row]) or scores[row] <= 0:
+                    break
+                chunk = self._chunks[row]
+                if chunk["page_id"] in seen:
+                    continue
+                seen.add(chunk["page_id"])
+                results.append({
+                    "page_id": chunk["page_id"],
+                    "pdf_name": chunk["pdf_name"],
+                    "page_index": chunk["page_index"],
+                    "score": float(scores[row]),
+                    "start": chunk["start"],
+                    "length": chunk["length"],
+                })
+                if len(results) >= k:
+                    break
+            return results
+
+    def stats(self):
+        """返回行数、有效页数和文件大小"""
+        with self._lock:
+            return {
+                "rows": len(self._chunks),
+                "live_rows": int(self._live.sum()),
+                "pages": len(self._page_rows),
+                "pending": len(self._pending),
+                "bytes": self._manifest["rows"] * self._manifest["dim"] * 4,
+            }
+
+    def close(self):
+        """写出缓冲的页并释放内存映射"""
+        with self._lock:
+            self.commit()
+            self._close_matrix()
+
+
+def embed_library(root="data", index_dir=DEFAULT_VECTOR_INDEX_DIR, embedder=None):
+    """把root下所有书的 _book_data_no_img.json 加入向量索引，未变化的页会被跳过"""
+    index = add_library(VectorIndex(index_dir, embedder), root)
+    print(f"向量索引：{index.stats()}")
+    return index